@@ -0,0 +1,212 @@
+# Calories burnt in MET-rated activities, computed on the server.
+#
+# ACTIVITIES is the aerobic calculator's table (Compendium of Physical
+# Activities MET values). Each activity is stored on the day's `activity`
+# document as
+#   {code, name, met, minutes, duration (seconds), workout_type, exercises, calories}
+# and the day's calories_burnt is the sum of its entries. The calories are
+# always computed here from the user's weight, never taken from the client.
+#
+# recompute() refreshes stored entries for many users at once, e.g. after a
+# weight change: every MET entry goes into flat arrays and the calories and
+# per-day totals are array operations over them.
+
+import numpy as np
+from pymongo import UpdateOne
+
+ACTIVITIES = [
+    ('aerobic_dance_casual', 'Aerobic Dance Casual', 5.0),
+    ('aerobic_dance_moderate', 'Aerobic Dance Moderate', 6.5),
+    ('aerobic_dance_intense', 'Aerobic Dance Intense', 7.0),
+    ('basketball_game', 'Basketball (Game)', 8.0),
+    ('basketball_non_game_general', 'Basketball (Non-Game, General)', 6.0),
+    ('basketball_shooting_baskets', 'Basketball (Shooting Baskets)', 4.5),
+    ('calisthenics_intense', 'Calisthenics (Intense)', 8.0),
+    ('calisthenics_moderate', 'Calisthenics (Moderate)', 3.5),
+    ('cycling_5_5mph', 'Cycling (5.5 mph)', 4.0),
+    ('cycling_12_13mph', 'Cycling (12-13 mph)', 8.0),
+    ('cycling_16_19mph_racing', 'Cycling (16-19 mph, Racing)', 12.0),
+    ('dancing_casual', 'Dancing (Casual)', 3.0),
+    ('dancing_fast', 'Dancing (Fast)', 5.5),
+    ('football_competitive', 'Football (Competitive)', 9.0),
+    ('football_flag_touch_general', 'Football (Flag, Touch, General)', 8.0),
+    ('football_playing_catch', 'Football (Playing Catch)', 2.5),
+    ('frisbie_general', 'Frisbie (General)', 3.0),
+    ('frisbie_ultimate', 'Frisbie (Ultimate)', 8.0),
+    ('golf_carry_clubs', 'Golf (Carry Clubs)', 4.5),
+    ('golf_with_cart', 'Golf (with Cart)', 3.5),
+    ('gymnastics', 'Gymnastics', 4.0),
+    ('hiking_cross_country', 'Hiking (Cross Country)', 6.0),
+    ('housework', 'Housework', 3.0),
+    ('jump_rope_fast', 'Jump Rope (Fast)', 12.0),
+    ('jump_rope_slow', 'Jump Rope (Slow)', 8.0),
+    ('kayaking', 'Kayaking', 5.0),
+    ('kickball', 'Kickball', 7.0),
+    ('lying_quietly', 'Lying Quietly', 1.0),
+    ('martial_arts', 'Martial Arts', 10.0),
+    ('motocross', 'Motocross', 4.0),
+    ('racquetball_casual', 'Racquetball (Casual)', 7.0),
+    ('racquetball_competitive', 'Racquetball (Competitive)', 10.0),
+    ('rock_mountain_climbing', 'Rock/Mountain Climbing', 8.0),
+    ('rollerblading_skating_casual', 'Rollerblading/skating (Casual)', 11.0),
+    ('rollerblading_skating_fast', 'Rollerblading/skating (Fast)', 12.0),
+    ('rowing_machine_extreme', 'Rowing Machine (Extreme)', 10.5),
+    ('rowing_machine_moderate', 'Rowing Machine (Moderate)', 7.0),
+    ('running_jogging_general', 'Running (Jogging/General)', 7.0),
+    ('running_5mph_12min_mile', 'Running (5 mph, 12min mile)', 8.0),
+    ('running_6mph_10min_mile', 'Running (6 mph, 10min mile)', 10.0),
+    ('running_7mph_8_5min_mile', 'Running (7 mph, 8.5min mile)', 11.5),
+    ('running_8mph_7_5min_mile', 'Running (8 mph, 7.5min mile)', 13.5),
+    ('running_10mph_6min_mile', 'Running (10 mph, 6min mile)', 16.0),
+    ('running_cross_country', 'Running (Cross Country)', 9.0),
+    ('snow_skiing_downhill_general', 'Snow Skiing (Downhill - General)', 5.0),
+    ('snow_skiing_downhill_moderate', 'Snow Skiing (Downhill - Moderate)', 6.0),
+    ('snow_skiing_downhill_extreme', 'Snow Skiing (Downhill - Extreme)', 8.0),
+    ('snow_skiing_cross_country_general', 'Snow Skiing (Cross Country - General)', 7.0),
+    ('snow_skiing_cross_country_moderate', 'Snow Skiing (Cross Country - Moderate)', 8.0),
+    ('snow_skiing_cross_country_brisk', 'Snow Skiing (Cross Country - Brisk)', 9.0),
+    ('snow_shoeing', 'Snow Shoeing', 8.0),
+    ('sitting_office_work', 'Sitting (Office work)', 1.5),
+    ('sitting_quietly', 'Sitting (Quietly)', 1.0),
+    ('skateboarding', 'Skateboarding', 5.0),
+    ('soccer_competitive', 'Soccer (Competitive)', 10.0),
+    ('soccer_casual_general', 'Soccer (Casual, General)', 7.0),
+    ('softball', 'Softball', 5.0),
+    ('squash', 'Squash', 12.0),
+    ('stair_ladder_climbing', 'Stair/Ladder Climbing', 8.0),
+    ('standing_office_work', 'Standing (Office work)', 2.3),
+    ('standing_quietly', 'Standing (Quietly)', 1.0),
+    ('stretching_hatha_yoga', 'Stretching/Hatha Yoga', 2.5),
+    ('swimming_casual', 'Swimming (Casual)', 7.0),
+    ('swimming_vigorous', 'Swimming (Vigorous)', 10.0),
+    ('table_tennis_ping_pong', 'Table Tennis/Ping Pong', 4.0),
+    ('tai_chi', 'Tai Chi', 4.0),
+    ('tennis_doubles', 'Tennis (Doubles)', 6.0),
+    ('tennis_singles', 'Tennis (Singles)', 8.0),
+    ('volleyball_casual_indoor_grass', 'Volleyball (Casual Indoor/Grass)', 3.0),
+    ('volleyball_beach', 'Volleyball (Beach)', 8.0),
+    ('volleyball_competitive', 'Volleyball (Competitive)', 8.0),
+    ('walking_2mph_casual_pace', 'Walking (2 mph, Casual Pace)', 2.0),
+    ('walking_3mph_moderate_pace', 'Walking (3 mph, Moderate Pace)', 3.3),
+    ('walking_3_5mph_brisk_pace', 'Walking (3.5 mph, Brisk Pace)', 3.8),
+    ('walking_4mph_very_brisk_pace', 'Walking (4 mph, Very Brisk Pace)', 5.0),
+    ('walking_5_0_fast_pace', 'Walking (5.0, Fast Pace)', 9.0),
+    ('water_polo', 'Water Polo', 10.0),
+    ('weight_training_intense', 'Weight Training (Intense)', 6.0),
+    ('weight_training_normal', 'Weight Training (Normal)', 3.0),
+    ('yardwork_heavy', 'Yardwork (Heavy)', 5.5),
+    ('yardwork_regular', 'Yardwork (Regular)', 4.0),
+]
+
+CODES = [code for code, _, _ in ACTIVITIES]
+NAMES = [name for _, name, _ in ACTIVITIES]
+MET = np.array([met for _, _, met in ACTIVITIES], dtype=np.float32)
+INDEX = {code: i for i, code in enumerate(CODES)}
+
+DEFAULT_WEIGHT = 60       # kg, when the profile has none
+MAX_MINUTES = 600
+
+
+def kcal_per_minute(met, weight):
+    # Standard MET formula: kcal/min = MET * 3.5 * kg / 200 (works on arrays too)
+    return met * 3.5 * weight / 200
+
+
+def weight_of(user):
+    try:
+        weight = float((user or {}).get('weight') or 0)
+    except (TypeError, ValueError):
+        weight = 0
+    return weight if 20 <= weight <= 400 else DEFAULT_WEIGHT
+
+
+def entry(code, minutes, weight):
+    # One activity entry for `minutes` of `code`; raises ValueError on bad input
+    if code not in INDEX:
+        raise ValueError(f"unknown activity {code}")
+    try:
+        minutes = float(minutes)
+    except (TypeError, ValueError):
+        raise ValueError("minutes must be a number")
+    if not 1 <= minutes <= MAX_MINUTES:
+        raise ValueError(f"minutes must be between 1 and {MAX_MINUTES}")
+    i = INDEX[code]
+    return {
+        'code': code,
+        'name': NAMES[i],
+        'met': float(MET[i]),
+        'minutes': minutes,
+        'duration': int(minutes * 60),
+        'workout_type': 'aerobic',
+        'exercises': [{'name': NAMES[i]}],
+        'calories': round(float(kcal_per_minute(MET[i], weight) * minutes), 1),
+    }
+
+
+def priced(activities, weight):
+    # Price a posted activity list; returns (entries, total). Every entry needs
+    # a known MET code and minutes: calories sent by the client are ignored,
+    # and anything that cannot be priced here is rejected with ValueError.
+    if not isinstance(activities, list):
+        raise ValueError("activities must be a list")
+    entries = []
+    for item in activities:
+        if not isinstance(item, dict) or item.get('code') not in INDEX:
+            raise ValueError("each activity needs a known code and minutes")
+        entries.append(entry(item['code'], item.get('minutes'), weight))
+    return entries, round(sum(e['calories'] for e in entries), 1)
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def recompute(collection, weights, batch_size=1000):
+    # Re-price every stored MET entry of the given users at their current
+    # weight ({user_id: kg}); returns the number of day documents rewritten.
+    # Each write is guarded by the document's updated_at, so a day changed
+    # while this runs is left to that newer write.
+    docs = list(collection.find(
+        {'user_id': {'$in': list(weights)}, 'activities.code': {'$exists': True}},
+        {'user_id': 1, 'activities': 1, 'updated_at': 1}
+    ))
+    if not docs:
+        return 0
+    doc_idx, slot, met_idx, minutes, weight = [], [], [], [], []
+    fixed = np.zeros(len(docs))          # entries saved before pricing moved here
+    for d, doc in enumerate(docs):
+        for j, item in enumerate(doc.get('activities') or []):
+            if isinstance(item, dict) and item.get('code') in INDEX:
+                doc_idx.append(d)
+                slot.append(j)
+                met_idx.append(INDEX[item['code']])
+                minutes.append(_number(item.get('minutes')))
+                weight.append(weights[doc['user_id']])
+            elif isinstance(item, dict):
+                fixed[d] += _number(item.get('calories'))
+
+    doc_idx = np.array(doc_idx, dtype=np.int64)
+    calories = np.round(kcal_per_minute(MET[np.array(met_idx, dtype=np.int64)],
+                                        np.array(weight, dtype=np.float32))
+                        * np.array(minutes, dtype=np.float32), 1)
+    totals = np.round(fixed + np.bincount(doc_idx, weights=calories, minlength=len(docs)), 1)
+
+    updates = [{} for _ in docs]
+    for d, j, kcal in zip(doc_idx.tolist(), slot, calories.tolist()):
+        updates[d][f'activities.{j}.calories'] = kcal
+    ops = []
+    written = 0
+    for d, doc in enumerate(docs):
+        ops.append(UpdateOne(
+            {'_id': doc['_id'], 'updated_at': doc.get('updated_at')},
+            {'$set': {**updates[d], 'calories_burnt': float(totals[d])}}
+        ))
+        if len(ops) >= batch_size:
+            written += collection.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        written += collection.bulk_write(ops, ordered=False).modified_count
+    return written
@@ -0,0 +1,61 @@
+# Allergen index over food_nutrition_diet.
+#
+# Every ingredient (and every entry of an optional `allergens` field) maps to a
+# bitset of food rows, stored as a Python int. The foods to avoid for a user are
+# the OR of the bitsets for their allergies; the safe foods are its complement.
+# Results are cached per allergy-set signature, so the diet planner, the daily
+# diet view and food suggestions share one build of the index.
+
+import numpy as np
+
+
+def allergy_key(allergies):
+    return frozenset(str(a).strip().lower() for a in allergies or [] if a and str(a).strip())
+
+
+class AllergenIndex:
+    def __init__(self, foods, cache_size=1024):
+        self.ids = [food['_id'] for food in foods]
+        self.rows = {fid: i for i, fid in enumerate(self.ids)}
+        self.all_bits = (1 << len(self.ids)) - 1
+        self.bits = {}
+        for i, food in enumerate(foods):
+            for field in ('ingredients', 'allergens'):
+                values = food.get(field)
+                if not isinstance(values, list):
+                    continue
+                for value in values:
+                    key = str(value).strip().lower()
+                    self.bits[key] = self.bits.get(key, 0) | (1 << i)
+        self.cache_size = cache_size
+        self._unsafe = {}
+
+    def unsafe_bits(self, allergies):
+        key = allergy_key(allergies)
+        bits = self._unsafe.get(key)
+        if bits is None:
+            bits = 0
+            for allergy in key:
+                bits |= self.bits.get(allergy, 0)
+            if len(self._unsafe) >= self.cache_size:
+                self._unsafe.clear()
+            self._unsafe[key] = bits
+        return bits
+
+    def safe_bits(self, allergies):
+        return self.all_bits & ~self.unsafe_bits(allergies)
+
+    def safe_mask(self, allergies):
+        # Boolean NumPy mask in row order (row i is self.ids[i])
+        n = len(self.ids)
+        raw = self.safe_bits(allergies).to_bytes((n + 7) // 8, 'little')
+        return np.unpackbits(np.frombuffer(raw, dtype=np.uint8), bitorder='little')[:n].astype(bool)
+
+    def safe_ids(self, allergies):
+        bits = self.safe_bits(allergies)
+        return [fid for i, fid in enumerate(self.ids) if bits >> i & 1]
+
+    def is_safe(self, food_id, allergies):
+        # Foods outside the index are treated as safe, like the old $not/$elemMatch query
+        row = self.rows.get(food_id)
+        return row is None or not (self.unsafe_bits(allergies) >> row & 1)
@@ -1,26 +1,50 @@
 import os
 import io
 import json
+import hmac
+import base64
 import random
 import requests
+import click
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 from functools import wraps
 
 from flask import (
     Flask, render_template, request, jsonify, session,
-    redirect, url_for, send_file
+    redirect, url_for, send_file, send_from_directory, Response, stream_with_context
 )
 from flask_cors import CORS
 from flask_pymongo import PyMongo
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import DuplicateKeyError
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_dance.contrib.google import make_google_blueprint, google
 
-from reportlab.lib.pagesizes import letter, landscape, A4
-from reportlab.pdfgen import canvas
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
+from food_catalog import FoodCatalog
+from food_search import FoodSearchIndex
+from meal_plan import MealPlanner
+from allergen_index import AllergenIndex
+import pdf_render
+from report_jobs import ReportJobs
+from user_snapshot import user_week_snapshot
+import http_client
+from response_cache import ResponseCache, MongoStore, DiskStore
+from exercise_catalog import ExerciseCatalog, FACETS, BODYWEIGHT_EQUIPMENT
+from exercise_snapshot import load_catalog, build as build_snapshot
+import image_pipeline
+import cycle_analytics
+from cycle_store import CycleStore
+from diet_log import DietLog
+import diet_rollup
+import activity_engine
+from workout_store import WorkoutStore
+from journal_store import JournalStore, month_range, parse_day
+import db_indexes
+from user_repo import UserRepository, projection as user_projection
+
 
 # --- ENVIRONMENT SETUP ---
 load_dotenv()
@@ -41,6 +65,119 @@ food_collection = mongo.db.food_nutrition
 food_collection_diet = mongo.db.food_nutrition_diet
 exercises_collection = mongo.db.exercises
 
+
+# Indexes are declared in db_indexes and built at deploy time with
+# `flask ensure-indexes`. `flask verify-indexes` reports any that are missing;
+# gunicorn runs the same check once at startup when VERIFY_INDEXES=1 (see
+# gunicorn.conf.py), so importing the app never touches the database.
+@app.cli.command('verify-indexes')
+def verify_indexes():
+    try:
+        missing = db_indexes.verify_indexes(mongo.db)
+    except Exception as e:
+        print("Index verification failed:", e)
+        return
+    for collection, index in missing:
+        print(f"Missing index {collection}.{index}; run `flask ensure-indexes`")
+    print(f"Indexes checked on {len(db_indexes.INDEXES)} collections, {len(missing)} missing.")
+
+
+@app.cli.command('ensure-indexes')
+def ensure_indexes():
+    failures = db_indexes.ensure_indexes(mongo.db)
+    for collection, index, error in failures:
+        print(f"Could not create {collection}.{index}: {error}")
+    print(f"Indexes ensured on {len(db_indexes.INDEXES)} collections, {len(failures)} failed.")
+
+
+@app.cli.command('check-query-plans')
+def check_query_plans():
+    # explain() every known query shape; exit status 1 if any is a collection scan
+    offenders = db_indexes.check_query_plans(mongo.db)
+    for where, collection, query in offenders:
+        print(f"COLLSCAN: {where} -> {collection}.find({query})")
+    print(f"Checked {len(db_indexes.QUERY_SHAPES)} query shapes, {len(offenders)} collection scans.")
+    if offenders:
+        raise SystemExit(1)
+
+# Cycle history lives in its own indexed collection (see cycle_store); page
+# handlers read the user document without the legacy `cycles` array
+cycle_store = CycleStore(mongo.db.cycles)
+journal_store = JournalStore(mongo.db.journal)
+# Saved workouts, plus one summary document per user updated on every save
+workout_store = WorkoutStore(mongo.db.workouts, mongo.db.workout_summaries)
+
+# User documents are read through named views, memoised per request; set
+# USER_CACHE_TTL (seconds) to also cache them briefly across requests
+user_repo = UserRepository(users_collection, ttl=float(os.getenv('USER_CACHE_TTL', 0)))
+
+# Exercise descriptors shipped in static/exercises, served from a compiled
+# snapshot that all workers mmap (rebuilt automatically when the JSON changes)
+EXERCISES_DIR = os.path.join(app.root_path, 'static', 'exercises')
+EXERCISE_SNAPSHOT = os.getenv('EXERCISE_SNAPSHOT', os.path.join(app.root_path, 'exercises.snapshot'))
+try:
+    exercise_catalog = load_catalog(EXERCISES_DIR, EXERCISE_SNAPSHOT)
+except OSError as e:
+    print("Exercise snapshot unavailable, parsing JSON instead:", e)
+    exercise_catalog = ExerciseCatalog.load(EXERCISES_DIR)
+
+
+@app.cli.command('build-exercise-snapshot')
+def build_exercise_snapshot():
+    build_snapshot(EXERCISES_DIR, EXERCISE_SNAPSHOT)
+    print(f"Wrote {EXERCISE_SNAPSHOT}")
+
+# Resized exercise images (thumb/medium, JPEG + WebP) in a content-addressed
+# directory; file names change whenever the source does, so they cache forever
+EXERCISE_IMAGE_CACHE = os.getenv('IMAGE_CACHE_DIR', os.path.join(app.root_path, 'image_cache'))
+exercise_images = image_pipeline.ImageDerivatives(EXERCISE_IMAGE_CACHE)
+
+
+@app.cli.command('build-exercise-images')
+def build_exercise_images():
+    rebuilt, total = image_pipeline.build(EXERCISES_DIR, EXERCISE_IMAGE_CACHE)
+    print(f"Rebuilt {rebuilt} of {total} exercise images in {EXERCISE_IMAGE_CACHE}")
+
+
+@app.route('/media/exercises/<path:filename>')
+def exercise_image(filename):
+    response = send_from_directory(EXERCISE_IMAGE_CACHE, filename, max_age=365 * 24 * 3600)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+
+def exercise_image_json(rel):
+    # Thumbnail URL and size for a source image, falling back to the original
+    # until `flask build-exercise-images` has been run
+    thumb = exercise_images.lookup(rel, 'thumb')
+    if thumb is None:
+        return {"img": f"/static/exercises/{rel}", "width": None, "height": None}
+    medium = exercise_images.lookup(rel, 'medium')
+    data = {
+        "img": f"/media/exercises/{thumb['file']}",
+        "width": thumb['width'],
+        "height": thumb['height'],
+        "mediumImg": f"/media/exercises/{medium['file']}",
+        "fullImg": f"/static/exercises/{rel}",
+    }
+    if 'webp' in thumb:
+        data["imgWebp"] = f"/media/exercises/{thumb['webp']}"
+        data["mediumImgWebp"] = f"/media/exercises/{medium['webp']}"
+    return data
+
+# In-memory food catalogs (loaded lazily per gunicorn worker)
+food_catalog = FoodCatalog(
+    food_collection, mongo.db.catalog_meta,
+    max_items=int(os.getenv('FOOD_CACHE_MAX_ITEMS', 5000)),
+    ttl=int(os.getenv('FOOD_CACHE_TTL', 3600))
+)
+food_catalog_diet = FoodCatalog(
+    food_collection_diet, mongo.db.catalog_meta,
+    max_items=int(os.getenv('FOOD_CACHE_MAX_ITEMS', 5000)),
+    ttl=int(os.getenv('FOOD_CACHE_TTL', 3600))
+)
+
 # --- GOOGLE OAUTH ---
 google_bp = make_google_blueprint(
     client_id=os.getenv("GOOGLE_CLIENT_ID", ""),
@@ -72,12 +209,85 @@ def login_required(f):
     return decorated_function
 
 
+# Operational endpoints take the ADMIN_TOKEN in an X-Admin-Token header; with no
+# token configured they are disabled
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+
+def admin_token_required(f):
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        token = request.headers.get('X-Admin-Token', '')
+        if not ADMIN_TOKEN or not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+            return jsonify({'success': False, 'message': 'Forbidden'}), 403
+        return f(*args, **kwargs)
+    return decorated_function
+
+
 # --- HELPERS ---
 def get_user_allergies(user_id):
-    user = users_collection.find_one({'_id': ObjectId(user_id)})
+    user = user_repo.get(user_id, 'allergies')
     return user.get('allergies', []) if user else []
 
 
+def food_search_index():
+    return food_catalog.derived('search', FoodSearchIndex)
+
+
+def allergen_index():
+    return food_catalog_diet.derived('allergens', AllergenIndex)
+
+
+def meal_planner():
+    return food_catalog_diet.derived('planner', lambda foods: MealPlanner(foods, allergen_index()))
+
+
+UNKNOWN_FOOD = {'food_name': 'Unknown Food', 'energy_kcal': 0, 'protein_g': 0, 'carb_g': 0, 'fat_g': 0}
+
+
+def collect_food_ids(days):
+    # Every food ObjectId referenced by the meals of the given weekly_diet days
+    ids = set()
+    for day in days:
+        for meal_ids in day.get('meals', {}).values():
+            for fid in meal_ids:
+                ids.add(fid if isinstance(fid, ObjectId) else ObjectId(str(fid)))
+    return ids
+
+
+def resolve_foods(food_ids):
+    # Served from the food catalogs; at most one $in query per collection on a miss.
+    # Returns {ObjectId: food}, with food_name filled in from 'name' when needed
+    # and the "Unknown Food" placeholder for ids found in neither collection.
+    ids = {fid if isinstance(fid, ObjectId) else ObjectId(str(fid)) for fid in food_ids}
+    found = {}
+    if ids:
+        found = food_catalog_diet.get_many(ids)
+        missing = ids - found.keys()
+        if missing:
+            found.update(food_catalog.get_many(missing))
+
+    foods = {}
+    for fid in ids:
+        food = found.get(fid)
+        if food is None:
+            foods[fid] = dict(UNKNOWN_FOOD)
+            continue
+        if not food.get('food_name'):
+            food['food_name'] = food.get('name') or str(fid)
+        food['_id'] = str(food['_id'])
+        foods[fid] = food
+    return foods
+
+
+def resolve_day_meals(day, foods):
+    # {meal: [food, ...]} for one weekly_diet day using an already resolved food map
+    meals = {}
+    for meal, ids in day['meals'].items():
+        meals[meal] = [foods[fid if isinstance(fid, ObjectId) else ObjectId(str(fid))] for fid in ids]
+    return meals
+
+
 # --- ROUTES ---
 
 @app.route('/')
@@ -139,7 +349,7 @@ def logout():
 @app.route('/dashboard')
 @login_required
 def dashboard():
-    user = users_collection.find_one({'_id': ObjectId(session['user_id'])})
+    user = user_repo.get(session['user_id'], 'dashboard')
     today = str(datetime.utcnow().date())
     name = user.get('full_name', 'User')
     hour = datetime.now().hour
@@ -165,117 +375,145 @@ def logout():
     session.clear()
     return redirect(url_for('login'))
 
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.pdfgen import canvas
-import os
-
-import os
-
-from flask import send_file, session
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfbase import pdfmetrics
-from reportlab.lib.pagesizes import letter, landscape
-from reportlab.pdfgen import canvas
-import io, os
-
 @app.route('/download_weekly_diet')
 def download_weekly_diet():
     user_id = session.get('user_id')
     week_doc = weekly_diet_collection.find_one({'user_id': str(user_id)})
     if not week_doc:
         return "No weekly diet found", 404
+    if pdf_render.FONT_ERROR:
+        return pdf_render.FONT_ERROR, 500
 
-    font_path = os.path.abspath(os.path.join('static', 'fonts', 'NotoSans-Regular.ttf'))
-    if not os.path.exists(font_path):
-        return "Font not found. Place NotoSans-Regular.ttf in static/fonts.", 500
-    pdfmetrics.registerFont(TTFont('NotoSans', font_path))
-
-    def get_food_name(obj_id):
-        food = food_collection_diet.find_one({"_id": obj_id}) or food_collection.find_one({"_id": obj_id})
-        return food.get('food_name', '') or food.get('name', '') or str(obj_id)
-
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=landscape(letter))
-    width, height = landscape(letter)
-    margin = 50
-
-    logo_path = os.path.join('static', 'images', 'hormocare_logo.png')
-
-    meal_types = ['breakfast', 'lunch', 'snacks', 'dinner']
-    for page_num, meal_type in enumerate(meal_types):
-        if page_num > 0:
-            p.showPage()
-            if os.path.exists(font_path):  # re-apply font on new page
-                pdfmetrics.registerFont(TTFont('NotoSans', font_path))
-        # Branding/logo on each page
-        if os.path.exists(logo_path):
-            p.drawImage(logo_path, margin/4, height/2 - 60, width=80, height=80, mask='auto')
-        p.setFont('NotoSans', 26)
-        p.drawString(margin/3, height - margin/2, "Hormocare+")
-
-        # Page title: Weekly {Meal} Plan
-        p.setFont('NotoSans', 20)
-        p.drawCentredString(width / 2, height - margin, f"Weekly {meal_type.capitalize()} Plan")
-
-        # Table headers
-        p.setFont('NotoSans', 12)
-        x_start = margin + 100
-        y = height - margin * 1.7
-        p.drawString(x_start, y, "Date")
-        p.drawString(x_start + 250, y, meal_type.capitalize())
-
-        # Table rows
-        p.setFont('NotoSans', 10)
-        y -= 28
-        for day in week_doc['days']:
-            foods = []
-            for m in day['meals'].get(meal_type, []):
-                f_obj = m if isinstance(m, ObjectId) else ObjectId(str(m))
-                foods.append(get_food_name(f_obj))
-            line = ', '.join(foods)
-            p.drawString(x_start, y, day['date'])
-            p.drawString(x_start + 250, y, line if line else "-")
-            y -= 22
-
-    p.save()
-    buffer.seek(0)
-    return send_file(
-        buffer,
+    rows = pdf_render.weekly_diet_rows(week_doc, resolve_foods(collect_food_ids(week_doc['days'])))
+    etag = pdf_render.content_etag(rows)
+    if etag in request.if_none_match:
+        return '', 304, {'ETag': f'"{etag}"'}
+
+    pdf_bytes = pdf_render.weekly_diet_pdf(user_id, rows, etag)
+    response = send_file(
+        io.BytesIO(pdf_bytes),
         as_attachment=True,
         download_name="weekly_diet.pdf",
-        mimetype='application/pdf'
+        mimetype='application/pdf',
+        etag=etag
     )
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
 @app.route('/get_weight')
+@login_required
 def get_weight():
-    # API endpoint to return user weight as JSON (optional for AJAX fetching)
-    user = users_collection.find_one()
-    user_weight = user['weight'] if user and 'weight' in user else 60
-    return jsonify({'weight': user_weight})
+    # API endpoint to return the signed-in user's weight as JSON
+    user = user_repo.get(session['user_id'], 'weight')
+    return jsonify({'weight': activity_engine.weight_of(user)})
+
+# Paged HIIT listing: ?limit=&cursor=&fields=&shuffle=<seed>. The body stays a
+# plain JSON array; the next page's cursor comes back in X-Next-Cursor / Link.
+HIIT_PAGE_SIZE = 20
+HIIT_MAX_PAGE_SIZE = 100
+IMAGE_FIELDS = ['img', 'width', 'height', 'mediumImg', 'fullImg', 'imgWebp', 'mediumImgWebp']
+HIIT_FIELDS = ['id', 'name'] + IMAGE_FIELDS + ['targetMuscles', 'instructions', 'level', 'category']
+DEFAULT_HIIT_FIELDS = ['name'] + IMAGE_FIELDS + ['targetMuscles', 'instructions']
+
+
+def hiit_fields(arg):
+    if not arg:
+        return DEFAULT_HIIT_FIELDS
+    fields = [f.strip() for f in arg.split(',') if f.strip()]
+    unknown = [f for f in fields if f not in HIIT_FIELDS]
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def encode_cursor(seed, position):
+    raw = f"{'' if seed is None else seed}:{position}".encode('ascii')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('ascii')
+        seed, position = raw.split(':')
+        return (int(seed) if seed else None), max(int(position), 0)
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid cursor")
+
+
+HIIT_SOURCE_FIELDS = {
+    'id': 'id', 'name': 'name', 'targetMuscles': 'primaryMuscles',
+    'instructions': 'instructions', 'level': 'level', 'category': 'category',
+}
+
+
+def hiit_item(row, fields):
+    # Decode only the descriptor fields the requested output needs
+    source = {HIIT_SOURCE_FIELDS[f] for f in fields if f in HIIT_SOURCE_FIELDS}
+    wants_image = any(f in IMAGE_FIELDS for f in fields)
+    if wants_image:
+        source.add('images')
+    ex = exercise_catalog.project(row, source)
+
+    item = {}
+    if wants_image:
+        image = {"img": '', "width": None, "height": None}
+        if ex['images']:
+            image.update(exercise_image_json(ex['images'][0]))
+    for field in fields:
+        if field in IMAGE_FIELDS:
+            if field in image:
+                item[field] = image[field]
+        elif field == 'targetMuscles':
+            item[field] = ", ".join(ex['primaryMuscles'])
+        elif field == 'instructions':
+            item[field] = " ".join(ex['instructions'])
+        else:
+            item[field] = ex[HIIT_SOURCE_FIELDS[field]]
+    return item
+
+
+def stream_json_array(items):
+    # Writes a JSON array one element at a time instead of building it in memory
+    yield '['
+    for i, item in enumerate(items):
+        yield (',' if i else '') + json.dumps(item, separators=(',', ':'))
+    yield ']'
+
 
 @app.route('/get_images')
 def get_images():
     ex_type = request.args.get('type')
 
-    # ----- HIIT mode using local MongoDB first -----
+    # ----- HIIT mode from the local exercise catalog -----
     if ex_type == 'hiit':
-        # MongoDB query: matches no equipment/body only
-        query = {
-            '$or': [
-                {'equipment': {'$regex': 'body only|no equipment|no equipments', '$options': 'i'}},
-                {'instructions': {'$elemMatch': {'$regex': 'null|body|no equipment|no equipments', '$options': 'i'}}}
-            ]
-        }
-        exercises = []
-        for ex in collection.find(query):
-            exercises.append({
-                "name": ex.get('name', ''),
-                "img": f"/static/exercises/{ex['images'][0]}" if ex.get('images') else '',
-                "targetMuscles": ", ".join(ex.get('primaryMuscles', [])),
-                "instructions": " ".join(ex.get('instructions', []))
-            })
-        return jsonify(exercises)
+        try:
+            fields = hiit_fields(request.args.get('fields'))
+            limit = min(max(int(request.args.get('limit', HIIT_PAGE_SIZE)), 1), HIIT_MAX_PAGE_SIZE)
+            seed, position = decode_cursor(request.args['cursor']) if request.args.get('cursor') \
+                else (request.args.get('shuffle', type=int), 0)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
+
+        # Body-weight exercises: "body only" or no equipment listed. With a
+        # shuffle seed the order is a fixed permutation, so pages never overlap.
+        rows = exercise_catalog.query({'equipment': BODYWEIGHT_EQUIPMENT}, limit=None)
+        if seed is not None:
+            random.Random(seed).shuffle(rows)
+        page = rows[position:position + limit]
+
+        response = Response(
+            stream_with_context(stream_json_array(hiit_item(row, fields) for row in page)),
+            mimetype='application/json'
+        )
+        response.headers['X-Total-Count'] = str(len(rows))
+        if position + limit < len(rows):
+            cursor = encode_cursor(seed, position + limit)
+            response.headers['X-Next-Cursor'] = cursor
+            next_url = url_for('get_images', type='hiit', cursor=cursor, limit=limit,
+                               fields=request.args.get('fields'))
+            response.headers['Link'] = f'<{next_url}>; rel="next"'
+        return response
 
     # ----- Aerobic fallback -----
     elif ex_type == 'aerobic':
@@ -288,15 +526,11 @@ def get_images():
 
     # ----- Yoga fallback -----
     elif ex_type == 'yoga':
-        url = "https://yoga-api-nzy4.onrender.com/v1/poses?level=beginner"
-        data = requests.get(url).json()
-        result = []
-        for pose in data.get('poses', []):
-            result.append({
-                "name": pose.get('english_name', ''),
-                "description": pose.get('pose_description', ''),
-                "img": pose.get('url_png')
-            })
+        try:
+            result = yoga_cache.get({'level': 'beginner'}, lambda: fetch_yoga_poses('beginner'))
+        except Exception as e:
+            print("Error fetching yoga poses:", e)
+            result = []
         return jsonify(result)
 
     else:
@@ -321,40 +555,86 @@ def google_access_fitness():
 @login_required
 def search_food():
     q = request.args.get('q', '')
-    results = list(food_collection.find({'food_name': {'$regex': q, '$options': 'i'}}).limit(10))
-    for r in results:
-        r['_id'] = str(r['_id'])
-    return jsonify(results)
+    return jsonify(food_search_index().search(q, limit=10))
 
 
 @app.route('/food_details/<fid>')
 @login_required
 def food_details(fid):
-    food = food_collection.find_one({'_id': ObjectId(fid)})
+    food = food_catalog.get(fid)
     if not food:
         return jsonify({'success': False, 'message': 'Food not found'})
     food['_id'] = str(food['_id'])
     return jsonify({'success': True, 'food': food})
 
 
+@app.route('/food_catalog/stats')
+@admin_token_required
+def food_catalog_stats():
+    return jsonify({'food_nutrition': food_catalog.stats(), 'food_nutrition_diet': food_catalog_diet.stats()})
+
+
+@app.route('/upstreams/stats')
+@admin_token_required
+def upstream_stats():
+    stats = http_client.stats()
+    stats['cache'] = {'exercises': exercise_cache.stats(), 'yoga': yoga_cache.stats(), 'users': user_repo.stats()}
+    return jsonify(stats)
+
+
+@app.route('/food_catalog/reload', methods=['POST'])
+@admin_token_required
+def food_catalog_reload():
+    # Reloads this worker now and the other workers on their next version check
+    food_catalog.bump_version()
+    food_catalog_diet.bump_version()
+    return jsonify({'success': True, 'food_nutrition': food_catalog.stats(), 'food_nutrition_diet': food_catalog_diet.stats()})
+
+
 @app.route('/api/journal', methods=['POST'])
 @login_required
 def add_journal_entry():
-    data = request.get_json()
-    entry = {
-        'user_id': session.get('user_id'),
-        'date': data.get('date'),
-        'mood': data.get('mood'),
-        'stress': data.get('stress'),
-        'symptoms': data.get('symptoms'),
-        'notes': data.get('notes'),
-        'feelData': data.get('feelData'),
-        'timestamp': datetime.utcnow()
-    }
-    mongo.db.journals.insert_one(entry)
+    data = request.get_json() or {}
+    try:
+        day = parse_day(data.get('date') or '').isoformat()
+    except ValueError:
+        return jsonify({'success': False, 'message': 'date must be YYYY-MM-DD'}), 400
+    journal_store.save(session['user_id'], day, {
+        field: data[field] for field in ('mood', 'stress', 'symptoms', 'notes', 'feelData') if field in data
+    })
     return jsonify({"status": "success"}), 201
 
 
+@app.route('/api/journal', methods=['GET'])
+@login_required
+def journal_range():
+    # ?month=YYYY-MM or ?start=&end= -> one flag per day plus the entries, so a
+    # calendar renders from a single request; ?date= returns one day
+    try:
+        if request.args.get('date'):
+            entry = journal_store.get(session['user_id'], parse_day(request.args['date']).isoformat())
+            return jsonify({'exists': entry is not None, 'entry': entry})
+        if request.args.get('month'):
+            start, end = month_range(request.args['month'])
+        else:
+            start = parse_day(request.args.get('start', '')).isoformat()
+            end = parse_day(request.args.get('end', '')).isoformat()
+        view = journal_store.range_view(session['user_id'], start, end)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    response = jsonify(view)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.cli.command('migrate-journals')
+def migrate_journals():
+    moved = journal_store.migrate_legacy(mongo.db.journals)
+    print(f"Merged {moved} legacy journal entries into the journal collection.")
+
+
 @app.route('/add_cycle', methods=['POST'])
 @login_required
 def add_cycle():
@@ -369,32 +649,47 @@ def add_cycle():
     except Exception:
         return jsonify({'success': False, 'message': 'Invalid date or numeric format'}), 400
 
-    cycle_entry = {
-        'start': data.get('last_period_date'),
-        'duration': duration,
-        'cycle_length': cycle_length,
-        'flow_intensity': data.get('flow_intensity'),
-        'symptoms': data.get('symptoms'),
-        'end': (start_date + timedelta(days=duration)).strftime("%Y-%m-%d") if start_date else None,
-        'created_at': datetime.utcnow()
-    }
-
-    mongo.db.users.update_one(
-        {'_id': ObjectId(session["user_id"])},
-        {'$push': {'cycles': cycle_entry}}
+    cycle_store.add_cycle(
+        session['user_id'], data['last_period_date'], duration, cycle_length,
+        flow_intensity=data.get('flow_intensity'), symptoms=data.get('symptoms')
     )
     return jsonify({'success': True})
 
+@app.route('/cycles')
+@login_required
+def list_cycles():
+    # ?start=YYYY-MM-DD&end=YYYY-MM-DD for a date range, otherwise the latest ?limit= cycles
+    start, end = request.args.get('start'), request.args.get('end')
+    if start or end:
+        try:
+            datetime.strptime(start, "%Y-%m-%d")
+            datetime.strptime(end, "%Y-%m-%d")
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'message': 'start and end must be YYYY-MM-DD'}), 400
+        cycles = cycle_store.in_range(session['user_id'], start, end)
+    else:
+        limit = min(max(request.args.get('limit', 12, type=int), 1), 120)
+        cycles = cycle_store.recent(session['user_id'], limit)
+    return jsonify({'success': True, 'cycles': cycles})
+
+
+@app.cli.command('backfill-cycles')
+@click.option('--batch-size', default=200, help='Users per batch.')
+@click.option('--pause', default=0.1, help='Seconds to sleep between batches.')
+def backfill_cycles(batch_size, pause):
+    # Online migration of users.cycles arrays into the cycles collection
+    db_indexes.ensure_indexes(mongo.db, ['cycles'])
+    users, cycles = cycle_store.backfill(users_collection, batch_size=batch_size, pause=pause)
+    print(f"Moved {cycles} cycles off {users} user documents.")
+
+
 def get_active_period(user_id):
     # Finds the latest cycle that is not ended for this user
-    return mongo.db.cycles.find_one(
-        {"user_id": user_id, "marked_ended": False},
-        sort=[("start_date", -1)]
-    )
+    return cycle_store.active(user_id)
 
 @app.route('/dashboard')
 def dashboard():
-    user = mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
+    user = user_repo.get(session['user_id'], 'dashboard')
     today = str(datetime.utcnow().date())
     name = user.get('full_name', 'User')
 
@@ -411,6 +706,7 @@ def dashboard():
 
     # Active period prompt (from cycles db)
     active_period = get_active_period(str(session['user_id']))
+    workout_summary = workout_store.summary(session['user_id'])
 
     return render_template(
         'dashboard.html',
@@ -418,7 +714,7 @@ def dashboard():
         calorie_limit=calorie_limit,
         step_goal=step_goal, activity_goal=activity_goal,
         diet=diet_data, activity=activity_data,
-        active_period=active_period
+        active_period=active_period, workout_summary=workout_summary
     )
 
 # Record new period start
@@ -429,22 +725,23 @@ def record_period():
     user_id = session.get('user_id')
     if not date or not user_id:
         return jsonify({"success": False, "message": "Date required"})
-    mongo.db.cycles.insert_one({
-        "user_id": str(user_id),
-        "start_date": date,
-        "marked_ended": False,
-        "created_at": datetime.utcnow()
-    })
-    mongo.db.users.update_one({'_id': ObjectId(user_id)}, {'$set': {'last_period_date': date}})
+    cycle_store.record_start(user_id, date)
+    user_repo.update(user_id, {'$set': {'last_period_date': date}})
     return jsonify({"success": True})
 
 # Mark period ended
 @app.route('/end_period', methods=['POST'])
+@login_required
 def end_period():
     data = request.get_json()
     cycle_id = data.get('cycle_id')
     if not cycle_id: return jsonify({"success": False})
-    mongo.db.cycles.update_one({'_id': ObjectId(cycle_id)}, {'$set': {'marked_ended': True, 'end_date': datetime.utcnow()}})
+    try:
+        ended = cycle_store.end(session['user_id'], cycle_id)
+    except InvalidId:
+        return jsonify({"success": False, "message": "Invalid cycle_id"}), 400
+    if not ended:
+        return jsonify({"success": False, "message": "Cycle not found"}), 404
     return jsonify({"success": True})
 @app.route('/diet', methods=['GET', 'POST'])
 @login_required
@@ -453,92 +750,196 @@ def diet():
     today = str(datetime.utcnow().date())
     if request.method == 'POST':
         data = request.get_json()
-        mongo.db.diet.update_one(
-            {'user_id': user_id, 'date': today},
-            {'$set': {
-                'calories_consumed': data.get('calories_consumed', 0),
-                'total_allowed': data.get('total_allowed', 0),
-                'protein': data.get('protein', 0),
-                'carbs': data.get('carbs', 0),
-                'fats': data.get('fats', 0),
-                'foods': data.get('foods', []),
-                'updated_at': datetime.utcnow()
-            }},
-            upsert=True
-        )
+        save_diet_day(user_id, today, {
+            'calories_consumed': data.get('calories_consumed', 0),
+            'total_allowed': data.get('total_allowed', 0),
+            'protein': data.get('protein', 0),
+            'carbs': data.get('carbs', 0),
+            'fats': data.get('fats', 0),
+            'foods': data.get('foods', []),
+        })
         return jsonify({'success': True})
 
+    user = user_repo.get(user_id, 'diet_header')
+    allergies = user.get('allergies', []) if user else []
     doc = weekly_diet_collection.find_one({'user_id': user_id, 'days.date': today})
     meals = {}
     if doc:
         for day in doc['days']:
             if day['date'] == today:
-                for meal, ids in day['meals'].items():
-                    foods = []
-                    for fid in ids:
-                        food = food_collection_diet.find_one({"_id": ObjectId(fid)})
-                        if food:
-                            if 'food_name' not in food and 'name' in food:
-                                food['food_name'] = food['name']
-                            food['_id'] = str(food['_id'])
-                            foods.append(food)
-                        else:
-                            foods.append({'food_name': 'Unknown Food', 'energy_kcal': 0, 'protein_g': 0, 'carb_g': 0, 'fat_g': 0})
-                    meals[meal] = foods
+                meals = resolve_day_meals(day, resolve_foods(collect_food_ids([day])))
+    if allergies:
+        # Flag planned foods that clash with allergies added after the plan was made
+        index = allergen_index()
+        for foods in meals.values():
+            for food in foods:
+                if '_id' in food:
+                    food['contains_allergen'] = not index.is_safe(ObjectId(food['_id']), allergies)
     diet_data = mongo.db.diet.find_one({'user_id': user_id, 'date': today})
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)})
     return render_template('diet.html', user=user, meals=meals, diet=diet_data)
 
 
+# Weekly calorie/macro totals, kept up to date by every diet write
+diet_rollups = diet_rollup.DietRollups(mongo.db.diet_rollups)
+
+
+def save_diet_day(user_id, day, fields):
+    # Overwrite a day's diet fields and move its week's rollup by the difference
+    query = {'user_id': user_id, 'date': day}
+    update = {'$set': {**fields, 'updated_at': datetime.utcnow()}}
+    projection = {m: 1 for m in diet_rollup.MEASURES}
+    try:
+        before = mongo.db.diet.find_one_and_update(
+            query, update, projection=projection, upsert=True, return_document=ReturnDocument.BEFORE
+        )
+        new_day = before is None
+    except DuplicateKeyError:
+        # A concurrent first save created the day (unique user_date index); that
+        # save counted it, so update it as an existing day
+        before = mongo.db.diet.find_one_and_update(
+            query, update, projection=projection, return_document=ReturnDocument.BEFORE
+        )
+        new_day = False
+    diet_rollups.add(user_id, day, diet_rollup.deltas(before, fields), new_day=new_day)
+
+
+# Today's food log, changed by small batches of add/remove operations
+diet_log = DietLog(mongo.db.diet, resolve_foods, on_change=diet_rollups.add)
+
+
+@app.route('/diet/log', methods=['GET', 'POST'])
+@login_required
+def diet_log_today():
+    # POST {"idempotency_key": "...", "ops": [{"op": "add"|"remove", "meal", "item_id", "food_id", "servings"}]}
+    today = str(datetime.utcnow().date())
+    if request.method == 'GET':
+        return jsonify({'success': True, **diet_log.view(session['user_id'], today)})
+    data = request.get_json() or {}
+    try:
+        view = diet_log.apply(session['user_id'], today, data.get('idempotency_key'), data.get('ops'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, **view})
+
+
 @app.route('/diet/update', methods=['POST'])
 @login_required
 def update_diet():
     user_id = session['user_id']
     today = str(datetime.utcnow().date())
     data = request.get_json()
-    mongo.db.diet.update_one(
-        {'user_id': user_id, 'date': today},
-        {'$set': {
-            'foods': data.get('meals', {}),
-            'calories_consumed': data.get('calories_consumed', 0),
-            'protein': data.get('protein', 0),
-            'carbs': data.get('carbs', 0),
-            'fats': data.get('fats', 0),
-            'updated_at': datetime.utcnow()
-        }},
-        upsert=True
-    )
+    save_diet_day(user_id, today, {
+        'foods': data.get('meals', {}),
+        'calories_consumed': data.get('calories_consumed', 0),
+        'protein': data.get('protein', 0),
+        'carbs': data.get('carbs', 0),
+        'fats': data.get('fats', 0),
+    })
     return jsonify({'success': True})
 
 
+@app.route('/diet/history', methods=['GET'])
+@login_required
+def diet_history():
+    # ?days=N (1-90, daily points) or ?weeks=N (1-52, weekly rollups); columnar
+    # arrays aligned with `dates` / `weeks`
+    user_id = session['user_id']
+    try:
+        if request.args.get('weeks'):
+            weeks = int(request.args['weeks'])
+            if not 1 <= weeks <= 52:
+                raise ValueError
+            series = diet_rollups.weekly(user_id, weeks, today=datetime.utcnow().date())
+        else:
+            days = int(request.args.get('days', 7))
+            if not 1 <= days <= 90:
+                raise ValueError
+            series = diet_rollup.daily(mongo.db.diet, user_id, days, today=datetime.utcnow().date())
+    except ValueError:
+        return jsonify({'success': False, 'message': 'days must be 1-90 or weeks 1-52'}), 400
+
+    user = user_repo.get(user_id, 'diet_header') or {}
+    response = jsonify({'success': True, 'calorie_goal': user.get('target_calories', 2000), **series})
+    response.headers['Cache-Control'] = 'private, no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+
+@app.cli.command('rebuild-diet-rollups')
+def rebuild_diet_rollups():
+    # Recompute the weekly rollups from the diet documents (backfill or repair)
+    written = diet_rollups.rebuild(mongo.db.diet)
+    print(f"Rebuilt {written} weekly diet rollups.")
+
+
 @app.route('/activity', methods=['GET', 'POST'])
 @login_required
 def activity():
     if request.method == 'POST':
         data = request.get_json()
         today = str(datetime.utcnow().date())
+        # Every activity is priced here from its MET code; client calories are ignored
+        weight = activity_engine.weight_of(user_repo.get(session['user_id'], 'weight'))
+        try:
+            activities, calories_burnt = activity_engine.priced(data.get('activities', []), weight)
+        except ValueError as e:
+            return jsonify({'success': False, 'message': str(e)}), 400
 
         mongo.db.activity.update_one(
             {'user_id': session['user_id'], 'date': today},
             {'$set': {
-                'calories_burnt': data.get('calories_burnt', 0),
+                'calories_burnt': calories_burnt,
                 'goal_calories': data.get('goal_calories', 0),
                 'steps': data.get('steps', 0),
                 'goal_steps': data.get('goal_steps', 0),
                 'hours': data.get('hours', 0),
                 'goal_hours': data.get('goal_hours', 0),
-                'activities': data.get('activities', []),
+                'activities': activities,
                 'updated_at': datetime.utcnow()
             }},
             upsert=True
         )
-        return jsonify({'success': True})
+        return jsonify({'success': True, 'calories_burnt': calories_burnt})
 
     # GET request below
-    user = users_collection.find_one({'_id': session['user_id']})
-    user_weight = user['weight'] if user and 'weight' in user else 60  # default fallback   
+    user_weight = activity_engine.weight_of(user_repo.get(session['user_id'], 'weight'))
+    return render_template('activity.html', user_weight=user_weight, activities=activity_engine.ACTIVITIES)
+
+
+@app.route('/activity/log', methods=['POST'])
+@login_required
+def log_activity():
+    # {"code": "swimming_casual", "minutes": 30} -> adds the entry to today's activity
+    data = request.get_json() or {}
+    weight = activity_engine.weight_of(user_repo.get(session['user_id'], 'weight'))
+    try:
+        entry = activity_engine.entry(data.get('code'), data.get('minutes'), weight)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    day = mongo.db.activity.find_one_and_update(
+        {'user_id': session['user_id'], 'date': str(datetime.utcnow().date())},
+        {'$push': {'activities': entry}, '$inc': {'calories_burnt': entry['calories']},
+         '$set': {'updated_at': datetime.utcnow()}},
+        projection={'calories_burnt': 1},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return jsonify({'success': True, 'entry': entry, 'calories_burnt': round(day['calories_burnt'], 1)})
+
 
-    return render_template('activity.html', user_weight=user_weight)
+@app.cli.command('recompute-activity-calories')
+def recompute_activity_calories():
+    # Re-price every stored MET activity at each user's current weight
+    written = 0
+    batch = {}
+    for user in users_collection.find({}, {'weight': 1}):
+        batch[str(user['_id'])] = activity_engine.weight_of(user)
+        if len(batch) >= 5000:
+            written += activity_engine.recompute(mongo.db.activity, batch)
+            batch = {}
+    if batch:
+        written += activity_engine.recompute(mongo.db.activity, batch)
+    print(f"Recomputed calories on {written} activity days.")
 
 
 
@@ -548,24 +949,16 @@ def journal():
     if request.method == 'POST':
         data = request.get_json()
         today = str(datetime.utcnow().date())
-        mongo.db.journal.update_one(
-            {'user_id': session['user_id'], 'date': today},
-            {'$set': {
-                'mood': data.get('mood', ''),
-                'sleep_quality': data.get('sleep_quality', 0),
-                'behavioral_pattern': data.get('behavioral_pattern', ''),
-                'notes': data.get('notes', ''),
-                'updated_at': datetime.utcnow()
-            }},
-            upsert=True
-        )
+        journal_store.save(session['user_id'], today, {
+            'mood': data.get('mood', ''),
+            'sleep_quality': data.get('sleep_quality', 0),
+            'behavioral_pattern': data.get('behavioral_pattern', ''),
+            'notes': data.get('notes', ''),
+        })
         return jsonify({'success': True})
 
-    user = mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
-    journal_entries = list(mongo.db.journal.find(
-        {'user_id': session['user_id']},
-        sort=[('date', -1)],
-        limit=30))
+    user = user_repo.get(session['user_id'], 'theme')
+    journal_entries = journal_store.recent(session['user_id'], 30)
     return render_template('journal.html', user=user, entries=journal_entries)
 
 
@@ -586,26 +979,47 @@ def profile():
             if field in data:
                 update_data[field] = data[field]
         if update_data:
-            mongo.db.users.update_one({'_id': ObjectId(session['user_id'])}, {'$set': update_data})
+            user_repo.update(session['user_id'], {'$set': update_data})
+        if 'weight' in update_data:
+            # Stored activity calories depend on weight
+            activity_engine.recompute(mongo.db.activity,
+                                      {session['user_id']: activity_engine.weight_of(update_data)})
         return jsonify({'success': True})
 
-    user = mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
+    user = user_repo.get(session['user_id'], 'full')
     return render_template('profile.html', user=user)
 
 
 @app.route('/toggle_dark_mode', methods=['POST'])
 @login_required
 def toggle_dark_mode():
-    user = mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
-    new_mode = not user.get('dark_mode', False)
-    mongo.db.users.update_one({'_id': ObjectId(session['user_id'])}, {'$set': {'dark_mode': new_mode}})
-    return jsonify({'success': True, 'dark_mode': new_mode})
+    flags = user_repo.update_flags(session['user_id'], toggle=['dark_mode'])
+    if flags is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    return jsonify({'success': True, 'dark_mode': flags['dark_mode']})
+
+
+@app.route('/preferences', methods=['POST'])
+@login_required
+def update_preferences():
+    # {"toggle": ["dark_mode", ...], "set": {"stress": true, ...}} -> new values, one write
+    data = request.get_json() or {}
+    toggle, values = data.get('toggle', []), data.get('set', {})
+    if not isinstance(toggle, list) or not isinstance(values, dict):
+        return jsonify({'success': False, 'message': 'toggle must be a list and set an object'}), 400
+    try:
+        flags = user_repo.update_flags(session['user_id'], toggle=toggle, values=values)
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    if flags is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    return jsonify({'success': True, 'preferences': flags})
 
 
 @app.route('/alagi')
 @login_required
 def alagi():
-    user = mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
+    user = user_repo.get(session['user_id'], 'theme')
     return render_template('alagi.html', user=user)
 
 
@@ -620,49 +1034,157 @@ def predictor():
         except Exception:
             return jsonify({'success': False, 'message': 'Invalid date or cycle length'}), 400
 
-        predicted_date = last_period + timedelta(days=cycle_length)
-        cycle_day = (datetime.utcnow() - last_period).days % cycle_length
+        # Predict from the whole logged history plus this entry, with the
+        # entered length as the prior
+        history = cycle_analytics.load_histories(mongo.db, [session['user_id']]).get(
+            session['user_id'], {'starts': [], 'reported_length': None})
+        history['starts'] = cycle_analytics.merge_starts(history['starts'] + [last_period.toordinal()])
+        history['reported_length'] = cycle_length
+        prediction = cycle_analytics.predict(history)
+        predicted_date = prediction['predicted_date']
+        cycle_day = prediction['cycle_day']
 
         mongo.db.cycle.insert_one({
             'user_id': session['user_id'],
             'last_period_date': str(last_period.date()),
             'cycle_length': cycle_length,
-            'predicted_date': str(predicted_date.date()),
+            'predicted_date': predicted_date,
             'cycle_day': cycle_day,
             'created_at': datetime.utcnow()
         })
 
-        return jsonify({'success': True, 'predicted_date': str(predicted_date.date()), 'cycle_day': cycle_day})
+        return jsonify({'success': True, 'predicted_date': predicted_date, 'cycle_day': cycle_day,
+                        'prediction': prediction})
 
-    user = mongo.db.users.find_one({'_id': ObjectId(session['user_id'])})
+    user = user_repo.get(session['user_id'], 'cycle')
     cycle_data = mongo.db.cycle.find_one({'user_id': session['user_id']}, sort=[('_id', -1)])
     return render_template('predictor.html', user=user, cycle=cycle_data)
 
 
-# External API call for exercises
-def fetch_exercises_by_name(name, keywords="", limit=10):
-    url = "https://exercisedb-api1.p.rapidapi.com/api/v1/exercises"
+@app.route('/cycle/prediction')
+@login_required
+def cycle_prediction():
+    user_id = session['user_id']
+    history = cycle_analytics.load_histories(mongo.db, [user_id]).get(user_id)
+    if history is None:
+        return jsonify({'success': False, 'message': 'User not found'}), 404
+    return jsonify({'success': True, **cycle_analytics.predict(history)})
+
+
+@app.cli.command('predict-cycles')
+def predict_cycles():
+    # Nightly job: a vectorised pass over each page of users' cycle histories;
+    # the results feed the period reminders. Only one page is in memory at a time.
+    written = 0
+    for user_ids in cycle_analytics.user_id_batches(mongo.db, 5000):
+        histories = cycle_analytics.load_histories(mongo.db, user_ids)
+        batch = [u for u in user_ids if u in histories]
+        result = cycle_analytics.predict_many([histories[u] for u in batch])
+        due = cycle_analytics.reminder_due(result)
+        ops = [
+            UpdateOne(
+                {'_id': user_id},
+                {'$set': {**cycle_analytics.row_json(result, k), 'reminder_due': bool(due[k]),
+                          'updated_at': datetime.utcnow()}},
+                upsert=True
+            )
+            for k, user_id in enumerate(batch)
+        ]
+        if ops:
+            mongo.db.cycle_predictions.bulk_write(ops, ordered=False)
+            written += len(ops)
+    print(f"Updated {written} cycle predictions.")
+
+
+# External API calls, cached with stale-while-revalidate. Upstream URLs can be
+# overridden (e.g. to point at a local stub server).
+RAPIDAPI_EXERCISES_URL = os.getenv("RAPIDAPI_EXERCISES_URL", "https://exercisedb-api1.p.rapidapi.com/api/v1/exercises")
+YOGA_API_URL = os.getenv("YOGA_API_URL", "https://yoga-api-nzy4.onrender.com/v1/poses")
+
+if os.getenv("RESPONSE_CACHE_DIR"):
+    response_cache_store = DiskStore(os.getenv("RESPONSE_CACHE_DIR"))
+else:
+    response_cache_store = MongoStore(mongo.db.response_cache)
+exercise_cache = ResponseCache('exercises', ttl=24 * 3600, stale_ttl=7 * 24 * 3600, store=response_cache_store)
+yoga_cache = ResponseCache('yoga', ttl=6 * 3600, stale_ttl=7 * 24 * 3600, store=response_cache_store)
+
+
+def fetch_yoga_poses(level):
+    # Raises on failure so errors are not cached
+    response = http_client.yoga.get(YOGA_API_URL, params={'level': level})
+    response.raise_for_status()
+    result = []
+    for pose in response.json().get('poses', []):
+        result.append({
+            "name": pose.get('english_name', ''),
+            "description": pose.get('pose_description', ''),
+            "img": pose.get('url_png')
+        })
+    return result
+
+
+def _fetch_exercises(name, keywords, limit):
     querystring = {"name": name, "keywords": keywords, "limit": str(limit)}
     headers = {
         "x-rapidapi-key": os.getenv("RAPIDAPI_KEY", ""),
         "x-rapidapi-host": "exercisedb-api1.p.rapidapi.com"
     }
+    response = http_client.rapidapi.get(RAPIDAPI_EXERCISES_URL, headers=headers, params=querystring)
+    response.raise_for_status()
+    data = response.json()
+    return data.get("data", data) if isinstance(data, dict) else data
+
+
+def fetch_exercises_by_name(name, keywords="", limit=10):
     try:
-        response = requests.get(url, headers=headers, params=querystring)
-        response.raise_for_status()
-        data = response.json()
-        exercises = data.get("data", data) if isinstance(data, dict) else data
-        return exercises
+        return exercise_cache.get(
+            {'name': name, 'keywords': keywords, 'limit': limit},
+            lambda: _fetch_exercises(name, keywords, limit)
+        )
     except Exception as e:
         print("Error fetching exercises:", e)
         return []
 
 
+def keyword_filters(keywords):
+    # "chest workout,barbell" -> {'muscle': ['chest'], 'equipment': ['barbell']}
+    filters = {}
+    values = exercise_catalog.facet_values()
+    for keyword in keywords.split(','):
+        keyword = keyword.strip().lower()
+        for term in [keyword] + keyword.split():
+            for facet in ('equipment', 'muscle', 'category'):
+                if term in values[facet]:
+                    filters.setdefault(facet, []).append(term)
+    return filters
+
+
 @app.route('/exercises/search')
 def exercises_search():
     name = request.args.get('name', '')
     keywords = request.args.get('keywords', '')
     limit = int(request.args.get('limit', 10))
+
+    # Local catalog first: name search plus keyword and explicit facet filters
+    filters = keyword_filters(keywords)
+    for facet in FACETS:
+        if request.args.get(facet):
+            filters[facet] = request.args.getlist(facet)
+    rows = exercise_catalog.query(filters, q=name, limit=limit) if (name or filters) else []
+    if rows:
+        simplified = []
+        for row in rows:
+            ex = exercise_catalog.get(row)
+            simplified.append({
+                'id': ex['id'],
+                'name': ex['name'],
+                'gifUrl': f"/static/exercises/{ex['images'][0]}" if ex['images'] else '',
+                'bodyPart': ', '.join(ex['primaryMuscles']),
+                'equipment': ex['equipment'] or ''
+            })
+        return jsonify({'success': True, 'exercises': simplified})
+
+    # Nothing local: fall back to RapidAPI (cached)
     exercises = fetch_exercises_by_name(name, keywords, limit)
     simplified = []
     for ex in exercises:
@@ -684,48 +1206,102 @@ def save_workout():
     if not data:
         return jsonify({'success': False, 'message': 'No data received'}), 400
 
-    workout = {
-        'user_id': session['user_id'],
-        'workout_type': data.get('workout_type'),
-        'exercises': data.get('exercises'),
-        'duration': data.get('duration'),
-        'rest_period': data.get('rest_period', 0),
-        'intensity': data.get('intensity', 0),
-        'timestamp': datetime.utcnow()
-    }
-    mongo.db.workouts.insert_one(workout)
+    try:
+        duration = int(data.get('duration') or 0)
+        rest_period = int(data.get('rest_period') or 0)
+        intensity = float(data.get('intensity') or 0)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'duration, rest_period and intensity must be numbers'}), 400
+
+    workout_store.save(session['user_id'], data.get('workout_type'), data.get('exercises'),
+                       duration, rest_period, intensity)
     return jsonify({'success': True, 'message': 'Workout saved successfully'})
 
 
+WORKOUT_PAGE_SIZE = 20
+WORKOUT_MAX_PAGE_SIZE = 100
+
+
+def workout_json(workout):
+    return {
+        'id': str(workout['_id']),
+        'workout_type': workout.get('workout_type'),
+        'exercises': workout.get('exercises'),
+        'duration': workout.get('duration'),
+        'rest_period': workout.get('rest_period', 0),
+        'intensity': workout.get('intensity', 0),
+        'timestamp': workout['timestamp'].isoformat() + 'Z',
+    }
+
+
+@app.route('/workouts', methods=['GET'])
+@login_required
+def list_workouts():
+    # Newest first: ?limit=&cursor= (cursor from the previous page's next_cursor)
+    try:
+        limit = int(request.args.get('limit', WORKOUT_PAGE_SIZE))
+        if not 1 <= limit <= WORKOUT_MAX_PAGE_SIZE:
+            raise ValueError(f"limit must be between 1 and {WORKOUT_MAX_PAGE_SIZE}")
+        workouts, next_cursor = workout_store.history(session['user_id'], limit, request.args.get('cursor'))
+    except ValueError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    return jsonify({'success': True, 'workouts': [workout_json(w) for w in workouts],
+                    'next_cursor': next_cursor})
+
+
+@app.route('/workouts/summary', methods=['GET'])
+@login_required
+def workout_summary():
+    return jsonify({'success': True, **workout_store.summary(session['user_id'])})
+
+
+@app.cli.command('rebuild-workout-summaries')
+def rebuild_workout_summaries():
+    rebuilt = workout_store.rebuild()
+    print(f"Rebuilt workout summaries for {rebuilt} users.")
+
+
 # Chat route with Groq AI integration
 GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
 GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
 
-@app.route("/chat", methods=["POST"])
-def chat():
-    user_message = request.get_json().get("message", "")
-    if not user_message:
-        return jsonify({"reply": "Please type your message."}), 400
+ALAGI_SYSTEM_PROMPT = "You are a helpful healthcare pcos lifestyle assistant named Alagi meaning beautiful. Provide accurate and empathetic responses to user queries about PCOS, diet, exercise, and lifestyle."
 
+
+def alagi_chat_request(user_message, stream=False):
     messages = [
-        {"role": "system", "content": "You are a helpful healthcare pcos lifestyle assistant named Alagi meaning beautiful. Provide accurate and empathetic responses to user queries about PCOS, diet, exercise, and lifestyle."},
+        {"role": "system", "content": ALAGI_SYSTEM_PROMPT},
         {"role": "user", "content": user_message}
     ]
-
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
         "Content-Type": "application/json"
     }
-
     data = {
         "model": "llama-3.3-70b-versatile",
         "messages": messages,
         "temperature": 0.7
     }
+    if stream:
+        data["stream"] = True
+    return headers, data
+
+
+def sse(event, payload):
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+
+@app.route("/chat", methods=["POST"])
+def chat():
+    user_message = request.get_json().get("message", "")
+    if not user_message:
+        return jsonify({"reply": "Please type your message."}), 400
+
+    headers, data = alagi_chat_request(user_message)
 
     try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=data, timeout=15)
+        response = http_client.groq.post(GROQ_API_URL, headers=headers, json=data, timeout=(5, 15))
         response.raise_for_status()
         resp_json = response.json()
         if 'choices' in resp_json and len(resp_json['choices']) > 0:
@@ -743,35 +1319,59 @@ def chat():
         return jsonify({"reply": "Sorry, something went wrong with Groq chat."}), 500
 
 
+@app.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    # Same conversation as /chat, relayed token by token as server-sent events:
+    #   event: delta  data: {"content": "..."}   (repeated)
+    #   event: done   data: {}
+    #   event: error  data: {"reply": "..."}
+    user_message = (request.get_json() or {}).get("message", "")
+    if not user_message:
+        return jsonify({"reply": "Please type your message."}), 400
+    headers, data = alagi_chat_request(user_message, stream=True)
+
+    def generate():
+        try:
+            # timeout applies to connect and to each gap between chunks, not the whole reply
+            with http_client.groq.post(GROQ_API_URL, headers=headers, json=data, timeout=(5, 15), stream=True) as response:
+                response.raise_for_status()
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line or not line.startswith("data:"):
+                        continue
+                    chunk = line[len("data:"):].strip()
+                    if chunk == "[DONE]":
+                        break
+                    choices = json.loads(chunk).get("choices") or [{}]
+                    content = choices[0].get("delta", {}).get("content")
+                    if content:
+                        yield sse("delta", {"content": content})
+            yield sse("done", {})
+        except requests.exceptions.Timeout:
+            yield sse("error", {"reply": "Request to Groq service timed out."})
+        except requests.exceptions.HTTPError:
+            yield sse("error", {"reply": "Failed to get a valid response from Groq service."})
+        except Exception as e:
+            print("Groq AI stream error:", e)
+            yield sse("error", {"reply": "Sorry, something went wrong with Groq chat."})
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.route('/create_weekly_diet', methods=['POST'])
 @login_required
 def create_weekly_diet():
     user_id = session['user_id']
-    allergies = get_user_allergies(user_id)
+    user = user_repo.get(user_id, 'meal_targets') or {}
     week_start = str(datetime.utcnow().date())
 
-    safe_foods = list(food_collection_diet.find({
-        "ingredients": {
-            "$not": {"$elemMatch": {"$in": allergies}}
-        }
-    }))
-
-    if not safe_foods:
+    weekly_plan = meal_planner().plan(user)
+    if not weekly_plan:
         return jsonify({'success': False, 'message': "No safe foods found for your allergies."})
 
-    weekly_plan = []
-    for i in range(7):
-        day_plan = {
-            "date": str((datetime.utcnow() + timedelta(days=i)).date()),
-            "meals": {
-                "breakfast": [random.choice(safe_foods)["_id"]],
-                "lunch": [random.choice(safe_foods)["_id"]],
-                "snacks": [random.choice(safe_foods)["_id"]],
-                "dinner": [random.choice(safe_foods)["_id"]],
-            }
-        }
-        weekly_plan.append(day_plan)
-
     weekly_diet_collection.update_one(
         {'user_id': user_id, 'week_start': week_start},
         {'$set': {'days': weekly_plan}},
@@ -780,6 +1380,38 @@ def create_weekly_diet():
     return jsonify({'success': True, 'message': "Weekly diet created!"})
 
 
+@app.cli.command('regenerate-weekly-diets')
+def regenerate_weekly_diets():
+    # Nightly job: one catalog load and one batched scoring pass for every user
+    week_start = str(datetime.utcnow().date())
+    planner = meal_planner()
+    projection = user_projection('meal_targets')
+    batch = []
+    written = 0
+
+    def flush(batch):
+        ops = []
+        for user, plan in zip(batch, planner.plan_many(batch)):
+            if plan:
+                ops.append(UpdateOne(
+                    {'user_id': str(user['_id']), 'week_start': week_start},
+                    {'$set': {'days': plan}},
+                    upsert=True
+                ))
+        if ops:
+            weekly_diet_collection.bulk_write(ops, ordered=False)
+        return len(ops)
+
+    for user in users_collection.find({}, projection):
+        batch.append(user)
+        if len(batch) >= 500:
+            written += flush(batch)
+            batch = []
+    if batch:
+        written += flush(batch)
+    print(f"Regenerated {written} weekly diets.")
+
+
 @app.route('/diet/today', methods=['GET'])
 @login_required
 def get_today_diet():
@@ -792,77 +1424,13 @@ def get_today_diet():
 
     for day in doc['days']:
         if day['date'] == today:
-            details = {}
-            for meal, ids in day['meals'].items():
-                foods = []
-                for fid in ids:
-                    food = food_collection_diet.find_one({"_id": ObjectId(fid)})
-                    if food:
-                        if 'food_name' not in food and 'name' in food:
-                            food['food_name'] = food['name']
-                        food['_id'] = str(food['_id'])
-                        foods.append(food)
-                    else:
-                        foods.append({'food_name': 'Unknown Food', 'energy_kcal': 0, 'protein_g': 0, 'carb_g': 0, 'fat_g': 0})
-                details[meal] = foods
+            details = resolve_day_meals(day, resolve_foods(collect_food_ids([day])))
             return jsonify({'success': True, 'meals': details})
 
     return jsonify({'success': False, 'message': 'Not found'})
 
-@app.route('/download_weekly_report_pdf', methods=['GET'])
-@login_required
-def download_weekly_report_pdf():
-    user_id = session['user_id']
-    today = datetime.utcnow().date()
-    start_date = today - timedelta(days=6)
-
-    # Aggregate available data
-    user = mongo.db.users.find_one({'_id': ObjectId(user_id)}) or {}
-    if user:
-        user['_id'] = str(user['_id'])
-        user.pop('password', None)
-
-    activity_logs = list(mongo.db.activity.find({
-        'user_id': user_id,
-        'date': {'$gte': str(start_date), '$lte': str(today)}
-    })) or []
-    for entry in activity_logs:
-        entry['_id'] = str(entry['_id'])
-
-    diet_logs = list(mongo.db.diet.find({
-        'user_id': user_id,
-        'date': {'$gte': str(start_date), '$lte': str(today)}
-    })) or []
-    for entry in diet_logs:
-        entry['_id'] = str(entry['_id'])
-
-    journals = list(mongo.db.journal.find({
-        'user_id': user_id,
-        'date': {'$gte': str(start_date), '$lte': str(today)}
-    })) or []
-    for entry in journals:
-        entry['_id'] = str(entry['_id'])
-
-    cycles = list(mongo.db.cycles.find({
-        'user_id': user_id,
-        '$or': [
-            {'start_date': {'$gte': str(start_date), '$lte': str(today)}},
-            {'end_date': {'$gte': str(start_date), '$lte': str(today)}}
-        ]
-    })) or []
-    for entry in cycles:
-        entry['_id'] = str(entry['_id'])
-
-    summary = {
-        'user_profile': user,
-        'activity_logs': activity_logs,
-        'diet_logs': diet_logs,
-        'journal_entries': journals,
-        'cycle_details': cycles
-    }
-
-    # Prompt for Groq AI: instruct to provide summary in specified format
-    report_prompt = """
+# Prompt for Groq AI: instruct to provide summary in specified format
+WEEKLY_REPORT_PROMPT = """
     You are a helpful healthcare assistant. Given this JSON representing a user's previous 7 days, create a neat, positive, and structured weekly health report.
     Use this format exactly for each section, filling with bullet points, summary, or an observation if data is missing.
 
@@ -892,13 +1460,22 @@ def download_weekly_report_pdf():
     6. Overall Positives and Suggestions
     Summary paragraph or bullets on positives, with gentle suggestions for next week.
     """
-    json_str = json.dumps(summary, default=str)
-    GROQ_API_URL = "https://api.groq.com/openai/v1/chat/completions"
-    GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 
+
+def build_weekly_report(user_id, week_end):
+    # Runs on the report job pool: gather the week's data, ask Groq for the
+    # write-up and render it. Raises on LLM failure so the job can be retried.
+    today = datetime.strptime(week_end, '%Y-%m-%d').date()
+    start_date = today - timedelta(days=6)
+
+    # One aggregation for the profile and every log in the window
+    summary = user_week_snapshot(mongo.db, user_id, str(start_date), str(today))
+    summary['workout_summary'] = workout_store.summary(user_id, today)
+
+    json_str = json.dumps(summary, default=str)
     messages = [
         {"role": "system", "content": "You are a helpful healthcare assistant."},
-        {"role": "user", "content": report_prompt + "\n\n" + json_str}
+        {"role": "user", "content": WEEKLY_REPORT_PROMPT + "\n\n" + json_str}
     ]
     headers = {
         "Authorization": f"Bearer {GROQ_API_KEY}",
@@ -910,66 +1487,87 @@ def download_weekly_report_pdf():
         "temperature": 0.6
     }
 
-    try:
-        response = requests.post(GROQ_API_URL, headers=headers, json=data, timeout=30)
-        response.raise_for_status()
-        resp_json = response.json()
-        if 'choices' in resp_json and len(resp_json['choices']) > 0:
-            report_text = resp_json['choices'][0]['message']['content']
-        else:
-            report_text = "Weekly report could not be generated."
+    response = http_client.groq.post(GROQ_API_URL, headers=headers, json=data)
+    response.raise_for_status()
+    resp_json = response.json()
+    if 'choices' in resp_json and len(resp_json['choices']) > 0:
+        report_text = resp_json['choices'][0]['message']['content']
+    else:
+        report_text = "Weekly report could not be generated."
+    return pdf_render.render_weekly_report(report_text)
 
-    except Exception as e:
-        print("Groq AI error:", e)
-        report_text = "Weekly report could not be generated due to error."
-
-    # Generate PDF
-    buffer = io.BytesIO()
-    p = canvas.Canvas(buffer, pagesize=A4)
-    width, height = A4
-
-    # Add HORMOCARE+ heading
-    p.setFont("Helvetica-Bold", 30)
-    p.drawCentredString(width / 2, height - 70, "HORMOCARE+")
-
-    # Draw line below heading
-    p.setLineWidth(2)
-    p.line(width * 0.2, height - 85, width * 0.8, height - 85)
-
-    # Prepare lines for report
-    # (Simple line splitting, but you could use more advanced layout/wrapping for long content)
-    y = height - 115
-    text_object = p.beginText()
-    text_object.setTextOrigin(60, y)
-    text_object.setFont("Helvetica", 13)
-    for line in report_text.splitlines():
-        # Handle large blocks or bulleted lists gracefully
-        # If using Markdown bullets/digits, you can format differently
-        if line.strip().startswith(('1.', '2.', '3.', '4.', '5.', '6.')):
-            text_object.setFont("Helvetica-Bold", 15)
-        elif line.strip().startswith('-'):
-            text_object.setFont("Helvetica", 13)
-        else:
-            text_object.setFont("Helvetica", 13)
-        text_object.textLine(line)
-        y -= 15
-        if y < 100:
-            p.drawText(text_object)
-            p.showPage()
-            y = height - 80
-            text_object = p.beginText()
-            text_object.setTextOrigin(60, y)
-            text_object.setFont("Helvetica", 13)
-    p.drawText(text_object)
-    p.save()
-    buffer.seek(0)
+
+report_jobs = ReportJobs(
+    mongo.db.report_jobs, build_weekly_report,
+    max_workers=int(os.getenv('REPORT_WORKERS', 2))
+)
+
+
+def report_job_json(job):
+    return {
+        'job_id': job['_id'],
+        'status': job['status'],
+        'week_end': job.get('week_end'),
+        'error': job.get('error'),
+        'status_url': url_for('weekly_report_job', job_id=job['_id']),
+        'download_url': url_for('weekly_report_job_pdf', job_id=job['_id']) if job['status'] == 'done' else None
+    }
+
+
+def own_report_job(job_id):
+    # Job ids start with the owner's user id
+    return job_id.split(':', 1)[0] == session['user_id']
+
+
+@app.route('/weekly_report/jobs', methods=['POST'])
+@login_required
+def submit_weekly_report():
+    job = report_jobs.submit(session['user_id'], str(datetime.utcnow().date()))
+    return jsonify({'success': True, **report_job_json(job)}), 202
+
+
+REPORT_POLL_SECONDS = 2
+
+
+@app.route('/weekly_report/jobs/<job_id>', methods=['GET'])
+@login_required
+def weekly_report_job(job_id):
+    if not own_report_job(job_id):
+        return jsonify({'success': False, 'message': 'Report not found'}), 404
+    job = report_jobs.status(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Report not found'}), 404
+    response = jsonify({'success': True, **report_job_json(job)})
+    if job['status'] not in ('done', 'failed'):
+        # Plain polling: no request thread is held while the report builds
+        response.headers['Retry-After'] = str(REPORT_POLL_SECONDS)
+    return response
+
+
+@app.route('/weekly_report/jobs/<job_id>/pdf', methods=['GET'])
+@login_required
+def weekly_report_job_pdf(job_id):
+    pdf_bytes = report_jobs.pdf(job_id) if own_report_job(job_id) else None
+    if pdf_bytes is None:
+        return jsonify({'success': False, 'message': 'Report not ready'}), 404
     return send_file(
-        buffer,
+        io.BytesIO(pdf_bytes),
         as_attachment=True,
         download_name="weekly_report.pdf",
         mimetype='application/pdf'
     )
 
+
+@app.route('/download_weekly_report_pdf', methods=['GET'])
+@login_required
+def download_weekly_report_pdf():
+    # Serves this week's report when it is already built, otherwise queues it
+    job = report_jobs.submit(session['user_id'], str(datetime.utcnow().date()))
+    if job['status'] == 'done':
+        return weekly_report_job_pdf(job['_id'])
+    return jsonify({'success': True, **report_job_json(job)}), 202
+
+
 if __name__ == '__main__':
     # Run with debug=False in production
     app.run(debug=True)
@@ -0,0 +1,185 @@
+# Cycle history, statistics and next-period predictions.
+#
+# Period starts are logged in several places (the `cycles` collection written by
+# /add_cycle and /record_period, the `cycle` collection from the predictor form,
+# users.last_period_date, and legacy `cycles` arrays on user documents that
+# `flask backfill-cycles` has not moved yet). load_histories() merges them into
+# one sorted list of start days per user.
+#
+# Predictions are computed for many users at once: the last WINDOW cycle
+# lengths of every user go into one NaN-padded matrix, and the mean, variance,
+# predicted windows and irregularity flags are column operations over it. The
+# user's self-reported cycle_length (or 28 days) acts as a prior worth
+# PRIOR_WEIGHT cycles, so a short history is pulled towards it.
+
+from datetime import date, datetime
+
+import numpy as np
+from bson.objectid import ObjectId
+
+WINDOW = 6                # most recent cycles used for the rolling statistics
+DEFAULT_LENGTH = 28
+PRIOR_WEIGHT = 2          # the prior counts as this many observed cycles
+PRIOR_SD = 3.0            # days; typical cycle-to-cycle variation
+MIN_GAP = 10              # starts closer than this are the same period logged twice
+MIN_LENGTH, MAX_LENGTH = 15, 90   # gaps outside this are missed logs, not cycles
+Z_90 = 1.645              # two-sided 90% interval
+
+# Irregularity thresholds (days), following the usual clinical definitions
+IRREGULAR_SD = 7          # cycle-to-cycle variation above ~7 days
+SHORT_MEAN = 21
+LONG_MEAN = 35            # oligomenorrhoea, a common PCOS marker
+
+
+def to_day(value):
+    # 'YYYY-MM-DD' string, date or datetime -> proleptic ordinal, or None
+    if isinstance(value, (date, datetime)):
+        return value.toordinal()
+    if isinstance(value, str):
+        try:
+            return datetime.strptime(value[:10], '%Y-%m-%d').toordinal()
+        except ValueError:
+            return None
+    return None
+
+
+def merge_starts(days):
+    # Sorted unique period starts, collapsing duplicate logs of one period
+    starts = []
+    for day in sorted(d for d in days if d is not None):
+        if not starts or day - starts[-1] >= MIN_GAP:
+            starts.append(day)
+    return starts
+
+
+def load_histories(db, user_ids=None):
+    # {user_id (str): {'starts': [ordinal days], 'reported_length': int or None}}
+    match = {} if user_ids is None else {'_id': {'$in': [ObjectId(u) for u in user_ids]}}
+    histories = {}
+    raw = {}
+    for user in db.users.find(match, {'cycles.start': 1, 'last_period_date': 1, 'cycle_length': 1}):
+        uid = str(user['_id'])
+        days = [to_day(c.get('start')) for c in user.get('cycles') or [] if isinstance(c, dict)]
+        days.append(to_day(user.get('last_period_date')))
+        raw[uid] = days
+        try:
+            reported = int(user.get('cycle_length'))
+        except (TypeError, ValueError):
+            reported = None
+        histories[uid] = {'starts': [], 'reported_length': reported}
+
+    id_match = {} if user_ids is None else {'user_id': {'$in': [str(u) for u in user_ids]}}
+    for name, field in (('cycles', 'start_date'), ('cycle', 'last_period_date')):
+        for doc in db[name].aggregate([
+            {'$match': id_match},
+            {'$group': {'_id': '$user_id', 'days': {'$addToSet': f'${field}'}}},
+        ], allowDiskUse=True):
+            if str(doc['_id']) in raw:
+                raw[str(doc['_id'])].extend(to_day(d) for d in doc['days'])
+
+    for uid, days in raw.items():
+        histories[uid]['starts'] = merge_starts(days)
+    return histories
+
+
+def user_id_batches(db, batch_size=5000):
+    # Yields lists of user ids (str) in _id order, batch_size at a time
+    last_id = None
+    while True:
+        query = {} if last_id is None else {'_id': {'$gt': last_id}}
+        ids = [u['_id'] for u in db.users.find(query, {'_id': 1}).sort('_id', 1).limit(batch_size)]
+        if not ids:
+            return
+        yield [str(i) for i in ids]
+        last_id = ids[-1]
+
+
+def predict_many(histories, today=None, horizon=3):
+    # histories: list of {'starts': [...], 'reported_length': ...}, one per user.
+    # Returns a dict of arrays, one row per user (see predict() for the fields).
+    n = len(histories)
+    today = to_day(today or datetime.utcnow())
+    lengths = np.full((n, WINDOW), np.nan)
+    last = np.full(n, np.nan)
+    prior = np.full(n, float(DEFAULT_LENGTH))
+    for i, h in enumerate(histories):
+        starts = h['starts']
+        if starts:
+            last[i] = starts[-1]
+        gaps = [b - a for a, b in zip(starts, starts[1:]) if MIN_LENGTH <= b - a <= MAX_LENGTH]
+        if gaps:
+            gaps = gaps[-WINDOW:]
+            lengths[i, WINDOW - len(gaps):] = gaps
+        if h.get('reported_length') and MIN_LENGTH <= h['reported_length'] <= MAX_LENGTH:
+            prior[i] = h['reported_length']
+
+    observed = ~np.isnan(lengths)
+    count = observed.sum(axis=1)
+    total = np.where(observed, lengths, 0).sum(axis=1)
+    mean = (PRIOR_WEIGHT * prior + total) / (PRIOR_WEIGHT + count)
+    # Sample variance of the observed cycles, shrunk towards PRIOR_SD^2 the same way
+    sq_dev = np.where(observed, (lengths - mean[:, None]) ** 2, 0).sum(axis=1)
+    var = (PRIOR_WEIGHT * PRIOR_SD ** 2 + sq_dev) / (PRIOR_WEIGHT + np.maximum(count - 1, 0))
+    sd = np.sqrt(var)
+
+    # Next `horizon` predicted starts; uncertainty grows with each cycle ahead.
+    # Cycles whose whole window is already behind us are skipped.
+    has_last = ~np.isnan(last)
+    elapsed = np.where(has_last, today - last, 0)
+    skipped = np.maximum(np.floor((elapsed - Z_90 * sd) / mean), 0)
+    steps = skipped[:, None] + np.arange(1, horizon + 1)[None, :]
+    centre = last[:, None] + steps * mean[:, None]
+    spread = Z_90 * sd[:, None] * np.sqrt(steps)
+
+    irregular = (count >= 3) & ((sd > IRREGULAR_SD) | (mean > LONG_MEAN) | (mean < SHORT_MEAN))
+    return {
+        'cycles_observed': count,
+        'mean_length': mean,
+        'sd_length': sd,
+        'cycle_day': np.where(has_last, elapsed + 1, np.nan),
+        'predicted_start': centre,
+        'window_start': np.floor(centre - spread),
+        'window_end': np.ceil(centre + spread),
+        'irregular': irregular & has_last,
+        'long_cycles': (count >= 3) & (mean > LONG_MEAN),
+    }
+
+
+def _day_str(value):
+    return date.fromordinal(int(round(value))).isoformat()
+
+
+def row_json(result, i):
+    # One user's prediction from predict_many() as JSON-friendly values
+    if np.isnan(result['predicted_start'][i, 0]):
+        return {'has_history': False}
+    return {
+        'has_history': True,
+        'cycles_observed': int(result['cycles_observed'][i]),
+        'mean_cycle_length': round(float(result['mean_length'][i]), 1),
+        'cycle_length_sd': round(float(result['sd_length'][i]), 1),
+        'cycle_day': int(result['cycle_day'][i]),
+        'predicted_date': _day_str(result['predicted_start'][i, 0]),
+        'windows': [
+            {'predicted': _day_str(c), 'earliest': _day_str(lo), 'latest': _day_str(hi)}
+            for c, lo, hi in zip(result['predicted_start'][i], result['window_start'][i], result['window_end'][i])
+        ],
+        'irregular': bool(result['irregular'][i]),
+        'long_cycles': bool(result['long_cycles'][i]),
+    }
+
+
+def predict(history, today=None, horizon=3):
+    return row_json(predict_many([history], today, horizon), 0)
+
+
+def next_reminder_dates(result, days_before=2):
+    # Reminder day per user (ordinal), NaN when there is no history
+    return result['window_start'][:, 0] - days_before
+
+
+def reminder_due(result, today=None, days_before=2):
+    # Boolean mask of users whose reminder falls on `today`
+    today = to_day(today or datetime.utcnow())
+    return next_reminder_dates(result, days_before) == today
+
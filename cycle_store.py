@@ -0,0 +1,143 @@
+# Period/cycle records: one document per cycle in the `cycles` collection,
+# indexed on (user_id, start_date) (see db_indexes), instead of an ever-growing
+# `cycles` array on the user document.
+#
+# Documents written by /record_period and /add_cycle share one shape:
+#   user_id (str), start_date / end_date ('YYYY-MM-DD'), marked_ended,
+#   created_at, source ('record_period' | 'add_cycle') and, for add_cycle,
+#   duration, cycle_length, flow_intensity, symptoms.
+# A regular collection is used rather than a Mongo time-series one because
+# cycles are updated in place when a period is marked ended.
+#
+# backfill() copies legacy users.cycles arrays across in small batches while
+# the app keeps running; it is idempotent and safe to re-run or interrupt.
+
+import time
+from datetime import datetime, timedelta
+
+import pymongo
+from bson.objectid import ObjectId
+
+SUMMARY_FIELDS = {'_id': 0, 'start_date': 1, 'end_date': 1, 'duration': 1, 'cycle_length': 1,
+                  'flow_intensity': 1, 'symptoms': 1, 'marked_ended': 1}
+
+
+def legacy_entry(user_id, entry):
+    # users.cycles[] item -> cycles document
+    start = entry.get('start')
+    end = entry.get('end')
+    if not end and start and entry.get('duration'):
+        try:
+            end = (datetime.strptime(start, "%Y-%m-%d") + timedelta(days=int(entry['duration']))).strftime("%Y-%m-%d")
+        except (TypeError, ValueError):
+            end = None
+    return {
+        'user_id': user_id,
+        'start_date': start,
+        'end_date': end,
+        'duration': entry.get('duration'),
+        'cycle_length': entry.get('cycle_length'),
+        'flow_intensity': entry.get('flow_intensity'),
+        'symptoms': entry.get('symptoms'),
+        'marked_ended': True,
+        'source': 'add_cycle',
+        'created_at': entry.get('created_at'),
+    }
+
+
+class CycleStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    # --- writes ---
+
+    def add_cycle(self, user_id, start_date, duration, cycle_length, flow_intensity=None, symptoms=None):
+        end = datetime.strptime(start_date, "%Y-%m-%d") + timedelta(days=duration)
+        self.collection.insert_one({
+            'user_id': str(user_id),
+            'start_date': start_date,
+            'end_date': end.strftime("%Y-%m-%d"),
+            'duration': duration,
+            'cycle_length': cycle_length,
+            'flow_intensity': flow_intensity,
+            'symptoms': symptoms,
+            'marked_ended': True,
+            'source': 'add_cycle',
+            'created_at': datetime.utcnow(),
+        })
+
+    def record_start(self, user_id, start_date):
+        self.collection.insert_one({
+            'user_id': str(user_id),
+            'start_date': start_date,
+            'marked_ended': False,
+            'source': 'record_period',
+            'created_at': datetime.utcnow(),
+        })
+
+    def end(self, user_id, cycle_id, end_date=None):
+        # Mark one of the user's own periods ended; False if no such cycle
+        end_date = end_date or datetime.utcnow()
+        result = self.collection.update_one(
+            {'_id': ObjectId(cycle_id), 'user_id': str(user_id)},
+            {'$set': {'marked_ended': True, 'end_date': end_date.strftime("%Y-%m-%d")}}
+        )
+        return result.matched_count == 1
+
+    # --- reads ---
+
+    def active(self, user_id):
+        # Latest period that has not been marked ended
+        return self.collection.find_one(
+            {'user_id': str(user_id), 'marked_ended': False}, sort=[('start_date', -1)]
+        )
+
+    def recent(self, user_id, n=12, projection=SUMMARY_FIELDS):
+        # The user's last n cycles, newest first
+        return list(self.collection.find({'user_id': str(user_id)}, projection)
+                    .sort('start_date', -1).limit(n))
+
+    def in_range(self, user_id, start, end, projection=SUMMARY_FIELDS):
+        # Cycles starting between start and end ('YYYY-MM-DD', inclusive), oldest first
+        return list(self.collection.find(
+            {'user_id': str(user_id), 'start_date': {'$gte': start, '$lte': end}}, projection
+        ).sort('start_date', 1))
+
+    # --- migration ---
+
+    def backfill(self, users, batch_size=200, pause=0.1, log=print):
+        # Move users.cycles arrays into this collection. Each entry is upserted
+        # on (user_id, start_date, created_at), so re-runs never duplicate, and
+        # the array is only removed if it still has the length that was copied.
+        moved_users = moved_cycles = 0
+        last_id = None
+        while True:
+            query = {'cycles': {'$exists': True}}
+            if last_id is not None:
+                query['_id'] = {'$gt': last_id}
+            batch = list(users.find(query, {'cycles': 1}).sort('_id', 1).limit(batch_size))
+            if not batch:
+                break
+            for user in batch:
+                user_id = str(user['_id'])
+                entries = [e for e in user.get('cycles') or [] if isinstance(e, dict)]
+                ops = []
+                for entry in entries:
+                    doc = legacy_entry(user_id, entry)
+                    key = {'user_id': user_id, 'start_date': doc['start_date'],
+                           'created_at': doc['created_at'], 'source': 'add_cycle'}
+                    ops.append(pymongo.UpdateOne(key, {'$setOnInsert': doc}, upsert=True))
+                if ops:
+                    self.collection.bulk_write(ops, ordered=False)
+                result = users.update_one(
+                    {'_id': user['_id'], 'cycles': {'$size': len(user.get('cycles') or [])}},
+                    {'$unset': {'cycles': ''}}
+                )
+                if result.modified_count:
+                    moved_users += 1
+                    moved_cycles += len(entries)
+            last_id = batch[-1]['_id']
+            log(f"Backfilled {moved_cycles} cycles from {moved_users} users (up to {last_id})")
+            if pause:
+                time.sleep(pause)  # leave headroom for live traffic
+        return moved_users, moved_cycles
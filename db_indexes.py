@@ -0,0 +1,162 @@
+# Index registry for every Mongo collection the app queries.
+#
+# INDEXES declares the indexes each collection needs. ensure_indexes() creates
+# them (idempotent; run at deploy time with `flask ensure-indexes`), and
+# verify_indexes() reports any that are missing (run once at startup).
+#
+# QUERY_SHAPES lists the filter/sort of every query the routes and jobs issue,
+# with placeholder values. check_query_plans() runs explain() on each and
+# reports the ones whose winning plan contains a COLLSCAN. To check a scratch
+# database on a local mongod:
+#   python db_indexes.py mongodb://localhost:27017/hormocare_plancheck
+# which creates the indexes there first and exits non-zero on any COLLSCAN.
+
+import sys
+from datetime import datetime
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient
+from pymongo.errors import OperationFailure
+
+INDEXES = {
+    'users': [
+        IndexModel([('email', ASCENDING)], name='email', unique=True),
+    ],
+    'diet': [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date', unique=True),
+    ],
+    'activity': [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date', unique=True),
+    ],
+    'journal': [
+        IndexModel([('user_id', ASCENDING), ('date', ASCENDING)], name='user_date', unique=True),
+    ],
+    'weekly_diet': [
+        IndexModel([('user_id', ASCENDING), ('week_start', ASCENDING)], name='user_week', unique=True),
+        IndexModel([('user_id', ASCENDING), ('days.date', ASCENDING)], name='user_day'),
+    ],
+    'cycles': [
+        IndexModel([('user_id', ASCENDING), ('start_date', DESCENDING)], name='user_start'),
+        IndexModel([('user_id', ASCENDING), ('marked_ended', ASCENDING), ('start_date', DESCENDING)],
+                   name='user_open_start'),
+    ],
+    'cycle': [
+        IndexModel([('user_id', ASCENDING), ('_id', DESCENDING)], name='user_latest'),
+    ],
+    'workouts': [
+        IndexModel([('user_id', ASCENDING), ('timestamp', DESCENDING), ('_id', DESCENDING)], name='user_time'),
+    ],
+    'food_nutrition': [
+        IndexModel([('food_name', ASCENDING)], name='food_name'),
+    ],
+    'food_nutrition_diet': [
+        IndexModel([('food_name', ASCENDING)], name='food_name'),
+    ],
+}
+
+_USER = 'u' * 24
+_OID = ObjectId()
+_DAY = '2024-01-01'
+
+# (where, collection, filter, sort). Lookups by _id are left out: the _id index
+# always exists. Full-collection batch scans (nightly jobs) are left out too.
+QUERY_SHAPES = [
+    ('register/login', 'users', {'email': 'a@b.c'}, None),
+    ('dashboard', 'diet', {'user_id': _USER, 'date': _DAY}, None),
+    ('dashboard', 'activity', {'user_id': _USER, 'date': _DAY}, None),
+    ('journal', 'journal', {'user_id': _USER}, [('date', DESCENDING)]),
+    ('journal POST', 'journal', {'user_id': _USER, 'date': _DAY}, None),
+    ('download_weekly_diet', 'weekly_diet', {'user_id': _USER}, None),
+    ('diet / diet_today', 'weekly_diet', {'user_id': _USER, 'days.date': _DAY}, None),
+    ('create_weekly_diet', 'weekly_diet', {'user_id': _USER, 'week_start': _DAY}, None),
+    ('get_active_period', 'cycles', {'user_id': _USER, 'marked_ended': False}, [('start_date', DESCENDING)]),
+    ('cycles recent', 'cycles', {'user_id': _USER}, [('start_date', DESCENDING)]),
+    ('cycles range', 'cycles', {'user_id': _USER, 'start_date': {'$gte': _DAY, '$lte': _DAY}},
+     [('start_date', ASCENDING)]),
+    ('weekly report cycles', 'cycles', {'user_id': _USER, '$or': [
+        {'start_date': {'$gte': _DAY, '$lte': _DAY}}, {'end_date': {'$gte': _DAY, '$lte': _DAY}}]}, None),
+    ('backfill-cycles', 'cycles', {'user_id': _USER, 'start_date': _DAY, 'created_at': datetime(2024, 1, 1),
+                                   'source': 'add_cycle'}, None),
+    ('cycle history', 'cycles', {'user_id': {'$in': [_USER]}}, None),
+    ('cycle history', 'cycle', {'user_id': {'$in': [_USER]}}, None),
+    ('predictor', 'cycle', {'user_id': _USER}, [('_id', DESCENDING)]),
+    ('weekly report activity', 'activity', {'user_id': _USER, 'date': {'$gte': _DAY, '$lte': _DAY}},
+     [('date', ASCENDING)]),
+    ('weekly report diet', 'diet', {'user_id': _USER, 'date': {'$gte': _DAY, '$lte': _DAY}}, [('date', ASCENDING)]),
+    ('diet history', 'diet', {'user_id': _USER, 'date': {'$gte': _DAY, '$lte': _DAY}}, None),
+    ('weekly report journal', 'journal', {'user_id': _USER, 'date': {'$gte': _DAY, '$lte': _DAY}},
+     [('date', ASCENDING)]),
+    ('activity recompute', 'activity', {'user_id': {'$in': [_USER]}, 'activities.code': {'$exists': True}}, None),
+    ('workouts', 'workouts', {'user_id': _USER}, [('timestamp', DESCENDING), ('_id', DESCENDING)]),
+    ('workouts page', 'workouts', {'user_id': _USER, '$or': [
+        {'timestamp': {'$lt': datetime(2024, 1, 1)}},
+        {'timestamp': datetime(2024, 1, 1), '_id': {'$lt': _OID}}]}, [('timestamp', DESCENDING), ('_id', DESCENDING)]),
+    ('food by name', 'food_nutrition', {'food_name': {'$regex': '^rice$', '$options': 'i'}}, None),
+    ('food by name', 'food_nutrition_diet', {'food_name': {'$regex': '^rice$', '$options': 'i'}}, None),
+]
+
+
+def _key(index_model):
+    return list(index_model.document['key'].items())
+
+
+def ensure_indexes(db, collections=None):
+    # Returns a list of (collection, index name, error) for indexes that could
+    # not be built, e.g. a unique index over existing duplicates
+    failures = []
+    for name, models in INDEXES.items():
+        if collections is not None and name not in collections:
+            continue
+        for model in models:
+            try:
+                db[name].create_indexes([model])
+            except OperationFailure as e:
+                failures.append((name, model.document['name'], str(e)))
+    return failures
+
+
+def verify_indexes(db):
+    # [(collection, index name)] declared in INDEXES but absent from the server
+    missing = []
+    for name, models in INDEXES.items():
+        existing = [list(ix['key'].items()) for ix in db[name].list_indexes()]
+        for model in models:
+            if _key(model) not in existing:
+                missing.append((name, model.document['name']))
+    return missing
+
+
+def _stages(plan):
+    yield plan.get('stage')
+    for child in [plan.get('inputStage')] + plan.get('inputStages', []):
+        if child:
+            yield from _stages(child)
+    # Plans built by the slot-based engine nest the classic plan one level down
+    if 'queryPlan' in plan:
+        yield from _stages(plan['queryPlan'])
+
+
+def check_query_plans(db):
+    # [(where, collection, filter)] for every query shape planned as a COLLSCAN
+    offenders = []
+    for where, collection, query, sort in QUERY_SHAPES:
+        cursor = db[collection].find(query).limit(1)
+        if sort:
+            cursor = cursor.sort(sort)
+        plan = cursor.explain()['queryPlanner']['winningPlan']
+        if 'COLLSCAN' in _stages(plan):
+            offenders.append((where, collection, query))
+    return offenders
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 2:
+        sys.exit("usage: python db_indexes.py mongodb://localhost:27017/<scratch db>")
+    db = MongoClient(sys.argv[1]).get_default_database()
+    for name, index, error in ensure_indexes(db):
+        print(f"Could not create {name}.{index}: {error}")
+    offenders = check_query_plans(db)
+    for where, collection, query in offenders:
+        print(f"COLLSCAN: {where} -> {collection}.find({query})")
+    print(f"Checked {len(QUERY_SHAPES)} query shapes, {len(offenders)} collection scans.")
+    sys.exit(1 if offenders else 0)
@@ -0,0 +1,196 @@
+# Today's food log as small deltas instead of whole-day rewrites.
+#
+# A diet document holds foods.<meal> as a list of items
+#   {item_id, food_id, food_name, servings, calories, protein, carbs, fats}
+# plus the day's totals (calories_consumed, protein, carbs, fats). Clients send
+# batches of operations
+#   {'op': 'add', 'meal': ..., 'item_id': ..., 'food_id': ..., 'servings': 1}
+#   {'op': 'remove', 'meal': ..., 'item_id': ...}
+# with an idempotency key. Nutrition comes from the food catalog, never from
+# the client, and each batch becomes $push/$pull on the meal lists with a
+# matching $inc on the totals. Every update is guarded by the state it expects
+# (removed items still present, added item ids not yet present), so concurrent
+# or repeated batches can never double-count; a batch whose key is already in
+# applied_ops is not applied again. Mongo rejects $push and $pull on the same
+# list in one update, so a batch that adds to and removes from one meal is
+# applied as two updates. Each applied update's change in totals is passed to
+# on_change (the weekly rollups in diet_rollup).
+
+from datetime import datetime
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+MEALS = ['breakfast', 'lunch', 'snacks', 'dinner']
+TOTALS = {'calories_consumed': 'energy_kcal', 'protein': 'protein_g', 'carbs': 'carb_g', 'fats': 'fat_g'}
+ITEM_NUTRIENTS = {'calories': 'calories_consumed', 'protein': 'protein', 'carbs': 'carbs', 'fats': 'fats'}
+MAX_OPS = 50
+APPLIED_OPS_KEPT = 50   # idempotency keys remembered per day
+MAX_ATTEMPTS = 3
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def validate_ops(ops):
+    if not isinstance(ops, list) or not ops or len(ops) > MAX_OPS:
+        raise ValueError(f"ops must be a list of 1 to {MAX_OPS} operations")
+    clean = []
+    for op in ops:
+        if not isinstance(op, dict) or op.get('op') not in ('add', 'remove'):
+            raise ValueError("each op needs 'op': 'add' or 'remove'")
+        if op.get('meal') not in MEALS:
+            raise ValueError(f"meal must be one of {', '.join(MEALS)}")
+        if not isinstance(op.get('item_id'), str) or not 0 < len(op['item_id']) <= 64:
+            raise ValueError("each op needs an item_id")
+        if op['op'] == 'add':
+            servings = _number(op.get('servings', 1))
+            if not 0 < servings <= 20 or not op.get('food_id'):
+                raise ValueError("add needs a food_id and 0 < servings <= 20")
+            clean.append({'op': 'add', 'meal': op['meal'], 'item_id': op['item_id'],
+                          'food_id': str(op['food_id']), 'servings': servings})
+        else:
+            clean.append({'op': 'remove', 'meal': op['meal'], 'item_id': op['item_id']})
+    return clean
+
+
+class DietLog:
+    def __init__(self, collection, resolve_foods, on_change=None):
+        # resolve_foods([food ids]) -> {ObjectId: food}; see app.resolve_foods
+        # on_change(user_id, day, {total: delta}, new_day)
+        self.collection = collection
+        self.resolve_foods = resolve_foods
+        self.on_change = on_change
+
+    def _day(self, user_id, day):
+        return self.collection.find_one(
+            {'user_id': str(user_id), 'date': day},
+            {'foods': 1, 'applied_ops': 1, **{total: 1 for total in TOTALS}}
+        )
+
+    def _ensure_day(self, user_id, day, doc):
+        # Create the day's document, or turn a legacy `foods` list into a dict
+        if doc is None:
+            try:
+                result = self.collection.update_one(
+                    {'user_id': str(user_id), 'date': day},
+                    {'$setOnInsert': {'foods': {}, 'applied_ops': [], **{total: 0 for total in TOTALS},
+                                      'created_at': datetime.utcnow()}},
+                    upsert=True
+                )
+            except DuplicateKeyError:
+                # A concurrent first write created the day (unique user_date index)
+                return
+            if result.upserted_id is not None and self.on_change:
+                self.on_change(user_id, day, {}, True)
+        elif not isinstance(doc.get('foods'), dict):
+            self.collection.update_one(
+                {'_id': doc['_id'], 'foods': doc.get('foods')},
+                {'$set': {'foods': {'other': doc['foods']} if doc.get('foods') else {}}}
+            )
+
+    def items(self, foods):
+        # Build catalog-priced items for the add ops; raises on unknown foods
+        try:
+            ids = {op['food_id']: ObjectId(op['food_id']) for op in foods}
+        except InvalidId:
+            raise ValueError("invalid food_id")
+        catalog = self.resolve_foods(set(ids.values()))
+        items = {}
+        for op in foods:
+            food = catalog.get(ids[op['food_id']])
+            if food is None or '_id' not in food:
+                raise ValueError(f"unknown food {op['food_id']}")
+            item = {'item_id': op['item_id'], 'food_id': op['food_id'], 'food_name': food['food_name'],
+                    'servings': op['servings']}
+            for field, total in ITEM_NUTRIENTS.items():
+                item[field] = round(_number(food.get(TOTALS[total])) * op['servings'], 2)
+            items[op['item_id']] = item
+        return items
+
+    def _phases(self, ops, doc, items):
+        # Net the batch against the stored day and split it into conflict-free updates
+        stored = {}
+        for meal, meal_items in (doc.get('foods') or {}).items():
+            for item in meal_items if isinstance(meal_items, list) else []:
+                if isinstance(item, dict) and item.get('item_id'):
+                    stored[item['item_id']] = (meal, item)
+        adds, removes = {}, {}
+        for op in ops:
+            if op['op'] == 'add':
+                if op['item_id'] not in stored:
+                    adds[op['item_id']] = op['meal']
+            elif op['item_id'] in adds:
+                del adds[op['item_id']]          # added and removed in the same batch
+            elif op['item_id'] in stored and stored[op['item_id']][0] == op['meal']:
+                removes[op['item_id']] = stored[op['item_id']]
+
+        first, second = {'push': {}, 'pull': {}, 'inc': {}}, {'push': {}, 'pull': {}, 'inc': {}}
+        for item_id, (meal, item) in removes.items():
+            first['pull'].setdefault(meal, []).append(item_id)
+            for field, total in ITEM_NUTRIENTS.items():
+                first['inc'][total] = first['inc'].get(total, 0) - _number(item.get(field))
+        for item_id, meal in adds.items():
+            phase = second if meal in first['pull'] else first
+            phase['push'].setdefault(meal, []).append(items[item_id])
+            for field, total in ITEM_NUTRIENTS.items():
+                phase['inc'][total] = phase['inc'].get(total, 0) + items[item_id][field]
+        return [p for p in (first, second) if p['push'] or p['pull']]
+
+    def _apply(self, user_id, day, phase, key=None):
+        query = {'user_id': str(user_id), 'date': day}
+        for meal, item_ids in phase['pull'].items():
+            query[f'foods.{meal}.item_id'] = {'$all': item_ids}
+        for meal, new_items in phase['push'].items():
+            query[f'foods.{meal}.item_id'] = {'$nin': [item['item_id'] for item in new_items]}
+        update = {'$set': {'updated_at': datetime.utcnow()}}
+        if phase['push']:
+            update['$push'] = {f'foods.{meal}': {'$each': new_items} for meal, new_items in phase['push'].items()}
+        if phase['pull']:
+            update['$pull'] = {f'foods.{meal}': {'item_id': {'$in': ids}} for meal, ids in phase['pull'].items()}
+        if phase['inc']:
+            update['$inc'] = {total: round(delta, 2) for total, delta in phase['inc'].items()}
+        if key is not None:
+            update.setdefault('$push', {})['applied_ops'] = {'$each': [key], '$slice': -APPLIED_OPS_KEPT}
+        if self.collection.update_one(query, update).modified_count != 1:
+            return False
+        if phase['inc'] and self.on_change:
+            self.on_change(user_id, day, phase['inc'], False)
+        return True
+
+    def apply(self, user_id, day, key, ops):
+        # Apply a batch once per idempotency key; returns the day's log
+        ops = validate_ops(ops)
+        if not isinstance(key, str) or not 0 < len(key) <= 64:
+            raise ValueError("idempotency_key required")
+        items = self.items([op for op in ops if op['op'] == 'add'])
+
+        doc = self._day(user_id, day)
+        self._ensure_day(user_id, day, doc)
+        for _ in range(MAX_ATTEMPTS):
+            doc = self._day(user_id, day)
+            if key in (doc.get('applied_ops') or []):
+                break
+            phases = self._phases(ops, doc, items)
+            if not phases:
+                break
+            # The key is recorded with the batch's last update
+            if all(self._apply(user_id, day, phase, key if n == len(phases) - 1 else None)
+                   for n, phase in enumerate(phases)):
+                break
+            # Another request changed the day in between: re-read and re-net
+        return self.view(user_id, day)
+
+    def view(self, user_id, day):
+        doc = self._day(user_id, day) or {}
+        foods = doc.get('foods') if isinstance(doc.get('foods'), dict) else {}
+        return {
+            'date': day,
+            'foods': {meal: foods.get(meal, []) for meal in MEALS},
+            'totals': {total: round(_number(doc.get(total)), 2) for total in TOTALS},
+        }
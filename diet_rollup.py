@@ -0,0 +1,115 @@
+# Diet history for charts.
+#
+# Daily totals already live on the per-day `diet` documents. Weekly totals are
+# kept in `diet_rollups`, one document per user per ISO week (Monday start),
+# and are bumped with $inc by every diet write (see DietRollups.add), so a
+# chart never aggregates raw logs. rebuild() recomputes the rollups from the
+# diet documents with one aggregation, for backfills and repairs.
+#
+# Series come back columnar -- one array per measure, aligned with a dates or
+# weeks array -- which is what the chart library wants and is small on the wire.
+
+from datetime import date, datetime, timedelta
+
+from pymongo import UpdateOne
+
+MEASURES = ['calories_consumed', 'protein', 'carbs', 'fats']
+
+
+def week_start(day):
+    d = datetime.strptime(day, '%Y-%m-%d').date()
+    return (d - timedelta(days=d.weekday())).isoformat()
+
+
+def deltas(before, after):
+    # Per-measure change between two versions of a diet document
+    before, after = before or {}, after or {}
+    return {m: _number(after.get(m)) - _number(before.get(m)) for m in MEASURES}
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class DietRollups:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def add(self, user_id, day, delta, new_day=False):
+        # Apply a diet write's change in totals to that day's week
+        inc = {m: round(v, 2) for m, v in delta.items() if m in MEASURES and v}
+        if new_day:
+            inc['days_logged'] = 1
+        if not inc:
+            return
+        week = week_start(day)
+        self.collection.update_one(
+            {'_id': f"{user_id}:{week}"},
+            {'$inc': inc, '$set': {'user_id': str(user_id), 'week_start': week}},
+            upsert=True
+        )
+
+    def weekly(self, user_id, weeks, today=None):
+        # Last `weeks` ISO weeks up to today's, oldest first; empty weeks are zeros
+        current = date.fromisoformat(week_start((today or datetime.utcnow().date()).isoformat()))
+        starts = [(current - timedelta(weeks=k)).isoformat() for k in range(weeks - 1, -1, -1)]
+        docs = {doc['week_start']: doc for doc in self.collection.find(
+            {'_id': {'$in': [f"{user_id}:{w}" for w in starts]}},
+            {'week_start': 1, 'days_logged': 1, **{m: 1 for m in MEASURES}}
+        )}
+        series = {'weeks': starts, 'days_logged': [int(docs.get(w, {}).get('days_logged', 0)) for w in starts]}
+        for m in MEASURES:
+            series[m] = [round(_number(docs.get(w, {}).get(m)), 1) for w in starts]
+        return series
+
+    def rebuild(self, diet, user_id=None):
+        # Recompute every week from the diet documents; returns rollups written
+        match = {'date': {'$type': 'string'}}
+        if user_id is not None:
+            match['user_id'] = str(user_id)
+        pipeline = [
+            {'$match': match},
+            {'$addFields': {'_day': {'$dateFromString': {'dateString': '$date', 'format': '%Y-%m-%d',
+                                                         'onError': None}}}},
+            {'$match': {'_day': {'$ne': None}}},
+            {'$group': {
+                '_id': {'user_id': '$user_id', 'year': {'$isoWeekYear': '$_day'}, 'week': {'$isoWeek': '$_day'}},
+                'days_logged': {'$sum': 1},
+                **{m: {'$sum': {'$convert': {'input': f'${m}', 'to': 'double', 'onError': 0, 'onNull': 0}}}
+                   for m in MEASURES},
+            }},
+        ]
+        ops = []
+        written = 0
+        for group in diet.aggregate(pipeline, allowDiskUse=True):
+            week = date.fromisocalendar(group['_id']['year'], group['_id']['week'], 1).isoformat()
+            uid = group['_id']['user_id']
+            doc = {'user_id': uid, 'week_start': week, 'days_logged': group['days_logged']}
+            doc.update({m: round(group[m], 2) for m in MEASURES})
+            ops.append(UpdateOne({'_id': f"{uid}:{week}"}, {'$set': doc}, upsert=True))
+            if len(ops) >= 1000:
+                self.collection.bulk_write(ops, ordered=False)
+                written += len(ops)
+                ops = []
+        if ops:
+            self.collection.bulk_write(ops, ordered=False)
+            written += len(ops)
+        return written
+
+
+def daily(diet, user_id, days, today=None):
+    # Last `days` days up to today, oldest first, read from the per-day documents
+    # with one indexed range query; days without a log are zeros
+    end = today or datetime.utcnow().date()
+    dates = [(end - timedelta(days=k)).isoformat() for k in range(days - 1, -1, -1)]
+    docs = {doc['date']: doc for doc in diet.find(
+        {'user_id': str(user_id), 'date': {'$gte': dates[0], '$lte': dates[-1]}},
+        {'_id': 0, 'date': 1, 'total_allowed': 1, **{m: 1 for m in MEASURES}}
+    )}
+    series = {'dates': dates, 'logged': [d in docs for d in dates]}
+    for m in MEASURES + ['total_allowed']:
+        series[m] = [round(_number(docs.get(d, {}).get(m)), 1) for d in dates]
+    return series
@@ -0,0 +1,145 @@
+# Local exercise catalog built from the JSON descriptors in static/exercises.
+#
+# The files are read and validated once at startup (or compiled into an
+# mmap-ed snapshot, see exercise_snapshot), one row per exercise. Every facet
+# value -- equipment, muscle, level, category, mechanic, force -- maps to a
+# bitset of rows, stored as a Python int, so a faceted query is an AND across
+# facets of the OR of the selected values.
+# Name search reuses the ranked prefix/trigram index from food_search.
+
+import glob
+import json
+import os
+
+from food_search import FoodSearchIndex
+
+FACETS = ['equipment', 'level', 'category', 'mechanic', 'force', 'muscle', 'primary_muscle']
+STRING_FIELDS = ['force', 'level', 'mechanic', 'equipment', 'category']
+LIST_FIELDS = ['primaryMuscles', 'secondaryMuscles', 'instructions', 'images']
+
+# Equipment values that count as "no equipment" for body-weight/HIIT lists
+BODYWEIGHT_EQUIPMENT = ['body only', None]
+
+
+def validate(doc, filename):
+    # Returns a cleaned descriptor or None (with a log line) when unusable
+    if not isinstance(doc, dict) or not isinstance(doc.get('name'), str) or not doc['name'].strip():
+        print(f"Skipping exercise {filename}: missing name")
+        return None
+    clean = {
+        'id': doc.get('id') if isinstance(doc.get('id'), str) else os.path.splitext(filename)[0],
+        'name': doc['name'].strip(),
+    }
+    for field in STRING_FIELDS:
+        value = doc.get(field)
+        clean[field] = value.strip().lower() if isinstance(value, str) and value.strip() else None
+    for field in LIST_FIELDS:
+        value = doc.get(field)
+        clean[field] = [v for v in value if isinstance(v, str)] if isinstance(value, list) else []
+    return clean
+
+
+class ExerciseCatalog:
+    # `exercises` is any sequence of descriptor dicts: a plain list when loaded
+    # from JSON, or a lazily decoding view over a compiled snapshot
+    # (see exercise_snapshot). ids, names and the facet index are precomputed.
+    def __init__(self, exercises, ids, names, index):
+        self.exercises = exercises
+        self.ids = ids
+        self.rows = {fid: i for i, fid in enumerate(ids)}
+        self.all_bits = (1 << len(ids)) - 1
+        self.index = index
+        self.names = FoodSearchIndex([{'name': name, 'row': i} for i, name in enumerate(names)])
+
+    @staticmethod
+    def build_index(exercises):
+        index = {facet: {} for facet in FACETS}
+
+        def add(facet, value, bit):
+            index[facet][value] = index[facet].get(value, 0) | bit
+
+        for i, ex in enumerate(exercises):
+            bit = 1 << i
+            for facet in STRING_FIELDS:
+                add(facet, ex[facet], bit)
+            for muscle in ex['primaryMuscles']:
+                add('primary_muscle', muscle.lower(), bit)
+                add('muscle', muscle.lower(), bit)
+            for muscle in ex['secondaryMuscles']:
+                add('muscle', muscle.lower(), bit)
+        return index
+
+    @classmethod
+    def from_exercises(cls, exercises):
+        return cls(
+            exercises, [ex['id'] for ex in exercises], [ex['name'] for ex in exercises],
+            cls.build_index(exercises)
+        )
+
+    @staticmethod
+    def parse_directory(directory):
+        exercises = []
+        for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+            try:
+                with open(path, encoding='utf-8') as f:
+                    doc = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping exercise {path}: {e}")
+                continue
+            clean = validate(doc, os.path.basename(path))
+            if clean is not None:
+                exercises.append(clean)
+        return exercises
+
+    @classmethod
+    def load(cls, directory):
+        return cls.from_exercises(cls.parse_directory(directory))
+
+    def facet_values(self):
+        # {facet: {value: count}} for building filter UIs
+        return {
+            facet: {value: bin(bits).count('1') for value, bits in values.items() if value is not None}
+            for facet, values in self.index.items()
+        }
+
+    def match_bits(self, filters):
+        # filters: {facet: value or [values]}; values within a facet are OR-ed,
+        # facets are AND-ed. None as a value matches exercises without that field.
+        bits = self.all_bits
+        for facet, values in filters.items():
+            if facet not in self.index or values in ('', [], ()):
+                continue
+            if not isinstance(values, (list, tuple, set)):
+                values = [values]
+            facet_bits = 0
+            for value in values:
+                facet_bits |= self.index[facet].get(value.lower() if isinstance(value, str) else value, 0)
+            bits &= facet_bits
+        return bits
+
+    def query(self, filters=None, q=None, limit=20, offset=0):
+        # Rows matching the facet filters; with q, ranked by name relevance
+        bits = self.match_bits(filters or {})
+        if q and q.strip():
+            ranked = [doc['row'] for doc in self.names.search(q, limit=len(self.ids))]
+            rows = [i for i in ranked if bits >> i & 1]
+        else:
+            rows = [i for i in range(len(self.ids)) if bits >> i & 1]
+        return rows[offset:offset + limit] if limit is not None else rows[offset:]
+
+    def get(self, row):
+        return self.exercises[row]
+
+    def project(self, row, fields):
+        # Subset of one descriptor; the snapshot view decodes only these fields
+        if hasattr(self.exercises, 'project'):
+            return self.exercises.project(row, fields)
+        ex = self.exercises[row]
+        return {field: ex[field] for field in fields if field in ex}
+
+    def by_id(self, exercise_id):
+        row = self.rows.get(exercise_id)
+        return None if row is None else self.exercises[row]
+
+    def __len__(self):
+        return len(self.ids)
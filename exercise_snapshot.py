@@ -0,0 +1,228 @@
+# Compiled, memory-mapped snapshot of the exercise catalog.
+#
+# Parsing ~870 JSON files in every gunicorn worker is slow and leaves each
+# worker with its own copy of every string. The snapshot is a single binary
+# file that workers mmap read-only, so the bytes live once in the page cache
+# and are shared by every process. Descriptors are decoded on access.
+#
+# Layout (little-endian uint32 unless noted):
+#   header   MAGIC (8 bytes), source fingerprint (20 bytes sha1), 4 pad bytes
+#   counts   n_exercises, n_strings, n_pool, n_facet_entries
+#   strings  n_strings + 1 offsets into the string blob
+#   records  n_exercises x RECORD_FIELDS string ids / (start, count) pool slices
+#   pool     string ids referenced by the list fields
+#   facets   n_facet_entries x (facet string id, value string id)
+#   bitsets  n_facet_entries x ceil(n_exercises / 8) bytes, rows per facet value
+#   blob     every distinct string once, utf-8
+# A string id of NONE stands for a missing value.
+#
+# Build with `python exercise_snapshot.py` (or `flask build-exercise-snapshot`);
+# load_catalog() also rebuilds automatically when the JSON sources change.
+
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+from exercise_catalog import ExerciseCatalog, FACETS, STRING_FIELDS, LIST_FIELDS
+
+MAGIC = b'HCEXSNP1'
+NONE = 0xFFFFFFFF
+HEADER = struct.Struct('<8s20s4x4I')
+SCALAR_FIELDS = ['id', 'name'] + STRING_FIELDS
+RECORD_FIELDS = len(SCALAR_FIELDS) + 2 * len(LIST_FIELDS)
+
+
+def source_fingerprint(directory):
+    # Changes whenever a descriptor is added, removed, resized or touched
+    digest = hashlib.sha1()
+    for name in sorted(os.listdir(directory)):
+        if name.endswith('.json'):
+            st = os.stat(os.path.join(directory, name))
+            digest.update(f"{name}:{st.st_mtime_ns}:{st.st_size};".encode('utf-8'))
+    return digest.digest()
+
+
+def _u32(values):
+    data = array('I', values)
+    if sys.byteorder != 'little':
+        data.byteswap()
+    return data.tobytes()
+
+
+def build(directory, path):
+    exercises = ExerciseCatalog.parse_directory(directory)
+    fingerprint = source_fingerprint(directory)
+
+    strings = {}
+
+    def intern(value):
+        if value is None:
+            return NONE
+        if value not in strings:
+            strings[value] = len(strings)
+        return strings[value]
+
+    records, pool = [], []
+    for ex in exercises:
+        records.extend(intern(ex[field]) for field in SCALAR_FIELDS)
+        for field in LIST_FIELDS:
+            records.extend((len(pool), len(ex[field])))
+            pool.extend(intern(v) for v in ex[field])
+
+    index = ExerciseCatalog.build_index(exercises)
+    width = (len(exercises) + 7) // 8
+    facet_entries, bitsets = [], []
+    for facet, values in index.items():
+        for value, bits in values.items():
+            facet_entries.extend((intern(facet), intern(value)))
+            bitsets.append(bits.to_bytes(width, 'little'))
+
+    blob, offsets = bytearray(), [0]
+    for value in strings:  # dicts keep insertion order, which matches the ids
+        blob += value.encode('utf-8')
+        offsets.append(len(blob))
+
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, fingerprint, len(exercises), len(strings), len(pool), len(facet_entries) // 2))
+        f.write(_u32(offsets))
+        f.write(_u32(records))
+        f.write(_u32(pool))
+        f.write(_u32(facet_entries))
+        f.write(b''.join(bitsets))
+        f.write(bytes(blob))
+    os.replace(tmp, path)  # atomic: concurrent workers never see a partial file
+
+
+class Snapshot:
+    # Read-only view over a snapshot file; behaves as a sequence of descriptor dicts
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._views = []  # memoryviews over the map; released by close()
+        try:
+            self._parse(path)
+        except Exception:
+            self.close()
+            raise
+
+    def _view(self, view):
+        self._views.append(view)
+        return view
+
+    def _parse(self, path):
+        buf = self._view(memoryview(self._mm))
+        magic, self.fingerprint, n_ex, n_str, n_pool, n_facets = HEADER.unpack_from(buf, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an exercise snapshot")
+        self.n = n_ex
+
+        if sys.byteorder != 'little':
+            raise ValueError("exercise snapshots require a little-endian host")
+        pos = HEADER.size
+        n_u32 = (n_str + 1) + n_ex * RECORD_FIELDS + n_pool + 2 * n_facets
+        u32 = self._view(self._view(buf[pos:pos + 4 * n_u32]).cast('I'))
+        at = 0
+        self._offsets = self._view(u32[at:at + n_str + 1])
+        at += n_str + 1
+        self._records = self._view(u32[at:at + n_ex * RECORD_FIELDS])
+        at += n_ex * RECORD_FIELDS
+        self._pool = self._view(u32[at:at + n_pool])
+        at += n_pool
+        self._facets = self._view(u32[at:at + 2 * n_facets])
+        at += 2 * n_facets
+        pos += at * 4
+        self._width = (n_ex + 7) // 8
+        self._bitsets = self._view(buf[pos:pos + n_facets * self._width])
+        pos += n_facets * self._width
+        self._blob = self._view(buf[pos:])
+
+    def close(self):
+        # Release the views (newest first) so the map itself can be closed
+        for view in reversed(self._views):
+            view.release()
+        self._views = []
+        self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def string(self, sid):
+        if sid == NONE:
+            return None
+        return str(self._blob[self._offsets[sid]:self._offsets[sid + 1]], 'utf-8')
+
+    def _field(self, row, k):
+        return self._records[row * RECORD_FIELDS + k]
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, row):
+        if not 0 <= row < self.n:
+            raise IndexError(row)
+        ex = {field: self.string(self._field(row, k)) for k, field in enumerate(SCALAR_FIELDS)}
+        k = len(SCALAR_FIELDS)
+        for field in LIST_FIELDS:
+            start, count = self._field(row, k), self._field(row, k + 1)
+            ex[field] = [self.string(sid) for sid in self._pool[start:start + count]]
+            k += 2
+        return ex
+
+    def project(self, row, fields):
+        # Decode only the requested fields of one descriptor
+        if not 0 <= row < self.n:
+            raise IndexError(row)
+        ex = {}
+        for field in fields:
+            if field in SCALAR_FIELDS:
+                ex[field] = self.string(self._field(row, SCALAR_FIELDS.index(field)))
+            elif field in LIST_FIELDS:
+                k = len(SCALAR_FIELDS) + 2 * LIST_FIELDS.index(field)
+                start, count = self._field(row, k), self._field(row, k + 1)
+                ex[field] = [self.string(sid) for sid in self._pool[start:start + count]]
+        return ex
+
+    def ids(self):
+        return [self.string(self._field(row, 0)) for row in range(self.n)]
+
+    def names(self):
+        return [self.string(self._field(row, 1)) for row in range(self.n)]
+
+    def facet_index(self):
+        index = {facet: {} for facet in FACETS}
+        for e in range(len(self._facets) // 2):
+            facet, value = self.string(self._facets[2 * e]), self.string(self._facets[2 * e + 1])
+            bits = int.from_bytes(self._bitsets[e * self._width:(e + 1) * self._width], 'little')
+            index.setdefault(facet, {})[value] = bits
+        return index
+
+
+def load_catalog(directory, path):
+    # Open the snapshot, rebuilding it first when missing, unreadable or stale
+    fingerprint = source_fingerprint(directory)
+    try:
+        snapshot = Snapshot(path)
+        if snapshot.fingerprint != fingerprint:
+            snapshot.close()
+            snapshot = None
+    except (OSError, ValueError, TypeError, struct.error):
+        snapshot = None
+    if snapshot is None:
+        build(directory, path)
+        snapshot = Snapshot(path)
+    return ExerciseCatalog(snapshot, snapshot.ids(), snapshot.names(), snapshot.facet_index())
+
+
+if __name__ == '__main__':
+    here = os.path.dirname(os.path.abspath(__file__))
+    source = os.path.join(here, 'static', 'exercises')
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(here, 'exercises.snapshot')
+    build(source, target)
+    print(f"Wrote {target} ({os.path.getsize(target)} bytes)")
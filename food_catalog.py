@@ -0,0 +1,272 @@
+# In-process cache for the food_nutrition / food_nutrition_diet collections.
+#
+# Both collections are small (~1,000 rows) and almost never change, so each
+# gunicorn worker keeps its own copy in memory. The catalog loads lazily on first
+# use, which happens after the fork, so no Mongo connection or thread is shared
+# between workers. Staleness is bounded three ways:
+#   - a TTL after which the whole collection is reloaded,
+#   - a change stream watcher thread (only on replica sets; ignored otherwise),
+#   - a version counter in the catalog_meta collection that the reload endpoint
+#     bumps, so every worker notices a manual reload within `check_interval`.
+# Structures computed from the whole catalog are cached via derived().
+# Ids that are not in the collection are remembered for `miss_ttl` seconds (until
+# the next reload), so lookups that fall through from one catalog to the other,
+# or ask for unknown ids, do not query Mongo on every request.
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from bson.objectid import ObjectId
+from pymongo.errors import PyMongoError
+
+
+class FoodCatalog:
+    def __init__(self, collection, meta_collection=None, max_items=5000, ttl=3600, check_interval=30,
+                 miss_ttl=300):
+        self.collection = collection
+        self.meta_collection = meta_collection
+        self.max_items = max_items
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self.miss_ttl = miss_ttl
+
+        self._lock = threading.RLock()
+        self._items = OrderedDict()  # ObjectId -> food doc, in LRU order
+        self._by_name = {}           # lower-cased food_name -> ObjectId
+        self._missing = {}           # ObjectId -> monotonic time until which it is known absent
+        self._loaded_at = None
+        self._checked_at = 0
+        self._version = None
+        self._watcher = None
+        self._derived = {}  # key -> (generation, value)
+        self._build_locks = {}  # key -> lock held while that structure is built
+
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+        self.reloads = 0
+        self.generation = 0  # bumped whenever the cached contents change
+
+    # --- loading / invalidation ---
+
+    def _name_key(self, food):
+        name = food.get('food_name') or food.get('name') or ''
+        return name.strip().lower()
+
+    def _store(self, food):
+        if food['_id'] not in self._items:
+            self.generation += 1
+        self._items[food['_id']] = food
+        self._items.move_to_end(food['_id'])
+        self._missing.pop(food['_id'], None)
+        key = self._name_key(food)
+        if key:
+            self._by_name[key] = food['_id']
+        while len(self._items) > self.max_items:
+            _, evicted = self._items.popitem(last=False)
+            evicted_key = self._name_key(evicted)
+            if self._by_name.get(evicted_key) == evicted['_id']:
+                del self._by_name[evicted_key]
+
+    def _current_version(self):
+        if self.meta_collection is None:
+            return None
+        meta = self.meta_collection.find_one({'_id': self.collection.name}, {'version': 1})
+        return meta.get('version', 0) if meta else 0
+
+    def reload(self):
+        with self._lock:
+            self._items = OrderedDict()
+            self._by_name = {}
+            self._missing = {}
+            for food in self.collection.find().limit(self.max_items):
+                self._store(food)
+            self._loaded_at = time.monotonic()
+            self._checked_at = self._loaded_at
+            self._version = self._current_version()
+            self.reloads += 1
+            self.generation += 1
+        self._start_watcher()
+
+    def invalidate(self):
+        # Drop this worker's copy; the next access reloads it
+        with self._lock:
+            self._loaded_at = None
+
+    def bump_version(self):
+        # Tell every worker to reload (picked up within check_interval)
+        if self.meta_collection is not None:
+            self.meta_collection.update_one(
+                {'_id': self.collection.name}, {'$inc': {'version': 1}}, upsert=True
+            )
+        self.reload()
+
+    def _ensure_fresh(self):
+        now = time.monotonic()
+        if self._loaded_at is None or now - self._loaded_at > self.ttl:
+            self.reload()
+            return
+        if self.meta_collection is not None and now - self._checked_at > self.check_interval:
+            self._checked_at = now
+            try:
+                if self._current_version() != self._version:
+                    self.reload()
+            except PyMongoError as e:
+                print("Food catalog version check failed:", e)
+
+    def _start_watcher(self):
+        if self._watcher is not None and self._watcher.is_alive():
+            return
+        self._watcher = threading.Thread(target=self._watch, daemon=True)
+        self._watcher.start()
+
+    def _watch(self):
+        # Change streams need a replica set; on a standalone mongod this fails
+        # straight away and the catalog falls back to TTL/version refreshes.
+        try:
+            with self.collection.watch(full_document='updateLookup') as stream:
+                for change in stream:
+                    with self._lock:
+                        op = change.get('operationType')
+                        if op in ('insert', 'update', 'replace') and change.get('fullDocument'):
+                            self._store(change['fullDocument'])
+                            self.generation += 1
+                        elif op == 'delete':
+                            food = self._items.pop(change['documentKey']['_id'], None)
+                            if food is not None:
+                                self._by_name.pop(self._name_key(food), None)
+                                self.generation += 1
+                        else:
+                            self._loaded_at = None
+                            return
+        except PyMongoError as e:
+            print("Food catalog change stream unavailable:", e)
+
+    # --- lookups ---
+
+    def _known_missing(self, fid, now):
+        expires = self._missing.get(fid)
+        if expires is None:
+            return False
+        if expires < now:
+            del self._missing[fid]
+            return False
+        return True
+
+    def _remember_missing(self, fids):
+        expires = time.monotonic() + self.miss_ttl
+        with self._lock:
+            for fid in fids:
+                if fid not in self._items:
+                    self._missing[fid] = expires
+
+    def get(self, fid):
+        fid = fid if isinstance(fid, ObjectId) else ObjectId(str(fid))
+        with self._lock:
+            self._ensure_fresh()
+            food = self._items.get(fid)
+            if food is not None:
+                self._items.move_to_end(fid)
+                self.hits += 1
+                return dict(food)
+            if self._known_missing(fid, time.monotonic()):
+                self.negative_hits += 1
+                return None
+            self.misses += 1
+        food = self.collection.find_one({'_id': fid})
+        if food is not None:
+            with self._lock:
+                self._store(food)
+            return dict(food)
+        self._remember_missing([fid])
+        return None
+
+    def get_many(self, food_ids):
+        ids = {fid if isinstance(fid, ObjectId) else ObjectId(str(fid)) for fid in food_ids}
+        foods = {}
+        missing = set()
+        with self._lock:
+            self._ensure_fresh()
+            now = time.monotonic()
+            for fid in ids:
+                food = self._items.get(fid)
+                if food is not None:
+                    self._items.move_to_end(fid)
+                    foods[fid] = dict(food)
+                elif self._known_missing(fid, now):
+                    self.negative_hits += 1
+                else:
+                    missing.add(fid)
+            self.hits += len(foods)
+            self.misses += len(missing)
+        if missing:
+            fetched = list(self.collection.find({'_id': {'$in': list(missing)}}))
+            with self._lock:
+                for food in fetched:
+                    self._store(food)
+                    foods[food['_id']] = dict(food)
+            self._remember_missing(missing - foods.keys())
+        return foods
+
+    def get_by_name(self, name):
+        with self._lock:
+            self._ensure_fresh()
+            fid = self._by_name.get(name.strip().lower())
+        if fid is not None:
+            return self.get(fid)
+        with self._lock:
+            self.misses += 1
+        food = self.collection.find_one({'food_name': {'$regex': '^' + re.escape(name.strip()) + '$', '$options': 'i'}})
+        if food is not None:
+            with self._lock:
+                self._store(food)
+            return dict(food)
+        return None
+
+    def derived(self, key, builder):
+        # Structure built from the whole catalog (search index, planner matrix...),
+        # rebuilt when the contents change. Builders get the foods sorted by _id,
+        # so structures built at the same generation share row order. The build
+        # runs outside the catalog lock, from a snapshot of the items, so lookups
+        # are not blocked meanwhile; a per-key lock keeps concurrent callers from
+        # building the same structure twice.
+        with self._lock:
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+        with build_lock:
+            with self._lock:
+                self._ensure_fresh()
+                entry = self._derived.get(key)
+                if entry is not None and entry[0] == self.generation:
+                    return entry[1]
+                generation = self.generation
+                foods = sorted((dict(food) for food in self._items.values()), key=lambda f: f['_id'])
+            value = builder(foods)
+            with self._lock:
+                # Only cache it if the catalog did not change during the build
+                if self.generation == generation:
+                    self._derived[key] = (generation, value)
+            return value
+
+    def all(self):
+        with self._lock:
+            self._ensure_fresh()
+            self.hits += 1
+            return [dict(food) for food in self._items.values()]
+
+    def stats(self):
+        with self._lock:
+            return {
+                'collection': self.collection.name,
+                'items': len(self._items),
+                'max_items': self.max_items,
+                'hits': self.hits,
+                'misses': self.misses,
+                'negative_hits': self.negative_hits,
+                'known_missing': len(self._missing),
+                'reloads': self.reloads,
+                'version': self._version,
+                'age_seconds': round(time.monotonic() - self._loaded_at, 1) if self._loaded_at else None,
+                'watching': self._watcher is not None and self._watcher.is_alive(),
+            }
@@ -0,0 +1,136 @@
+# In-memory typeahead index over food names for /search_food.
+#
+# Built from the food catalog via FoodCatalog.derived(), so there is no database
+# access per keystroke and the index is rebuilt whenever the catalog changes. Matches are ranked in tiers:
+#   0. the whole name starts with the query
+#   1. some word in the name starts with the query
+#   2. the query appears anywhere in the name
+#   3. fuzzy: trigram overlap above a threshold (typos, transpositions)
+# Earlier tiers are cheap bisect/set lookups; the fuzzy tier only runs when
+# fewer than `limit` results were found and stops once the time budget is spent.
+
+import re
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+_SPACES = re.compile(r'\s+')
+_WORDS = re.compile(r'[a-z0-9]+')
+
+
+def normalise(text):
+    return _SPACES.sub(' ', (text or '').strip().lower())
+
+
+def trigrams(text):
+    # Per-word trigrams, padded so word starts/ends carry extra weight
+    grams = set()
+    for word in _WORDS.findall(text):
+        padded = '  ' + word + ' '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class FoodSearchIndex:
+    def __init__(self, foods):
+        self.foods = []       # docs, _id (when present) already stringified
+        self.names = []       # normalised names, parallel to self.foods
+        by_name = []          # (name, i) sorted, for whole-name prefix lookups
+        by_word = []          # (word, i) sorted, for word prefix lookups
+        self.grams = defaultdict(list)  # trigram -> [i, ...]
+        self.gram_counts = []
+
+        for food in foods:
+            name = normalise(food.get('food_name') or food.get('name'))
+            if not name:
+                continue
+            i = len(self.foods)
+            if '_id' in food:
+                food['_id'] = str(food['_id'])
+            self.foods.append(food)
+            self.names.append(name)
+            by_name.append((name, i))
+            for word in set(_WORDS.findall(name)):
+                by_word.append((word, i))
+            grams = trigrams(name)
+            self.gram_counts.append(len(grams))
+            for g in grams:
+                self.grams[g].append(i)
+
+        by_name.sort()
+        by_word.sort()
+        self._name_keys = [n for n, _ in by_name]
+        self._name_ids = [i for _, i in by_name]
+        self._word_keys = [w for w, _ in by_word]
+        self._word_ids = [i for _, i in by_word]
+
+    def _prefix_range(self, keys, ids, q):
+        start = bisect_left(keys, q)
+        for pos in range(start, len(keys)):
+            if not keys[pos].startswith(q):
+                break
+            yield ids[pos]
+
+    def _docs(self, rows):
+        return [dict(self.foods[i]) for i in rows]
+
+    def _rank(self, ids):
+        # Shorter names first: "rice" should beat "rice kheer with jaggery"
+        return sorted(ids, key=lambda i: (len(self.names[i]), self.names[i]))
+
+    def search(self, q, limit=10, budget_ms=0.5, min_similarity=0.5):
+        q = normalise(q)
+        if not q:
+            return [dict(self.foods[i]) for i in self._name_ids[:limit]]
+
+        deadline = time.perf_counter() + budget_ms / 1000.0
+        seen = set()
+        results = []
+
+        def take(ids):
+            for i in self._rank(ids):
+                if i not in seen:
+                    seen.add(i)
+                    results.append(i)
+                    if len(results) >= limit:
+                        return True
+            return False
+
+        if take(set(self._prefix_range(self._name_keys, self._name_ids, q))):
+            return self._docs(results)
+
+        words = _WORDS.findall(q)
+        if len(words) == 1 and take(set(self._prefix_range(self._word_keys, self._word_ids, words[0]))):
+            return self._docs(results)
+
+        q_grams = trigrams(q)
+        if len(q) >= 3:
+            # Every space-free trigram of the query must occur in a matching name
+            inner = [g for g in q_grams if ' ' not in g]
+            postings = sorted((self.grams.get(g, ()) for g in inner), key=len)
+            candidates = set(postings[0]).intersection(*postings[1:]) if postings else range(len(self.names))
+        else:
+            candidates = range(len(self.names))
+        if take({i for i in candidates if q in self.names[i]}):
+            return self._docs(results)
+
+        # Fuzzy tier: how much of the query's trigrams each name covers,
+        # ties broken by Jaccard similarity so tighter names come first
+        shared = defaultdict(int)
+        for g in q_grams:
+            for i in self.grams.get(g, ()):
+                if i not in seen:
+                    shared[i] += 1
+            if time.perf_counter() > deadline:
+                break
+        scored = []
+        for i, count in shared.items():
+            coverage = count / len(q_grams)
+            if coverage >= min_similarity:
+                jaccard = count / (len(q_grams) + self.gram_counts[i] - count)
+                scored.append((-coverage, -jaccard, i))
+        scored.sort()
+        for _, _, i in scored[:limit - len(results)]:
+            results.append(i)
+        return self._docs(results)
+
@@ -0,0 +1,42 @@
+# gunicorn settings: `gunicorn app:app` picks this file up automatically.
+#
+# /chat/stream holds its connection open for the whole LLM reply, so sync
+# workers would be pinned one per chat. Use gevent greenlets when gevent is
+# installed, otherwise threaded workers so a stream costs a thread, not a process.
+#
+# bind and workers keep gunicorn's own defaults unless GUNICORN_BIND /
+# GUNICORN_WORKERS are set (or passed on the command line).
+import os
+
+if os.getenv('GUNICORN_BIND'):
+    bind = os.getenv('GUNICORN_BIND')
+if os.getenv('GUNICORN_WORKERS'):
+    workers = int(os.getenv('GUNICORN_WORKERS'))
+
+try:
+    import gevent  # noqa: F401
+    worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gevent')
+    worker_connections = int(os.getenv('GUNICORN_WORKER_CONNECTIONS', 1000))
+except ImportError:
+    worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread')
+    threads = int(os.getenv('GUNICORN_THREADS', 8))
+
+# Long enough for a full streamed reply; idle upstreams are cut off by the request timeout
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+
+
+# Opt-in index check (VERIFY_INDEXES=1): runs once in the master before any
+# worker is forked, instead of once per worker at import time
+def when_ready(server):
+    if os.getenv('VERIFY_INDEXES', '0') != '1':
+        return
+    from pymongo import MongoClient
+    import db_indexes
+    client = MongoClient(os.getenv('MONGO_URI'), serverSelectionTimeoutMS=5000)
+    try:
+        for collection, index in db_indexes.verify_indexes(client.get_default_database()):
+            server.log.warning(f"Missing index {collection}.{index}; run `flask ensure-indexes`")
+    except Exception as e:
+        server.log.warning(f"Index verification failed: {e}")
+    finally:
+        client.close()
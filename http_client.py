@@ -0,0 +1,145 @@
+# Shared outbound HTTP client for the third-party APIs (Groq, RapidAPI, yoga).
+#
+# Each upstream gets its own requests.Session, so connections are kept alive and
+# reused instead of paying a TCP+TLS handshake per call. On top of that each
+# upstream has a default timeout, bounded retries with exponential backoff (for
+# connection failures and 429/5xx responses), a circuit breaker that fails fast
+# while the service is down, and a latency histogram exposed through stats().
+# Sessions are created lazily per process so gunicorn workers never share sockets.
+
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+LATENCY_BUCKETS_MS = [50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000]
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    # Raised instead of calling an upstream that keeps failing; subclasses
+    # ConnectionError so existing `except requests...` handlers still apply
+    pass
+
+
+class Upstream:
+    def __init__(self, name, timeout, retries=2, backoff=0.3, retry_methods=('GET',),
+                 pool_size=10, failure_threshold=5, cooldown=30):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.retry_methods = retry_methods
+        self.pool_size = pool_size
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+
+        self._lock = threading.Lock()
+        self._session = None
+        self._pid = None
+        self._failures = 0
+        self._opened_at = None
+
+        self.histogram = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+
+    def session(self):
+        with self._lock:
+            if self._session is None or self._pid != os.getpid():
+                retry = Retry(
+                    total=self.retries,
+                    # Connection errors never reached the server, so any method may retry;
+                    # read errors and bad statuses only retry for methods in retry_methods
+                    connect=self.retries,
+                    read=self.retries,
+                    status=self.retries,
+                    backoff_factor=self.backoff,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(self.retry_methods),
+                    raise_on_status=False,
+                    respect_retry_after_header=True,
+                )
+                adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.pool_size, max_retries=retry)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._session = session
+                self._pid = os.getpid()
+            return self._session
+
+    # --- circuit breaker ---
+
+    def _allow(self):
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.cooldown:
+                # Half-open: let one trial call through; a failure re-opens the circuit
+                self._opened_at = time.monotonic()
+                return True
+            self.rejected += 1
+            return False
+
+    def _record(self, elapsed_ms, failed):
+        with self._lock:
+            self.calls += 1
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if elapsed_ms <= bound:
+                    self.histogram[i] += 1
+                    break
+            else:
+                self.histogram[-1] += 1
+            if failed:
+                self.errors += 1
+                self._failures += 1
+                if self._failures >= self.failure_threshold:
+                    self._opened_at = time.monotonic()
+            else:
+                self._failures = 0
+                self._opened_at = None
+
+    def request(self, method, url, **kwargs):
+        if not self._allow():
+            raise CircuitOpenError(f"{self.name} circuit open; skipping call")
+        kwargs.setdefault('timeout', self.timeout)
+        start = time.perf_counter()
+        try:
+            response = self.session().request(method, url, **kwargs)
+        except requests.exceptions.RequestException:
+            self._record((time.perf_counter() - start) * 1000, failed=True)
+            raise
+        self._record((time.perf_counter() - start) * 1000, failed=response.status_code >= 500)
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def stats(self):
+        with self._lock:
+            buckets = [f"<={b}ms" for b in LATENCY_BUCKETS_MS] + [f">{LATENCY_BUCKETS_MS[-1]}ms"]
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'rejected': self.rejected,
+                'circuit': 'open' if self._opened_at is not None else 'closed',
+                'latency_histogram': dict(zip(buckets, self.histogram)),
+            }
+
+
+# (connect, read) timeouts per upstream; LLM replies are slow to produce
+groq = Upstream('groq', timeout=(5, 30), retries=2, retry_methods=('GET',))
+rapidapi = Upstream('rapidapi', timeout=(5, 10), retries=2, retry_methods=('GET',))
+yoga = Upstream('yoga', timeout=(5, 15), retries=2, retry_methods=('GET',))
+
+UPSTREAMS = {u.name: u for u in (groq, rapidapi, yoga)}
+
+
+def stats():
+    return {name: upstream.stats() for name, upstream in UPSTREAMS.items()}
@@ -0,0 +1,141 @@
+# Resized derivatives of the exercise images in static/exercises.
+#
+# Each source JPEG gets a "thumb" and a "medium" JPEG (plus WebP copies when
+# Pillow has WebP support), written to a content-addressed directory: file
+# names start with a hash of the source bytes, so a URL never changes meaning
+# and can be cached forever. manifest.json records, per source, the mtime/size
+# it was built from and each derivative's file name and dimensions. Rebuilds
+# are incremental (unchanged sources are skipped) and run in a process pool.
+#
+# Build with `flask build-exercise-images`; without Pillow, or before the first
+# build, callers fall back to the original images.
+
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, features
+except ImportError:  # optional: only needed to build derivatives
+    Image = None
+    features = None
+
+VARIANTS = {'thumb': 160, 'medium': 480}  # max width in pixels
+JPEG_QUALITY = 80
+WEBP_QUALITY = 75
+MANIFEST = 'manifest.json'
+
+
+def webp_supported():
+    return features is not None and features.check('webp')
+
+
+def _derive(job):
+    # Runs in a worker process: (relative path, absolute path, output dir, webp) -> manifest entry
+    rel, path, out_dir, webp = job
+    with open(path, 'rb') as f:
+        data = f.read()
+    digest = hashlib.sha1(data).hexdigest()[:16]
+    st = os.stat(path)
+    entry = {'mtime_ns': st.st_mtime_ns, 'size': st.st_size, 'hash': digest, 'variants': {}}
+    with Image.open(path) as source:
+        source = source.convert('RGB')
+        for variant, max_width in VARIANTS.items():
+            image = source.copy()
+            image.thumbnail((max_width, max_width * 4))
+            name = f"{digest}-{variant}"
+            info = {'file': name + '.jpg', 'width': image.width, 'height': image.height}
+            target = os.path.join(out_dir, info['file'])
+            if not os.path.exists(target):
+                image.save(target, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            if webp:
+                info['webp'] = name + '.webp'
+                target = os.path.join(out_dir, info['webp'])
+                if not os.path.exists(target):
+                    image.save(target, 'WEBP', quality=WEBP_QUALITY, method=4)
+            entry['variants'][variant] = info
+    return rel, entry
+
+
+def load_manifest(out_dir):
+    try:
+        with open(os.path.join(out_dir, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _outputs_exist(out_dir, variant, webp):
+    # Every file the manifest lists for a variant (JPEG and, when supported, WebP) is on disk
+    files = [variant['file']]
+    if webp:
+        if 'webp' not in variant:
+            return False
+        files.append(variant['webp'])
+    return all(os.path.exists(os.path.join(out_dir, name)) for name in files)
+
+
+def build(source_dir, out_dir, workers=None):
+    # Returns (rebuilt, total). Only sources whose mtime/size changed, or whose
+    # derivative files are missing, are reprocessed.
+    if Image is None:
+        raise RuntimeError("Pillow is required to build image derivatives")
+    os.makedirs(out_dir, exist_ok=True)
+    manifest = load_manifest(out_dir)
+    webp = webp_supported()
+
+    jobs, current = [], {}
+    for root, _, files in os.walk(source_dir):
+        for name in files:
+            if not name.lower().endswith(('.jpg', '.jpeg', '.png')):
+                continue
+            path = os.path.join(root, name)
+            rel = os.path.relpath(path, source_dir).replace(os.sep, '/')
+            st = os.stat(path)
+            entry = manifest.get(rel)
+            fresh = (
+                entry is not None and entry['mtime_ns'] == st.st_mtime_ns and entry['size'] == st.st_size
+                and all(_outputs_exist(out_dir, v, webp) for v in entry['variants'].values())
+            )
+            if fresh:
+                current[rel] = entry
+            else:
+                jobs.append((rel, path, out_dir, webp))
+
+    if jobs:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for rel, entry in pool.map(_derive, jobs, chunksize=16):
+                current[rel] = entry
+
+    tmp = os.path.join(out_dir, f"{MANIFEST}.{os.getpid()}.tmp")
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(current, f, sort_keys=True)
+    os.replace(tmp, os.path.join(out_dir, MANIFEST))
+    return len(jobs), len(current)
+
+
+class ImageDerivatives:
+    # Read side: looks up derivatives in the manifest, reloading it when it changes
+    def __init__(self, out_dir):
+        self.out_dir = out_dir
+        self._manifest = {}
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def _current(self):
+        try:
+            mtime = os.stat(os.path.join(self.out_dir, MANIFEST)).st_mtime_ns
+        except OSError:
+            return {}
+        with self._lock:
+            if mtime != self._mtime:
+                self._manifest = load_manifest(self.out_dir)
+                self._mtime = mtime
+            return self._manifest
+
+    def lookup(self, rel, variant):
+        # {'file', 'width', 'height'[, 'webp']} or None when not built yet
+        entry = self._current().get(rel)
+        return entry['variants'].get(variant) if entry else None
@@ -0,0 +1,102 @@
+# Journal entries: at most one document per user per day in the `journal`
+# collection, keyed and indexed on (user_id, date) (see db_indexes).
+#
+# Both write paths (the /journal page form and the calendar's /api/journal)
+# upsert into it, merging their fields, and every read is a single range query
+# on that index. Entries the calendar used to insert into the old `journals`
+# collection are folded in by `flask migrate-journals`.
+
+from datetime import datetime, timedelta
+
+from pymongo import UpdateOne
+
+ENTRY_FIELDS = ['mood', 'sleep_quality', 'behavioral_pattern', 'stress', 'symptoms', 'notes', 'feelData']
+MAX_RANGE_DAYS = 366
+
+
+def parse_day(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def month_range(month):
+    # 'YYYY-MM' -> (first day, last day) as 'YYYY-MM-DD' strings
+    first = datetime.strptime(month, '%Y-%m').date()
+    last = (first.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+    return first.isoformat(), last.isoformat()
+
+
+def compact(doc):
+    # Only the entry fields that hold something
+    return {field: doc[field] for field in ENTRY_FIELDS if doc.get(field) not in (None, '', [])}
+
+
+class JournalStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def save(self, user_id, day, fields):
+        # Upsert the day's entry, setting only the given fields
+        changes = {k: v for k, v in fields.items() if k in ENTRY_FIELDS}
+        changes['updated_at'] = datetime.utcnow()
+        self.collection.update_one(
+            {'user_id': str(user_id), 'date': day},
+            {'$set': changes, '$setOnInsert': {'created_at': changes['updated_at']}},
+            upsert=True
+        )
+
+    def get(self, user_id, day):
+        doc = self.collection.find_one({'user_id': str(user_id), 'date': day})
+        return compact(doc) if doc else None
+
+    def recent(self, user_id, n=30):
+        return list(self.collection.find({'user_id': str(user_id)}, sort=[('date', -1)], limit=n))
+
+    def range_view(self, user_id, start, end):
+        # {'start', 'end', 'days': '0110...' (one flag per day), 'entries': {date: {...}}}
+        first, last = parse_day(start), parse_day(end)
+        span = (last - first).days + 1
+        if span < 1 or span > MAX_RANGE_DAYS:
+            raise ValueError(f"Range must cover 1 to {MAX_RANGE_DAYS} days")
+        projection = {'_id': 0, 'date': 1, **{field: 1 for field in ENTRY_FIELDS}}
+        flags = ['0'] * span
+        entries = {}
+        for doc in self.collection.find(
+            {'user_id': str(user_id), 'date': {'$gte': start, '$lte': end}}, projection
+        ):
+            try:
+                offset = (parse_day(doc['date']) - first).days
+            except (TypeError, ValueError):
+                continue
+            flags[offset] = '1'
+            entries[doc['date']] = compact(doc)
+        return {'start': start, 'end': end, 'days': ''.join(flags), 'entries': entries}
+
+    def migrate_legacy(self, legacy, batch_size=500):
+        # Fold `journals` documents (one insert per save) into per-day entries,
+        # oldest first so the newest save of a day wins. Run it once after
+        # deploying: a re-run would overwrite days edited since then.
+        moved = 0
+        batch = []
+        for doc in legacy.find({}, sort=[('timestamp', 1)]):
+            if not doc.get('user_id') or not isinstance(doc.get('date'), str):
+                continue
+            fields = {k: doc[k] for k in ENTRY_FIELDS if doc.get(k) is not None}
+            batch.append((doc['user_id'], doc['date'], fields))
+            if len(batch) >= batch_size:
+                moved += self._save_many(batch)
+                batch = []
+        if batch:
+            moved += self._save_many(batch)
+        return moved
+
+    def _save_many(self, batch):
+        ops = [
+            UpdateOne({'user_id': str(user_id), 'date': day},
+                      {'$set': fields, '$setOnInsert': {'created_at': datetime.utcnow()}}, upsert=True)
+            for user_id, day, fields in batch if fields
+        ]
+        if ops:
+            # ordered: later saves of the same day must be applied last
+            self.collection.bulk_write(ops, ordered=True)
+        return len(ops)
+
@@ -0,0 +1,108 @@
+# Weekly meal-plan engine for /create_weekly_diet.
+#
+# The nutrient columns of food_nutrition_diet are held in one NumPy matrix
+# (foods x nutrients). For each user we derive per-meal nutrient targets from
+# target_calories and macro goals, score every food against every meal slot in
+# one broadcasted operation, mask out foods the shared AllergenIndex flags, and pick
+# seven distinct low-error foods per slot (one for each day). plan_many() does
+# the same for a whole batch of users against a single copy of the matrix.
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+from allergen_index import AllergenIndex
+
+NUTRIENTS = ['energy_kcal', 'protein_g', 'carb_g', 'fat_g', 'fibre_g', 'freesugar_g']
+MEALS = ['breakfast', 'lunch', 'snacks', 'dinner']
+MEAL_SHARES = np.array([0.25, 0.35, 0.10, 0.30])  # share of the day's targets per meal
+
+# Relative importance of each nutrient when scoring (calories matter most)
+WEIGHTS = np.array([3.0, 1.5, 1.0, 1.0, 0.5, 0.5])
+
+# Daily defaults for users without explicit goals; carb-moderate for PCOS
+DEFAULT_CALORIES = 2000
+DEFAULT_SPLIT = {'protein': 0.25, 'carb': 0.45, 'fat': 0.30}
+DEFAULT_FIBRE_G = 25
+DEFAULT_FREESUGAR_G = 25
+
+
+def _number(value):
+    try:
+        value = float(value)
+    except (TypeError, ValueError):
+        return 0.0
+    return 0.0 if np.isnan(value) else value
+
+
+def daily_targets(user):
+    # [kcal, protein_g, carb_g, fat_g, fibre_g, freesugar_g] for one user document
+    kcal = _number(user.get('target_calories') or user.get('daily_calorie_goal')) or DEFAULT_CALORIES
+    protein = _number(user.get('protein_goal')) or kcal * DEFAULT_SPLIT['protein'] / 4
+    carb = _number(user.get('carb_goal')) or kcal * DEFAULT_SPLIT['carb'] / 4
+    fat = _number(user.get('fat_goal')) or kcal * DEFAULT_SPLIT['fat'] / 9
+    return [kcal, protein, carb, fat, DEFAULT_FIBRE_G, DEFAULT_FREESUGAR_G]
+
+
+class MealPlanner:
+    def __init__(self, foods, allergens=None, variety=0.35):
+        self.ids = [food['_id'] for food in foods]
+        self.matrix = np.array(
+            [[_number(food.get(col)) for col in NUTRIENTS] for food in foods], dtype=np.float64
+        ).reshape(len(foods), len(NUTRIENTS))
+        self.variety = variety  # random jitter on scores so plans differ week to week
+        if allergens is None or allergens.ids != self.ids:
+            allergens = AllergenIndex(foods)
+        self.allergens = allergens
+
+    def safe_mask(self, allergies):
+        return self.allergens.safe_mask(allergies)
+
+    def scores(self, targets, masks):
+        # targets: (users, nutrients) daily targets; masks: (users, foods) bool.
+        # Returns (users, meals, foods) weighted relative squared error; unsafe foods are inf.
+        slot_targets = targets[:, None, :] * MEAL_SHARES[None, :, None]
+        error = (self.matrix[None, None, :, :] - slot_targets[:, :, None, :]) / np.maximum(slot_targets[:, :, None, :], 1e-6)
+        score = (error ** 2 * WEIGHTS).sum(axis=-1)
+        score[~np.broadcast_to(masks[:, None, :], score.shape)] = np.inf
+        return score
+
+    def plan_many(self, users, days=7, start=None, seed=None, chunk=64):
+        # One weekly plan per user document, in input order. None for users with no safe food.
+        rng = np.random.default_rng(seed)
+        start = start or datetime.utcnow()
+        dates = [str((start + timedelta(days=d)).date()) for d in range(days)]
+        plans = []
+        for offset in range(0, len(users), chunk):
+            batch = users[offset:offset + chunk]
+            targets = np.array([daily_targets(u) for u in batch], dtype=np.float64)
+            masks = np.stack([self.safe_mask(u.get('allergies', [])) for u in batch])
+            score = self.scores(targets, masks)
+            score = score * (1 + rng.uniform(0, self.variety, size=score.shape))
+
+            # Lowest `days` scores per (user, meal); distinct foods across the week when possible
+            k = min(days, score.shape[-1])
+            picks = np.argpartition(score, k - 1, axis=-1)[..., :k] if k else None
+            if picks is not None:
+                order = np.take_along_axis(score, picks, axis=-1).argsort(axis=-1)
+                picks = np.take_along_axis(picks, order, axis=-1)
+
+            for u, mask in enumerate(masks):
+                safe = int(mask.sum())
+                if not safe:
+                    plans.append(None)
+                    continue
+                plan = []
+                for d, date in enumerate(dates):
+                    meals = {}
+                    for m, meal in enumerate(MEALS):
+                        # With fewer safe foods than days, reuse the best ones in turn
+                        row = picks[u, m, d % min(k, safe)]
+                        meals[meal] = [self.ids[row]]
+                    plan.append({'date': date, 'meals': meals})
+                plans.append(plan)
+        return plans
+
+    def plan(self, user, days=7, start=None, seed=None):
+        return self.plan_many([user], days=days, start=start, seed=seed)[0]
+
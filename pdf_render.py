@@ -0,0 +1,175 @@
+# PDF rendering for /download_weekly_diet and the weekly health report.
+#
+# Everything that does not depend on the request is prepared once at import:
+# the NotoSans font is parsed and registered, the logo is decoded into an
+# ImageReader, and the page branding is drawn once per document as a reusable
+# form. Each request only lays out the table rows. Rendered PDFs are kept in a
+# small LRU keyed by (user_id, content hash); the hash doubles as the ETag so an
+# unchanged week is answered with 304 or the cached bytes.
+
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+from bson.objectid import ObjectId
+from reportlab.lib.pagesizes import A4, letter, landscape
+from reportlab.lib.utils import ImageReader
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FONT_PATH = os.path.join(BASE_DIR, 'static', 'fonts', 'NotoSans-Regular.ttf')
+LOGO_PATH = os.path.join(BASE_DIR, 'static', 'media', 'hclogo.png')
+FONT_NAME = 'NotoSans'
+
+MEAL_TYPES = ['breakfast', 'lunch', 'snacks', 'dinner']
+PAGE_SIZE = landscape(letter)
+MARGIN = 50
+
+FONT_ERROR = None
+try:
+    pdfmetrics.registerFont(TTFont(FONT_NAME, FONT_PATH))
+except Exception as e:
+    FONT_ERROR = "Font not found. Place NotoSans-Regular.ttf in static/fonts."
+    print("PDF font registration failed:", e)
+
+LOGO = ImageReader(LOGO_PATH) if os.path.exists(LOGO_PATH) else None
+
+
+def weekly_diet_rows(week_doc, foods_by_id):
+    # {meal_type: [[date, "food, food"], ...]} -- the only per-request content
+    rows = {}
+    for meal_type in MEAL_TYPES:
+        rows[meal_type] = []
+        for day in week_doc['days']:
+            names = [
+                foods_by_id[fid if isinstance(fid, ObjectId) else ObjectId(str(fid))]['food_name']
+                for fid in day['meals'].get(meal_type, [])
+            ]
+            rows[meal_type].append([day['date'], ', '.join(names)])
+    return rows
+
+
+def content_etag(rows):
+    return hashlib.sha1(json.dumps(rows, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+def _draw_branding(p):
+    width, height = PAGE_SIZE
+    if LOGO is not None:
+        p.drawImage(LOGO, MARGIN / 4, height / 2 - 60, width=80, height=80, mask='auto')
+    p.setFont(FONT_NAME, 26)
+    p.drawString(MARGIN / 3, height - MARGIN / 2, "Hormocare+")
+
+
+def render_weekly_diet(rows):
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=PAGE_SIZE)
+    width, height = PAGE_SIZE
+
+    # Branding is stored once in the document and referenced from every page
+    p.beginForm('branding')
+    _draw_branding(p)
+    p.endForm()
+
+    for page_num, meal_type in enumerate(MEAL_TYPES):
+        if page_num > 0:
+            p.showPage()
+        p.doForm('branding')
+
+        p.setFont(FONT_NAME, 20)
+        p.drawCentredString(width / 2, height - MARGIN, f"Weekly {meal_type.capitalize()} Plan")
+
+        p.setFont(FONT_NAME, 12)
+        x_start = MARGIN + 100
+        y = height - MARGIN * 1.7
+        p.drawString(x_start, y, "Date")
+        p.drawString(x_start + 250, y, meal_type.capitalize())
+
+        p.setFont(FONT_NAME, 10)
+        y -= 28
+        for date, line in rows.get(meal_type, []):
+            p.drawString(x_start, y, date)
+            p.drawString(x_start + 250, y, line if line else "-")
+            y -= 22
+
+    p.save()
+    return buffer.getvalue()
+
+
+class PdfCache:
+    def __init__(self, max_items=256):
+        self.max_items = max_items
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_render(self, key, render):
+        with self._lock:
+            data = self._items.get(key)
+            if data is not None:
+                self._items.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = render()
+        with self._lock:
+            self._items[key] = data
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+        return data
+
+
+weekly_diet_cache = PdfCache(max_items=int(os.getenv('PDF_CACHE_MAX_ITEMS', 256)))
+
+
+def weekly_diet_pdf(user_id, rows, etag=None):
+    etag = etag or content_etag(rows)
+    return weekly_diet_cache.get_or_render((str(user_id), etag), lambda: render_weekly_diet(rows))
+
+
+def render_weekly_report(report_text):
+    buffer = io.BytesIO()
+    p = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+
+    # Add HORMOCARE+ heading
+    p.setFont("Helvetica-Bold", 30)
+    p.drawCentredString(width / 2, height - 70, "HORMOCARE+")
+
+    # Draw line below heading
+    p.setLineWidth(2)
+    p.line(width * 0.2, height - 85, width * 0.8, height - 85)
+
+    # Prepare lines for report
+    # (Simple line splitting, but you could use more advanced layout/wrapping for long content)
+    y = height - 115
+    text_object = p.beginText()
+    text_object.setTextOrigin(60, y)
+    text_object.setFont("Helvetica", 13)
+    for line in report_text.splitlines():
+        # Handle large blocks or bulleted lists gracefully
+        # If using Markdown bullets/digits, you can format differently
+        if line.strip().startswith(('1.', '2.', '3.', '4.', '5.', '6.')):
+            text_object.setFont("Helvetica-Bold", 15)
+        elif line.strip().startswith('-'):
+            text_object.setFont("Helvetica", 13)
+        else:
+            text_object.setFont("Helvetica", 13)
+        text_object.textLine(line)
+        y -= 15
+        if y < 100:
+            p.drawText(text_object)
+            p.showPage()
+            y = height - 80
+            text_object = p.beginText()
+            text_object.setTextOrigin(60, y)
+            text_object.setFont("Helvetica", 13)
+    p.drawText(text_object)
+    p.save()
+    return buffer.getvalue()
@@ -0,0 +1,101 @@
+# Background generation of the weekly health report.
+#
+# Building the report means several Mongo reads, a slow LLM call and a
+# ReportLab render, so it runs on a small thread pool instead of inside the
+# request. Jobs and their finished PDFs live in the report_jobs collection,
+# keyed by (user_id, week end date): every gunicorn worker can answer status
+# and download requests, and a report that already exists for the week is
+# served again without calling the LLM.
+
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from bson.binary import Binary
+from pymongo import ReturnDocument
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ReportJobs:
+    def __init__(self, collection, build_report, max_workers=2, stale_after=300):
+        self.collection = collection
+        self.build_report = build_report  # (user_id, week_end) -> pdf bytes
+        self.max_workers = max_workers
+        self.stale_after = stale_after    # seconds before a queued/running job is presumed lost
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        # Created on first use so each gunicorn worker gets its own threads after fork
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='report')
+            return self._executor
+
+    @staticmethod
+    def job_id(user_id, week_end):
+        return f"{user_id}:{week_end}"
+
+    def submit(self, user_id, week_end):
+        job_id = self.job_id(user_id, week_end)
+        now = datetime.utcnow()
+        inserted = self.collection.update_one(
+            {'_id': job_id},
+            {'$setOnInsert': {
+                'user_id': user_id, 'week_end': week_end,
+                'status': QUEUED, 'created_at': now, 'updated_at': now
+            }},
+            upsert=True
+        ).upserted_id is not None
+        job = self.status(job_id)
+        if inserted:
+            self._pool().submit(self._run, job_id, user_id, week_end)
+            return job
+
+        # Retry failed jobs and jobs whose worker went away; claim atomically so
+        # concurrent submits from different workers start at most one run
+        stale = (now - job['updated_at']).total_seconds() > self.stale_after
+        if job['status'] == FAILED or (job['status'] in (QUEUED, RUNNING) and stale):
+            claimed = self.collection.find_one_and_update(
+                {'_id': job_id, 'status': job['status'], 'updated_at': job['updated_at']},
+                {'$set': {'status': QUEUED, 'updated_at': now}, '$unset': {'error': ''}},
+                projection={'pdf': 0},
+                return_document=ReturnDocument.AFTER
+            )
+            if claimed:
+                self._pool().submit(self._run, job_id, user_id, week_end)
+                return claimed
+            return self.status(job_id)
+        return job
+
+    def _run(self, job_id, user_id, week_end):
+        self.collection.update_one(
+            {'_id': job_id}, {'$set': {'status': RUNNING, 'updated_at': datetime.utcnow()}}
+        )
+        try:
+            pdf = self.build_report(user_id, week_end)
+        except Exception as e:
+            print("Weekly report job failed:", job_id, e)
+            self.collection.update_one(
+                {'_id': job_id},
+                {'$set': {'status': FAILED, 'error': str(e), 'updated_at': datetime.utcnow()}}
+            )
+            return
+        self.collection.update_one(
+            {'_id': job_id},
+            {'$set': {
+                'status': DONE, 'pdf': Binary(pdf), 'size': len(pdf),
+                'updated_at': datetime.utcnow(), 'finished_at': datetime.utcnow()
+            }}
+        )
+
+    def status(self, job_id):
+        return self.collection.find_one({'_id': job_id}, {'pdf': 0})
+
+    def pdf(self, job_id):
+        job = self.collection.find_one({'_id': job_id, 'status': DONE}, {'pdf': 1})
+        return bytes(job['pdf']) if job else None
@@ -0,0 +1,193 @@
+# Cache for slow, rate-limited upstream responses (RapidAPI exercise search,
+# the yoga pose feed).
+#
+# Two tiers: an in-memory LRU per worker, backed by a persistent store shared by
+# all workers (a Mongo collection or a directory of JSON files). Entries are
+# fresh for `ttl` seconds, then served stale for up to `stale_ttl` more while a
+# background refresh runs. Concurrent misses for the same key share a single
+# upstream call, and when the upstream fails any cached copy, however old, is
+# served instead of an error.
+
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+def normalise_key(source, params):
+    # Same query in any order, case or padding maps to the same key
+    parts = []
+    for k in sorted(params):
+        v = params[k]
+        if isinstance(v, str):
+            v = ' '.join(v.lower().split())
+        parts.append(f"{k}={v}")
+    return source + '?' + '&'.join(parts)
+
+
+class MongoStore:
+    def __init__(self, collection):
+        self.collection = collection
+
+    def get(self, key):
+        doc = self.collection.find_one({'_id': key})
+        return (doc['value'], doc['fetched_at']) if doc else None
+
+    def set(self, key, value, fetched_at):
+        self.collection.update_one(
+            {'_id': key}, {'$set': {'value': value, 'fetched_at': fetched_at}}, upsert=True
+        )
+
+
+class DiskStore:
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(key.encode('utf-8')).hexdigest() + '.json')
+
+    def get(self, key):
+        try:
+            with open(self._path(key), encoding='utf-8') as f:
+                doc = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return doc['value'], doc['fetched_at']
+
+    def set(self, key, value, fetched_at):
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'key': key, 'value': value, 'fetched_at': fetched_at}, f)
+        os.replace(tmp, path)
+
+
+class ResponseCache:
+    def __init__(self, source, ttl, stale_ttl, store=None, max_items=512):
+        self.source = source
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.store = store
+        self.max_items = max_items
+
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # key -> (value, fetched_at as epoch seconds)
+        self._inflight = {}          # key -> Future shared by concurrent callers
+        self._executor = None
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.upstream_calls = 0
+        self.upstream_errors = 0
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix=f'refresh-{self.source}')
+            return self._executor
+
+    def _remember(self, key, value, fetched_at):
+        with self._lock:
+            self._items[key] = (value, fetched_at)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def _lookup(self, key):
+        with self._lock:
+            entry = self._items.get(key)
+            if entry is not None:
+                self._items.move_to_end(key)
+                return entry
+        if self.store is not None:
+            try:
+                entry = self.store.get(key)
+            except Exception as e:
+                print(f"{self.source} cache store read failed:", e)
+                entry = None
+            if entry is not None:
+                self._remember(key, *entry)
+                return entry
+        return None
+
+    def _fetch(self, key, fetch):
+        # Run fetch() once per key at a time; other callers wait for the same result
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+        if not owner:
+            return future.result()
+        try:
+            with self._lock:
+                self.upstream_calls += 1
+            value = fetch()
+            fetched_at = time.time()
+            self._remember(key, value, fetched_at)
+            if self.store is not None:
+                try:
+                    self.store.set(key, value, fetched_at)
+                except Exception as e:
+                    print(f"{self.source} cache store write failed:", e)
+            future.set_result(value)
+            return value
+        except Exception as e:
+            with self._lock:
+                self.upstream_errors += 1
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+    def _refresh(self, key, fetch):
+        try:
+            self._fetch(key, fetch)
+        except Exception as e:
+            print(f"{self.source} background refresh failed:", e)
+
+    def get(self, params, fetch):
+        # fetch() must raise on upstream failure so errors are never cached
+        key = normalise_key(self.source, params)
+        entry = self._lookup(key)
+        if entry is not None:
+            value, fetched_at = entry
+            age = time.time() - fetched_at
+            if age < self.ttl:
+                with self._lock:
+                    self.hits += 1
+                return value
+            if age < self.ttl + self.stale_ttl:
+                with self._lock:
+                    self.stale_hits += 1
+                    refreshing = key in self._inflight
+                if not refreshing:
+                    self._pool().submit(self._refresh, key, fetch)
+                return value
+
+        with self._lock:
+            self.misses += 1
+        try:
+            return self._fetch(key, fetch)
+        except Exception:
+            if entry is not None:
+                return entry[0]  # upstream down: an old answer beats none
+            raise
+
+    def stats(self):
+        with self._lock:
+            return {
+                'items': len(self._items),
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'upstream_calls': self.upstream_calls,
+                'upstream_errors': self.upstream_errors,
+            }
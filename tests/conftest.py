@@ -0,0 +1,55 @@
+# Shared fixtures. The app modules live at the repository root; the Mongo-backed
+# ones are exercised against mongomock (pip install pytest mongomock).
+
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def db(monkeypatch):
+    mongomock = pytest.importorskip('mongomock')
+    # Newer pymongo passes `sort` when queueing bulk updates; mongomock 4.x
+    # does not accept it yet
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    monkeypatch.setattr(mongomock.collection.BulkOperationBuilder, 'add_update', add_update_without_sort)
+    return mongomock.MongoClient().db
+
+
+EXERCISES = {
+    'Push_Up': {'id': 'Push_Up', 'name': 'Push-Up', 'force': 'push', 'level': 'Beginner', 'mechanic': 'compound',
+                'equipment': 'body only', 'category': 'strength', 'primaryMuscles': ['chest'],
+                'secondaryMuscles': ['triceps', 'shoulders'], 'instructions': ['Lower yourself.', 'Push up.'],
+                'images': ['Push_Up/0.jpg', 'Push_Up/1.jpg']},
+    'Barbell_Curl': {'id': 'Barbell_Curl', 'name': 'Barbell Curl', 'force': 'pull', 'level': 'beginner',
+                     'mechanic': 'isolation', 'equipment': 'barbell', 'category': 'strength',
+                     'primaryMuscles': ['biceps'], 'secondaryMuscles': ['forearms'],
+                     'instructions': ['Curl.'], 'images': []},
+    'Jump_Squat': {'name': 'Jump Squat', 'force': 'push', 'level': 'intermediate', 'mechanic': None,
+                   'equipment': None, 'category': 'plyometrics', 'primaryMuscles': ['quadriceps'],
+                   'secondaryMuscles': ['calves', 'glutes'], 'instructions': ['Jump.'], 'images': ['é.jpg']},
+    'Hamstring_Stretch': {'id': 'Hamstring_Stretch', 'name': ' Hamstring Stretch ', 'level': 'beginner',
+                          'equipment': 'body only', 'category': 'stretching', 'primaryMuscles': ['hamstrings'],
+                          'secondaryMuscles': [], 'instructions': 'not a list'},
+    'Broken': {'id': 'Broken', 'force': 'push'},
+}
+
+
+@pytest.fixture
+def exercise_dir(tmp_path):
+    # A small descriptor directory like static/exercises, with one unusable
+    # descriptor and one file that is not JSON
+    import json
+    directory = tmp_path / 'exercises'
+    directory.mkdir()
+    for name, doc in EXERCISES.items():
+        (directory / f'{name}.json').write_text(json.dumps(doc), encoding='utf-8')
+    (directory / 'Garbage.json').write_text('{not json', encoding='utf-8')
+    return directory
@@ -0,0 +1,101 @@
+from datetime import datetime
+
+import pytest
+
+from activity_engine import CODES, DEFAULT_WEIGHT, MAX_MINUTES, entry, priced, recompute, weight_of
+
+
+def test_weight_of():
+    assert weight_of({'weight': '72.5'}) == 72.5
+    for user in (None, {}, {'weight': 'heavy'}, {'weight': 5}, {'weight': 1000}):
+        assert weight_of(user) == DEFAULT_WEIGHT
+
+
+def test_entry_uses_the_met_formula():
+    assert entry('swimming_casual', 30, 60) == {
+        'code': 'swimming_casual', 'name': 'Swimming (Casual)', 'met': 7.0, 'minutes': 30.0, 'duration': 1800,
+        'workout_type': 'aerobic', 'exercises': [{'name': 'Swimming (Casual)'}], 'calories': 220.5,
+    }
+    assert entry('squash', '20', 80)['calories'] == 336.0
+    assert entry('standing_office_work', 60, 60)['calories'] == 144.9
+
+
+@pytest.mark.parametrize('minutes', [0, 0.5, MAX_MINUTES + 1, 'ten', None, -5])
+def test_entry_rejects_bad_minutes(minutes):
+    with pytest.raises(ValueError):
+        entry('squash', minutes, 60)
+
+
+def test_entry_rejects_unknown_codes():
+    with pytest.raises(ValueError):
+        entry('underwater_basket_weaving', 30, 60)
+
+
+def test_priced_totals_coded_entries_and_ignores_client_calories():
+    entries, total = priced([{'code': 'swimming_casual', 'minutes': 30, 'calories': 5000},
+                             {'code': 'squash', 'minutes': 20}], 60)
+    assert [e['calories'] for e in entries] == [220.5, 252.0]
+    assert total == 472.5
+
+
+@pytest.mark.parametrize('activities', [
+    [{'name': 'Zumba', 'minutes': 30, 'calories': 300}],
+    [{'code': 'squash', 'minutes': 20}, {'calories': 100}],
+    ['squash'],
+    {'code': 'squash', 'minutes': 20},
+])
+def test_priced_rejects_entries_it_cannot_price(activities):
+    with pytest.raises(ValueError):
+        priced(activities, 60)
+
+
+def test_priced_empty_list():
+    assert priced([], 60) == ([], 0)
+
+
+def test_codes_are_unique():
+    assert len(CODES) == len(set(CODES))
+
+
+def test_recompute_reprices_at_the_new_weight(db):
+    stamp = datetime(2026, 3, 2, 8)
+    activities, _ = priced([{'code': 'swimming_casual', 'minutes': 30}, {'code': 'squash', 'minutes': 20}], 60)
+    db.activity.insert_many([
+        {'_id': 1, 'user_id': 'u1', 'activities': activities, 'calories_burnt': 472.5, 'updated_at': stamp},
+        # saved before pricing moved to the server: the uncoded entry keeps its calories
+        {'_id': 2, 'user_id': 'u1', 'updated_at': stamp, 'calories_burnt': 310,
+         'activities': [{'name': 'Zumba', 'calories': 200}, dict(entry('squash', 10, 60), calories=110)]},
+        {'_id': 3, 'user_id': 'u2', 'activities': activities, 'calories_burnt': 472.5, 'updated_at': stamp},
+        {'_id': 4, 'user_id': 'u1', 'steps': 1000},
+    ])
+    assert recompute(db.activity, {'u1': 80}, batch_size=1) == 2
+
+    first = db.activity.find_one({'_id': 1})
+    assert [a['calories'] for a in first['activities']] == [294.0, 336.0]
+    assert first['calories_burnt'] == 630.0
+    second = db.activity.find_one({'_id': 2})
+    assert [a['calories'] for a in second['activities']] == [200, 168.0]
+    assert second['calories_burnt'] == 368.0
+    assert db.activity.find_one({'_id': 3})['calories_burnt'] == 472.5
+    assert 'calories_burnt' not in db.activity.find_one({'_id': 4})
+
+
+def test_recompute_leaves_days_changed_meanwhile(db):
+    activities, total = priced([{'code': 'squash', 'minutes': 20}], 60)
+    db.activity.insert_one({'_id': 1, 'user_id': 'u1', 'activities': activities, 'calories_burnt': total,
+                            'updated_at': datetime(2026, 3, 2, 8)})
+    find = db.activity.find
+
+    def find_then_concurrent_write(*args, **kwargs):
+        docs = list(find(*args, **kwargs))
+        db.activity.update_one({'_id': 1}, {'$set': {'updated_at': datetime(2026, 3, 2, 9)}})
+        return docs
+
+    collection = type('Activity', (), {'find': staticmethod(find_then_concurrent_write),
+                                       'bulk_write': staticmethod(db.activity.bulk_write)})
+    assert recompute(collection, {'u1': 80}) == 0
+    assert db.activity.find_one({'_id': 1})['calories_burnt'] == total
+
+
+def test_recompute_without_entries(db):
+    assert recompute(db.activity, {'u1': 80}) == 0
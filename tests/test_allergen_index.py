@@ -0,0 +1,55 @@
+import numpy as np
+
+from allergen_index import AllergenIndex, allergy_key
+
+FOODS = [
+    {'_id': 'toast', 'ingredients': ['Wheat', 'butter']},
+    {'_id': 'satay', 'ingredients': ['chicken', 'peanut '], 'allergens': ['tree nut']},
+    {'_id': 'salad', 'ingredients': ['lettuce']},
+    {'_id': 'kheer', 'ingredients': 'milk, rice', 'allergens': ['Milk']},
+    {'_id': 'plain'},
+]
+
+
+def test_allergy_key_normalises():
+    assert allergy_key([' Peanut', 'peanut', '', None, 'MILK']) == frozenset({'peanut', 'milk'})
+    assert allergy_key(None) == frozenset()
+
+
+def test_safe_ids_excludes_any_matching_food():
+    index = AllergenIndex(FOODS)
+    assert index.safe_ids([]) == ['toast', 'satay', 'salad', 'kheer', 'plain']
+    assert index.safe_ids(['PEANUT']) == ['toast', 'salad', 'kheer', 'plain']
+    assert index.safe_ids(['peanut', 'wheat']) == ['salad', 'kheer', 'plain']
+    assert index.safe_ids(['tree nut', 'milk']) == ['toast', 'salad', 'plain']
+    assert index.safe_ids(['shellfish']) == index.ids
+
+
+def test_safe_mask_matches_safe_ids():
+    index = AllergenIndex(FOODS)
+    for allergies in ([], ['milk'], ['peanut', 'butter'], ['lettuce', 'wheat', 'milk', 'peanut']):
+        mask = index.safe_mask(allergies)
+        assert mask.dtype == np.bool_ and mask.shape == (len(FOODS),)
+        assert [fid for fid, ok in zip(index.ids, mask) if ok] == index.safe_ids(allergies)
+
+
+def test_is_safe_treats_unknown_foods_as_safe():
+    index = AllergenIndex(FOODS)
+    assert not index.is_safe('satay', ['peanut'])
+    assert index.is_safe('salad', ['peanut'])
+    assert index.is_safe('not-indexed', ['peanut'])
+
+
+def test_cache_is_bounded():
+    index = AllergenIndex(FOODS, cache_size=2)
+    for allergies in (['milk'], ['wheat'], ['peanut']):
+        index.unsafe_bits(allergies)
+    assert len(index._unsafe) <= 2
+    assert index.safe_ids(['milk']) == ['toast', 'satay', 'salad', 'plain']
+
+
+def test_large_index_mask():
+    foods = [{'_id': i, 'ingredients': ['egg'] if i % 3 == 0 else []} for i in range(1000)]
+    mask = AllergenIndex(foods).safe_mask(['egg'])
+    assert mask.sum() == 666
+    assert not mask[0] and mask[1] and not mask[999]
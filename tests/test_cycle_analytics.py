@@ -0,0 +1,148 @@
+from datetime import date, datetime, timedelta
+
+import numpy as np
+from bson.objectid import ObjectId
+
+from cycle_analytics import (DEFAULT_LENGTH, MIN_GAP, load_histories, merge_starts, predict, predict_many,
+                             reminder_due, to_day, user_id_batches)
+
+
+def day(iso):
+    return date.fromisoformat(iso).toordinal()
+
+
+def every(first, length, count):
+    return [day(first) + k * length for k in range(count)]
+
+
+def test_to_day_accepts_strings_dates_and_datetimes():
+    assert to_day('2026-03-01') == to_day(date(2026, 3, 1)) == to_day(datetime(2026, 3, 1, 23, 59))
+    assert to_day('2026-03-01T08:00:00') == day('2026-03-01')
+    assert to_day('01/03/2026') is None
+    assert to_day(None) is None
+
+
+def test_merge_starts_collapses_duplicate_logs():
+    first = day('2026-01-01')
+    assert merge_starts([first + 30, None, first, first + 2, first + MIN_GAP - 1, first + MIN_GAP]) == \
+        [first, first + MIN_GAP, first + 30]
+
+
+def test_no_history():
+    assert predict({'starts': [], 'reported_length': 30}) == {'has_history': False}
+
+
+def test_cycle_day_counts_the_start_as_day_one():
+    # Same convention as the dashboard: (today - start).days + 1
+    history = {'starts': [day('2026-03-01')], 'reported_length': None}
+    assert predict(history, today=date(2026, 3, 1))['cycle_day'] == 1
+    assert predict(history, today=date(2026, 3, 10))['cycle_day'] == 10
+
+
+def test_single_start_predicts_from_the_prior():
+    result = predict({'starts': [day('2026-03-01')], 'reported_length': 30}, today=date(2026, 3, 5))
+    assert result['cycles_observed'] == 0
+    assert result['mean_cycle_length'] == 30
+    assert result['predicted_date'] == '2026-03-31'
+    assert not result['irregular']
+    default = predict({'starts': [day('2026-03-01')], 'reported_length': 200}, today=date(2026, 3, 5))
+    assert default['mean_cycle_length'] == DEFAULT_LENGTH
+
+
+def test_regular_history():
+    starts = every('2025-10-01', 29, 6)
+    result = predict({'starts': starts, 'reported_length': 29}, today=date.fromordinal(starts[-1] + 3))
+    assert result['cycles_observed'] == 5
+    assert result['mean_cycle_length'] == 29
+    assert result['predicted_date'] == date.fromordinal(starts[-1] + 29).isoformat()
+    windows = result['windows']
+    assert len(windows) == 3
+    for w in windows:
+        assert w['earliest'] <= w['predicted'] <= w['latest']
+    widths = [day(w['latest']) - day(w['earliest']) for w in windows]
+    assert widths == sorted(widths) and widths[0] < widths[-1]
+    assert not result['irregular'] and not result['long_cycles']
+
+
+def test_short_history_is_pulled_towards_the_reported_length():
+    starts = every('2026-01-01', 34, 2)
+    result = predict({'starts': starts, 'reported_length': 28}, today=date.fromordinal(starts[-1]))
+    assert 28 < result['mean_cycle_length'] < 34
+
+
+def test_missed_logs_are_not_cycles():
+    starts = [day('2026-01-01'), day('2026-01-29'), day('2026-05-01')]
+    result = predict({'starts': starts, 'reported_length': None}, today=date(2026, 5, 2))
+    assert result['cycles_observed'] == 1
+
+
+def test_irregular_and_long_cycles():
+    long = every('2025-01-01', 45, 6)
+    result = predict({'starts': long, 'reported_length': None}, today=date.fromordinal(long[-1]))
+    assert result['long_cycles'] and result['irregular']
+    gaps = [20, 40, 18, 45, 22]
+    varied = [day('2025-06-01')]
+    for gap in gaps:
+        varied.append(varied[-1] + gap)
+    result = predict({'starts': varied, 'reported_length': 28}, today=date.fromordinal(varied[-1]))
+    assert result['irregular'] and not result['long_cycles']
+
+
+def test_overdue_prediction_skips_past_windows():
+    last = day('2026-01-01')
+    result = predict({'starts': [last], 'reported_length': 28}, today=date(2026, 4, 1))
+    assert result['predicted_date'] >= '2026-03-20'
+    assert result['windows'][0]['latest'] >= '2026-04-01'
+
+
+def test_predict_many_matches_predict():
+    histories = [
+        {'starts': every('2025-11-03', 27, 5), 'reported_length': None},
+        {'starts': [], 'reported_length': 28},
+        {'starts': every('2025-12-20', 33, 3), 'reported_length': 31},
+    ]
+    today = date(2026, 2, 15)
+    result = predict_many(histories, today)
+    assert np.isnan(result['cycle_day'][1])
+    for i, history in enumerate(histories):
+        expected = predict(history, today)
+        if expected['has_history']:
+            assert int(result['cycle_day'][i]) == expected['cycle_day']
+            assert date.fromordinal(int(round(result['predicted_start'][i, 0]))).isoformat() == \
+                expected['predicted_date']
+
+
+def test_reminder_due_two_days_before_the_window():
+    history = {'starts': every('2026-01-01', 28, 4), 'reported_length': 28}
+    result = predict_many([history, {'starts': [], 'reported_length': None}], date(2026, 3, 30))
+    reminder = date.fromordinal(int(result['window_start'][0, 0]) - 2)
+    assert reminder_due(result, reminder).tolist() == [True, False]
+    assert reminder_due(result, reminder + timedelta(days=1)).tolist() == [False, False]
+
+
+def test_load_histories_merges_every_source(db):
+    uid, other = ObjectId(), ObjectId()
+    db.users.insert_many([
+        {'_id': uid, 'last_period_date': '2026-03-01', 'cycle_length': '29',
+         'cycles': [{'start': '2026-01-03'}, {'start': datetime(2026, 1, 4)}, {}]},
+        {'_id': other, 'cycle_length': 'n/a'},
+    ])
+    db.cycles.insert_many([{'user_id': str(uid), 'start_date': '2026-02-01'},
+                           {'user_id': str(uid), 'start_date': '2026-03-02'},
+                           {'user_id': 'someone-else', 'start_date': '2026-02-01'}])
+    db.cycle.insert_one({'user_id': str(uid), 'last_period_date': '2025-12-05'})
+
+    histories = load_histories(db)
+    assert histories[str(uid)] == {
+        'starts': [day('2025-12-05'), day('2026-01-03'), day('2026-02-01'), day('2026-03-01')],
+        'reported_length': 29,
+    }
+    assert histories[str(other)] == {'starts': [], 'reported_length': None}
+    assert list(load_histories(db, [str(other)])) == [str(other)]
+
+
+def test_user_id_batches(db):
+    ids = [ObjectId() for _ in range(5)]
+    db.users.insert_many([{'_id': i} for i in ids])
+    assert list(user_id_batches(db, batch_size=2)) == [[str(i) for i in ids[:2]], [str(i) for i in ids[2:4]],
+                                                       [str(ids[4])]]
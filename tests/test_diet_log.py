@@ -0,0 +1,131 @@
+import pytest
+from bson.objectid import ObjectId
+
+from diet_log import MAX_OPS, DietLog, validate_ops
+
+DAY = '2026-03-02'
+RICE, DAL = ObjectId(), ObjectId()
+CATALOG = {
+    RICE: {'_id': RICE, 'food_name': 'Rice', 'energy_kcal': 130, 'protein_g': 2.7, 'carb_g': 28, 'fat_g': 0.3},
+    DAL: {'_id': DAL, 'food_name': 'Dal', 'energy_kcal': 116, 'protein_g': 9, 'carb_g': 20, 'fat_g': 0.4},
+}
+
+
+def add(item_id, food, meal='lunch', servings=1):
+    return {'op': 'add', 'meal': meal, 'item_id': item_id, 'food_id': str(food), 'servings': servings}
+
+
+def remove(item_id, meal='lunch'):
+    return {'op': 'remove', 'meal': meal, 'item_id': item_id}
+
+
+@pytest.fixture
+def log(db):
+    changes = []
+    log = DietLog(db.diet, lambda ids: {i: CATALOG[i] for i in ids if i in CATALOG},
+                  on_change=lambda user, day, delta, new_day: changes.append((delta, new_day)))
+    log.changes = changes
+    return log
+
+
+def item_ids(view, meal='lunch'):
+    return [item['item_id'] for item in view['foods'][meal]]
+
+
+def test_validate_ops():
+    assert validate_ops([add('a', RICE, servings='2')])[0]['servings'] == 2.0
+    for ops in ([], [{}] * (MAX_OPS + 1), [{'op': 'edit'}], [add('a', RICE, meal='brunch')], [add('', RICE)],
+                [add('a', RICE, servings=0)], [add('a', RICE, servings=21)], [add('a', '')]):
+        with pytest.raises(ValueError):
+            validate_ops(ops)
+
+
+def test_items_are_priced_from_the_catalog(log):
+    view = log.apply('u1', DAY, 'k1', [dict(add('a', RICE, servings=2), calories=9999)])
+    assert view['foods']['lunch'] == [{'item_id': 'a', 'food_id': str(RICE), 'food_name': 'Rice', 'servings': 2.0,
+                                       'calories': 260.0, 'protein': 5.4, 'carbs': 56.0, 'fats': 0.6}]
+    assert view['totals'] == {'calories_consumed': 260.0, 'protein': 5.4, 'carbs': 56.0, 'fats': 0.6}
+
+
+def test_unknown_food_id_is_rejected(log, db):
+    with pytest.raises(ValueError):
+        log.apply('u1', DAY, 'k1', [add('a', ObjectId())])
+    with pytest.raises(ValueError):
+        log.apply('u1', DAY, 'k1', [add('a', 'not-an-object-id')])
+    assert db.diet.count_documents({}) == 0
+
+
+def test_replaying_a_batch_is_a_no_op(log, db):
+    ops = [add('a', RICE), add('b', DAL, meal='dinner')]
+    first = log.apply('u1', DAY, 'k1', ops)
+    assert log.apply('u1', DAY, 'k1', ops) == first
+    assert first['totals']['calories_consumed'] == 246.0
+    assert db.diet.find_one()['applied_ops'] == ['k1']
+
+
+def test_repeated_add_under_a_new_key_is_not_double_counted(log):
+    log.apply('u1', DAY, 'k1', [add('a', RICE)])
+    view = log.apply('u1', DAY, 'k2', [add('a', RICE)])
+    assert item_ids(view) == ['a']
+    assert view['totals']['calories_consumed'] == 130.0
+
+
+def test_add_and_remove_in_one_batch_nets_out(log):
+    view = log.apply('u1', DAY, 'k1', [add('a', RICE), add('b', DAL), remove('a')])
+    assert item_ids(view) == ['b']
+    assert view['totals']['calories_consumed'] == 116.0
+
+
+def test_remove_and_add_on_one_meal_applies_both(log):
+    log.apply('u1', DAY, 'k1', [add('a', RICE), add('b', DAL)])
+    view = log.apply('u1', DAY, 'k2', [remove('a'), add('c', DAL)])
+    assert item_ids(view) == ['b', 'c']
+    assert view['totals']['calories_consumed'] == 232.0
+    assert view['totals']['protein'] == 18.0
+
+
+def test_remove_checks_the_meal_and_ignores_missing_items(log):
+    log.apply('u1', DAY, 'k1', [add('a', RICE)])
+    view = log.apply('u1', DAY, 'k2', [remove('a', meal='dinner'), remove('zzz')])
+    assert item_ids(view) == ['a']
+    assert view['totals']['calories_consumed'] == 130.0
+
+
+def test_guards_reject_stale_updates(log, db):
+    log.apply('u1', DAY, 'k1', [add('a', RICE)])
+    doc = log._day('u1', DAY)
+    phases = log._phases([remove('a')], doc, {})
+    assert log._apply('u1', DAY, phases[0]) is True
+    # The same removal again: the $all guard no longer matches, totals stay put
+    assert log._apply('u1', DAY, phases[0]) is False
+    items = log.items([validate_ops([add('b', DAL)])[0]])
+    phases = log._phases(validate_ops([add('b', DAL)]), log._day('u1', DAY), items)
+    assert log._apply('u1', DAY, phases[0]) is True
+    # The same push again: the $nin guard no longer matches
+    assert log._apply('u1', DAY, phases[0]) is False
+    assert db.diet.find_one()['calories_consumed'] == 116.0
+
+
+def test_on_change_reports_a_new_day_once(log):
+    log.apply('u1', DAY, 'k1', [add('a', RICE)])
+    log.apply('u1', DAY, 'k2', [add('b', DAL)])
+    assert [new_day for _, new_day in log.changes] == [True, False, False]
+    assert log.changes[1][0]['calories_consumed'] == 130
+    assert log.changes[2][0]['calories_consumed'] == 116
+
+
+def test_legacy_food_list_is_kept_under_other(log, db):
+    legacy = [{'food_name': 'Tea', 'calories': 30}]
+    db.diet.insert_one({'user_id': 'u1', 'date': DAY, 'foods': legacy, 'calories_consumed': 30})
+    view = log.apply('u1', DAY, 'k1', [add('a', RICE, meal='breakfast')])
+    doc = db.diet.find_one()
+    assert doc['foods']['other'] == legacy
+    assert item_ids(view, 'breakfast') == ['a']
+    assert view['totals']['calories_consumed'] == 160.0
+
+
+def test_applied_keys_are_bounded(log, db, monkeypatch):
+    monkeypatch.setattr('diet_log.APPLIED_OPS_KEPT', 3)
+    for n in range(5):
+        log.apply('u1', DAY, f'k{n}', [add(f'i{n}', RICE)])
+    assert db.diet.find_one()['applied_ops'] == ['k2', 'k3', 'k4']
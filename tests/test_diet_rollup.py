@@ -0,0 +1,99 @@
+from datetime import date
+
+import pytest
+from bson.objectid import ObjectId
+
+from diet_log import DietLog
+from diet_rollup import DietRollups, daily, deltas, week_start
+
+RICE = ObjectId()
+CATALOG = {RICE: {'_id': RICE, 'food_name': 'Rice', 'energy_kcal': 130, 'protein_g': 2.7, 'carb_g': 28,
+                  'fat_g': 0.3}}
+
+
+def add(item_id, meal='lunch'):
+    return {'op': 'add', 'meal': meal, 'item_id': item_id, 'food_id': str(RICE), 'servings': 1}
+
+
+def test_week_start_is_monday():
+    assert week_start('2026-03-02') == '2026-03-02'
+    assert week_start('2026-03-08') == '2026-03-02'
+    assert week_start('2026-03-09') == '2026-03-09'
+
+
+def test_deltas():
+    assert deltas(None, {'calories_consumed': '200', 'protein': 10}) == \
+        {'calories_consumed': 200.0, 'protein': 10.0, 'carbs': 0.0, 'fats': 0.0}
+    assert deltas({'calories_consumed': 300, 'fats': 'n/a'}, {'calories_consumed': 250, 'fats': 5}) == \
+        {'calories_consumed': -50.0, 'protein': 0.0, 'carbs': 0.0, 'fats': 5.0}
+
+
+def test_days_logged_counts_the_first_write_only(db):
+    rollups = DietRollups(db.diet_rollups)
+    log = DietLog(db.diet, lambda ids: {i: CATALOG[i] for i in ids}, on_change=rollups.add)
+    log.apply('u1', '2026-03-02', 'k1', [add('a')])
+    doc = db.diet_rollups.find_one({'_id': 'u1:2026-03-02'})
+    assert doc['days_logged'] == 1
+    assert doc['calories_consumed'] == 130
+
+    log.apply('u1', '2026-03-02', 'k2', [add('b', meal='dinner')])
+    log.apply('u1', '2026-03-02', 'k2', [add('b', meal='dinner')])
+    doc = db.diet_rollups.find_one({'_id': 'u1:2026-03-02'})
+    assert doc['days_logged'] == 1
+    assert doc['calories_consumed'] == 260
+
+    log.apply('u1', '2026-03-04', 'k3', [add('c')])
+    doc = db.diet_rollups.find_one({'_id': 'u1:2026-03-02'})
+    assert doc['days_logged'] == 2
+    assert doc['calories_consumed'] == 390
+    assert doc['protein'] == pytest.approx(8.1)
+
+
+def test_whole_day_saves_follow_new_day(db):
+    # save_diet_day passes new_day=True only when its upsert created the day
+    rollups = DietRollups(db.diet_rollups)
+    first = {'calories_consumed': 1500, 'protein': 60, 'carbs': 180, 'fats': 50}
+    rollups.add('u1', '2026-03-03', deltas(None, first), new_day=True)
+    second = dict(first, calories_consumed=1800)
+    rollups.add('u1', '2026-03-03', deltas(first, second), new_day=False)
+    rollups.add('u1', '2026-03-03', deltas(second, second), new_day=False)
+    doc = db.diet_rollups.find_one({'_id': 'u1:2026-03-02'})
+    assert doc['days_logged'] == 1
+    assert doc['calories_consumed'] == 1800
+    assert doc['user_id'] == 'u1' and doc['week_start'] == '2026-03-02'
+
+
+def test_empty_delta_writes_nothing(db):
+    DietRollups(db.diet_rollups).add('u1', '2026-03-03', {m: 0 for m in ('calories_consumed', 'protein')})
+    assert db.diet_rollups.count_documents({}) == 0
+
+
+def test_weekly_series_fills_missing_weeks(db):
+    rollups = DietRollups(db.diet_rollups)
+    rollups.add('u1', '2026-02-17', {'calories_consumed': 1200.04}, new_day=True)
+    rollups.add('u1', '2026-03-04', {'calories_consumed': 900, 'fats': 30}, new_day=True)
+    rollups.add('u2', '2026-03-04', {'calories_consumed': 5000}, new_day=True)
+    series = rollups.weekly('u1', 3, today=date(2026, 3, 8))
+    assert series == {
+        'weeks': ['2026-02-16', '2026-02-23', '2026-03-02'],
+        'days_logged': [1, 0, 1],
+        'calories_consumed': [1200.0, 0.0, 900.0],
+        'protein': [0.0, 0.0, 0.0],
+        'carbs': [0.0, 0.0, 0.0],
+        'fats': [0.0, 0.0, 30.0],
+    }
+
+
+def test_daily_series(db):
+    db.diet.insert_many([
+        {'user_id': 'u1', 'date': '2026-03-01', 'calories_consumed': 1500, 'protein': 50, 'total_allowed': 1800},
+        {'user_id': 'u1', 'date': '2026-03-03', 'calories_consumed': '1700.26', 'total_allowed': 1800},
+        {'user_id': 'u1', 'date': '2026-02-20', 'calories_consumed': 900},
+        {'user_id': 'u2', 'date': '2026-03-02', 'calories_consumed': 2000},
+    ])
+    series = daily(db.diet, 'u1', 3, today=date(2026, 3, 3))
+    assert series['dates'] == ['2026-03-01', '2026-03-02', '2026-03-03']
+    assert series['logged'] == [True, False, True]
+    assert series['calories_consumed'] == [1500.0, 0.0, 1700.3]
+    assert series['protein'] == [50.0, 0.0, 0.0]
+    assert series['total_allowed'] == [1800.0, 0.0, 1800.0]
@@ -0,0 +1,56 @@
+from exercise_catalog import ExerciseCatalog, validate
+
+
+def test_parse_directory_skips_unusable_descriptors(exercise_dir, capsys):
+    exercises = ExerciseCatalog.parse_directory(str(exercise_dir))
+    assert [ex['id'] for ex in exercises] == ['Barbell_Curl', 'Hamstring_Stretch', 'Jump_Squat', 'Push_Up']
+    out = capsys.readouterr().out
+    assert 'Broken' in out and 'Garbage' in out
+
+
+def test_validate_cleans_fields():
+    ex = validate({'name': ' Hamstring Stretch ', 'level': 'Beginner', 'force': '  ',
+                   'primaryMuscles': ['hamstrings', 3], 'instructions': 'not a list'}, 'Hamstring_Stretch.json')
+    assert ex['id'] == 'Hamstring_Stretch'
+    assert ex['name'] == 'Hamstring Stretch'
+    assert ex['level'] == 'beginner'
+    assert ex['force'] is None
+    assert ex['primaryMuscles'] == ['hamstrings']
+    assert ex['instructions'] == [] and ex['images'] == []
+    assert validate({'name': ''}, 'x.json') is None
+
+
+def test_facets_and_within_or_across(exercise_dir):
+    catalog = ExerciseCatalog.load(str(exercise_dir))
+    ids = lambda rows: [catalog.ids[r] for r in rows]
+    assert ids(catalog.query({'level': 'Beginner'})) == ['Barbell_Curl', 'Hamstring_Stretch', 'Push_Up']
+    assert ids(catalog.query({'level': 'beginner', 'equipment': 'body only'})) == ['Hamstring_Stretch', 'Push_Up']
+    assert ids(catalog.query({'equipment': ['barbell', None]})) == ['Barbell_Curl', 'Jump_Squat']
+    assert ids(catalog.query({'muscle': 'triceps'})) == ['Push_Up']
+    assert ids(catalog.query({'primary_muscle': 'triceps'})) == []
+    assert ids(catalog.query({'level': [], 'unknown': 'x'})) == catalog.ids
+
+
+def test_name_search_ranks_within_filters(exercise_dir):
+    catalog = ExerciseCatalog.load(str(exercise_dir))
+    assert [catalog.ids[r] for r in catalog.query(q='squat')] == ['Jump_Squat']
+    assert catalog.query({'category': 'strength'}, q='squat') == []
+    assert [catalog.ids[r] for r in catalog.query(q='push')] == ['Push_Up']
+
+
+def test_paging_and_lookups(exercise_dir):
+    catalog = ExerciseCatalog.load(str(exercise_dir))
+    assert len(catalog) == 4
+    assert catalog.query(limit=2, offset=1) == [1, 2]
+    assert catalog.query(limit=None, offset=3) == [3]
+    assert catalog.by_id('Push_Up')['secondaryMuscles'] == ['triceps', 'shoulders']
+    assert catalog.by_id('nope') is None
+    assert catalog.project(catalog.rows['Push_Up'], ['name', 'images', 'missing']) == {
+        'name': 'Push-Up', 'images': ['Push_Up/0.jpg', 'Push_Up/1.jpg']}
+
+
+def test_facet_values_counts(exercise_dir):
+    values = ExerciseCatalog.load(str(exercise_dir)).facet_values()
+    assert values['level'] == {'beginner': 3, 'intermediate': 1}
+    assert values['equipment'] == {'body only': 2, 'barbell': 1}
+    assert None not in values['mechanic']
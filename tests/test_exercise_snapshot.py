@@ -0,0 +1,76 @@
+import os
+
+import pytest
+
+import exercise_snapshot
+from exercise_catalog import ExerciseCatalog
+from exercise_snapshot import Snapshot, build, load_catalog
+
+STATIC_EXERCISES = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'exercises')
+
+
+def assert_same_catalog(directory, snapshot_path):
+    expected = ExerciseCatalog.load(directory)
+    catalog = load_catalog(directory, snapshot_path)
+    try:
+        assert len(catalog) == len(expected)
+        assert catalog.ids == expected.ids
+        assert list(catalog.exercises) == list(expected.exercises)
+        assert catalog.index == expected.index
+        assert catalog.facet_values() == expected.facet_values()
+        for filters, q in (({}, None), ({'level': 'beginner'}, None), ({'equipment': ['body only', None]}, None),
+                           ({'muscle': 'chest'}, 'push'), ({}, 'squat'), ({'category': 'stretching'}, 'ham')):
+            assert catalog.query(filters, q, limit=None) == expected.query(filters, q, limit=None)
+        for row in range(len(expected)):
+            assert catalog.project(row, ['name', 'images']) == expected.project(row, ['name', 'images'])
+    finally:
+        catalog.exercises.close()
+
+
+def test_snapshot_matches_json_catalog(exercise_dir, tmp_path):
+    assert_same_catalog(str(exercise_dir), str(tmp_path / 'exercises.snapshot'))
+
+
+@pytest.mark.skipif(not os.path.isdir(STATIC_EXERCISES), reason="static/exercises not present")
+def test_snapshot_matches_shipped_catalog(tmp_path):
+    assert_same_catalog(STATIC_EXERCISES, str(tmp_path / 'exercises.snapshot'))
+
+
+def test_rows_out_of_range(exercise_dir, tmp_path):
+    path = str(tmp_path / 'exercises.snapshot')
+    build(str(exercise_dir), path)
+    with Snapshot(path) as snapshot:
+        with pytest.raises(IndexError):
+            snapshot[len(snapshot)]
+        with pytest.raises(IndexError):
+            snapshot.project(-1, ['name'])
+
+
+def test_stale_snapshot_is_rebuilt(exercise_dir, tmp_path, monkeypatch):
+    path = str(tmp_path / 'exercises.snapshot')
+    load_catalog(str(exercise_dir), path).exercises.close()
+    builds = []
+    monkeypatch.setattr(exercise_snapshot, 'build', lambda d, p: builds.append(p) or build(d, p))
+
+    load_catalog(str(exercise_dir), path).exercises.close()
+    assert builds == []
+
+    (exercise_dir / 'Side_Plank.json').write_text('{"name": "Side Plank", "level": "expert"}', encoding='utf-8')
+    catalog = load_catalog(str(exercise_dir), path)
+    assert builds == [path]
+    assert catalog.by_id('Side_Plank')['level'] == 'expert'
+    catalog.exercises.close()
+
+
+@pytest.mark.parametrize('content', [b'', b'garbage' * 10, exercise_snapshot.MAGIC + b'\0' * 20])
+def test_unreadable_snapshot_is_rebuilt(exercise_dir, tmp_path, content):
+    path = tmp_path / 'exercises.snapshot'
+    path.write_bytes(content)
+    catalog = load_catalog(str(exercise_dir), str(path))
+    assert catalog.ids == ExerciseCatalog.load(str(exercise_dir)).ids
+    catalog.exercises.close()
+
+
+def test_build_leaves_no_temporary_files(exercise_dir, tmp_path):
+    build(str(exercise_dir), str(tmp_path / 'exercises.snapshot'))
+    assert sorted(os.listdir(tmp_path)) == ['exercises', 'exercises.snapshot']
@@ -0,0 +1,57 @@
+from bson.objectid import ObjectId
+
+from food_search import FoodSearchIndex, normalise, trigrams
+
+FOODS = ['Rice', 'Rice kheer with jaggery', 'Brown rice', 'Fried rice', 'Paneer tikka',
+         'Palak paneer', 'Masala dosa', 'Chicken curry', 'Apple']
+
+
+def index():
+    return FoodSearchIndex([{'food_name': name} for name in FOODS])
+
+
+def names(results):
+    return [food['food_name'] for food in results]
+
+
+def test_normalise_and_trigrams():
+    assert normalise('  Palak   PANEER ') == 'palak paneer'
+    assert normalise(None) == ''
+    assert {'  r', ' ri', 'ric', 'ice', 'ce '} == trigrams('rice')
+
+
+def test_whole_name_prefix_comes_first_shortest_first():
+    assert names(index().search('rice', limit=2)) == ['Rice', 'Rice kheer with jaggery']
+
+
+def test_word_prefix_after_name_prefix():
+    assert names(index().search('rice')) == ['Rice', 'Rice kheer with jaggery', 'Brown rice', 'Fried rice']
+    assert names(index().search('pan')) == ['Paneer tikka', 'Palak paneer']
+
+
+def test_substring_tier():
+    assert names(index().search('osa')) == ['Masala dosa']
+
+
+def test_fuzzy_tier_finds_typos():
+    assert names(index().search('chiken curry'))[0] == 'Chicken curry'
+    assert set(names(index().search('panner'))[:2]) == {'Paneer tikka', 'Palak paneer'}
+
+
+def test_no_match_and_limit():
+    assert index().search('zzzz') == []
+    assert len(index().search('r', limit=3)) == 3
+
+
+def test_empty_query_lists_alphabetically():
+    assert names(index().search('', limit=3)) == ['Apple', 'Brown rice', 'Chicken curry']
+
+
+def test_ids_are_strings_and_results_are_copies():
+    oid = ObjectId()
+    idx = FoodSearchIndex([{'_id': oid, 'food_name': 'Apple'}, {'food_name': ''}])
+    result = idx.search('apple')
+    assert result == [{'_id': str(oid), 'food_name': 'Apple'}]
+    result[0]['food_name'] = 'changed'
+    assert idx.search('apple')[0]['food_name'] == 'Apple'
+    assert len(idx.foods) == 1
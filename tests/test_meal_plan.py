@@ -0,0 +1,79 @@
+from datetime import datetime
+
+import numpy as np
+
+from allergen_index import AllergenIndex
+from meal_plan import DEFAULT_CALORIES, MEALS, MealPlanner, daily_targets
+
+
+def food(fid, kcal, protein, carb, fat, ingredients=()):
+    return {'_id': fid, 'energy_kcal': kcal, 'protein_g': protein, 'carb_g': carb, 'fat_g': fat,
+            'fibre_g': 3, 'freesugar_g': 2, 'ingredients': list(ingredients)}
+
+
+FOODS = [food(f'f{i}', 150 + 40 * i, 5 + i, 20 + 3 * i, 4 + i) for i in range(12)]
+FOODS.append(food('peanut_bar', 500, 12, 40, 20, ['Peanut']))
+
+
+def test_daily_targets_defaults_and_goals():
+    kcal, protein, carb, fat, _, _ = daily_targets({})
+    assert kcal == DEFAULT_CALORIES
+    assert (protein * 4 + carb * 4 + fat * 9) == DEFAULT_CALORIES
+    assert daily_targets({'target_calories': '1600', 'protein_goal': 90})[:2] == [1600, 90]
+    assert daily_targets({'target_calories': float('nan')})[0] == DEFAULT_CALORIES
+
+
+def test_plan_shape_and_dates():
+    plan = MealPlanner(FOODS).plan({}, start=datetime(2026, 3, 2), seed=1)
+    assert [day['date'] for day in plan] == [f'2026-03-0{d}' for d in range(2, 9)]
+    for day in plan:
+        assert list(day['meals']) == MEALS
+        assert all(len(ids) == 1 for ids in day['meals'].values())
+
+
+def test_foods_are_distinct_across_the_week():
+    plan = MealPlanner(FOODS).plan({}, seed=1)
+    for meal in MEALS:
+        picks = [day['meals'][meal][0] for day in plan]
+        assert len(set(picks)) == len(picks)
+
+
+def test_allergens_are_never_planned():
+    plans = MealPlanner(FOODS).plan_many([{'allergies': ['peanut']}] * 3, seed=2)
+    for plan in plans:
+        assert all(day['meals'][m] != ['peanut_bar'] for day in plan for m in MEALS)
+
+
+def test_no_safe_food_gives_none():
+    foods = [food('a', 100, 1, 1, 1, ['milk']), food('b', 200, 1, 1, 1, ['milk'])]
+    assert MealPlanner(foods).plan({'allergies': ['Milk']}) is None
+
+
+def test_few_safe_foods_are_reused():
+    foods = [food('a', 300, 10, 30, 10), food('b', 500, 20, 60, 15), food('c', 400, 5, 5, 5, ['egg'])]
+    plan = MealPlanner(foods).plan({'allergies': ['egg']}, seed=3)
+    assert len(plan) == 7
+    assert {day['meals'][m][0] for day in plan for m in MEALS} <= {'a', 'b'}
+
+
+def test_same_seed_same_plan():
+    planner = MealPlanner(FOODS)
+    start = datetime(2026, 1, 5)
+    assert planner.plan({}, start=start, seed=7) == planner.plan({}, start=start, seed=7)
+
+
+def test_scores_prefer_closest_food_and_mask_unsafe():
+    planner = MealPlanner(FOODS, variety=0)
+    targets = np.array([daily_targets({})])
+    masks = np.ones((1, len(FOODS)), dtype=bool)
+    masks[0, 0] = False
+    score = planner.scores(targets, masks)
+    assert score.shape == (1, len(MEALS), len(FOODS))
+    assert np.isinf(score[0, :, 0]).all()
+    assert np.isfinite(score[0, :, 1:]).all()
+
+
+def test_shared_allergen_index_is_reused_only_when_rows_match():
+    shared = AllergenIndex(FOODS)
+    assert MealPlanner(FOODS, allergens=shared).allergens is shared
+    assert MealPlanner(FOODS[:-1], allergens=shared).allergens is not shared
@@ -0,0 +1,130 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from bson.objectid import ObjectId
+
+from workout_store import WEEKS_KEPT, WorkoutStore, decode_cursor, encode_cursor, fold
+
+
+def workout(day, minutes=30, intensity=5, hour=9, user='u1'):
+    return {'user_id': user, 'timestamp': datetime.fromisoformat(day) + timedelta(hours=hour),
+            'duration': minutes * 60, 'intensity': intensity}
+
+
+def test_fold_sessions_and_streaks():
+    summary = None
+    for day in ('2026-03-02', '2026-03-02', '2026-03-03', '2026-03-04', '2026-03-07', '2026-03-08'):
+        summary = fold(summary, workout(day))
+    assert summary['sessions'] == 6
+    assert summary['minutes'] == 180
+    assert summary['active_days'] == 5
+    assert summary['streak_days'] == 2
+    assert summary['longest_streak'] == 3
+    assert summary['last_day'] == '2026-03-08'
+    assert summary['weeks'] == [{'week_start': '2026-03-02', 'sessions': 6, 'minutes': 180, 'intensity_sum': 30}]
+
+
+def test_fold_does_not_change_its_input():
+    summary = fold(None, workout('2026-03-02'))
+    before = {**summary, 'weeks': [dict(w) for w in summary['weeks']]}
+    fold(summary, workout('2026-03-03'))
+    assert summary == before
+
+
+def test_fold_keeps_the_newest_weeks():
+    summary = None
+    start = date(2026, 1, 5)
+    for k in range(WEEKS_KEPT + 3):
+        summary = fold(summary, workout((start + timedelta(weeks=k)).isoformat(), minutes=10))
+    weeks = [w['week_start'] for w in summary['weeks']]
+    assert len(weeks) == WEEKS_KEPT
+    assert weeks[0] == (start + timedelta(weeks=WEEKS_KEPT + 2)).isoformat()
+    assert weeks == sorted(weeks, reverse=True)
+
+
+def test_fold_ignores_bad_numbers():
+    summary = fold(None, {'timestamp': datetime(2026, 3, 2), 'duration': 'long', 'intensity': None})
+    assert summary['minutes'] == 0 and summary['intensity_sum'] == 0
+
+
+def test_cursor_round_trip_and_bad_cursors():
+    doc = {'_id': ObjectId(), 'timestamp': datetime(2026, 3, 2, 9, 30, 15, 123000)}
+    assert decode_cursor(encode_cursor(doc)) == (doc['timestamp'], doc['_id'])
+    for bad in ('', 'not-base64!', 'aGVsbG8=', encode_cursor(doc)[:-4]):
+        with pytest.raises(ValueError):
+            decode_cursor(bad)
+
+
+def test_history_pages_with_keyset_cursors(db):
+    store = WorkoutStore(db.workouts, db.workout_summaries)
+    stamp = datetime(2026, 3, 2, 9)
+    # Several sessions share a timestamp, so the cursor must tie-break on _id
+    docs = [dict(workout('2026-03-02'), timestamp=stamp + timedelta(minutes=k // 2)) for k in range(7)]
+    docs.append(workout('2026-03-02', user='u2'))
+    db.workouts.insert_many(docs)
+
+    seen, cursor = [], None
+    while True:
+        page, cursor = store.history('u1', limit=3, cursor=cursor)
+        seen.extend(page)
+        if cursor is None:
+            break
+    assert len(seen) == 7
+    assert len({w['_id'] for w in seen}) == 7
+    keys = [(w['timestamp'], w['_id']) for w in seen]
+    assert keys == sorted(keys, reverse=True)
+
+
+def test_history_exact_page_has_no_next_cursor(db):
+    store = WorkoutStore(db.workouts, db.workout_summaries)
+    db.workouts.insert_many([workout('2026-03-02', hour=h) for h in range(3)])
+    page, cursor = store.history('u1', limit=3)
+    assert len(page) == 3 and cursor is None
+    with pytest.raises(ValueError):
+        store.history('u1', cursor='garbage')
+
+
+def test_save_keeps_the_summary_in_step(db):
+    store = WorkoutStore(db.workouts, db.workout_summaries)
+    store.save('u1', 'strength', [{'name': 'Push-Up'}], 1800, intensity=6)
+    store.save('u1', 'cardio', [], 600, intensity=8)
+    doc = db.workout_summaries.find_one({'_id': 'u1'})
+    assert doc['version'] == 2
+    assert doc['sessions'] == 2 and doc['minutes'] == 40
+    summary = store.summary('u1')
+    assert summary['streak_days'] == 1
+    assert summary['week_sessions'] == 2
+    assert summary['avg_intensity'] == 7
+
+
+def test_summary_streak_expires(db):
+    store = WorkoutStore(db.workouts, db.workout_summaries)
+    db.workout_summaries.insert_one(dict(fold(fold(None, workout('2026-03-02')), workout('2026-03-03')), _id='u1'))
+    assert store.summary('u1', today=date(2026, 3, 3))['streak_days'] == 2
+    assert store.summary('u1', today=date(2026, 3, 4))['streak_days'] == 2
+    expired = store.summary('u1', today=date(2026, 3, 5))
+    assert expired['streak_days'] == 0 and expired['longest_streak'] == 2
+    assert store.summary('u1', today=date(2026, 3, 9))['week_sessions'] == 0
+
+
+def test_summary_for_a_new_user(db):
+    summary = WorkoutStore(db.workouts, db.workout_summaries).summary('nobody', today=date(2026, 3, 3))
+    assert summary['sessions'] == 0 and summary['streak_days'] == 0 and summary['avg_intensity'] == 0
+    assert summary['weeks'] == {'week_start': [], 'minutes': [], 'sessions': [], 'avg_intensity': []}
+
+
+def test_rebuild_matches_incremental_folds(db):
+    store = WorkoutStore(db.workouts, db.workout_summaries)
+    days = ['2026-02-27', '2026-03-01', '2026-03-02', '2026-03-02', '2026-03-03']
+    db.workouts.insert_many([workout(d, minutes=20 + n, user=u) for n, d in enumerate(days) for u in ('u1', 'u2')])
+    db.workouts.insert_one({'user_id': 'u1', 'timestamp': '2026-03-04'})
+    expected = None
+    for n, d in enumerate(days):
+        expected = fold(expected, workout(d, minutes=20 + n))
+
+    db.workout_summaries.insert_one({'_id': 'u1', 'sessions': 99, 'version': 4})
+    assert store.rebuild() == 2
+    doc = db.workout_summaries.find_one({'_id': 'u1'})
+    assert {k: doc[k] for k in expected} == expected
+    assert doc['version'] == 5
+    assert store.rebuild('u2') == 1
@@ -0,0 +1,176 @@
+# Reads and writes of user documents.
+#
+# Callers ask for a named view ("dashboard", "allergies", ...) instead of the
+# whole document, so Mongo only ships the fields that page needs. Lookups are
+# memoised on flask.g for the rest of the request: a second read of the same
+# user, in the same or a narrower view, costs nothing. An optional cross-request
+# cache (ttl seconds, per process) can sit behind that; update() and
+# invalidate() drop the user from both. With several workers another process
+# may serve its cached copy for up to ttl seconds after a change, so keep it short.
+
+import threading
+import time
+from collections import OrderedDict
+
+from bson.objectid import ObjectId
+from pymongo import ReturnDocument
+from flask import g, has_app_context
+
+# Never sent to page handlers; cycles is the legacy array moved by backfill-cycles
+EXCLUDED = {'password': 0, 'cycles': 0}
+
+VIEWS = {
+    'full': None,
+    'theme': ['dark_mode'],
+    'allergies': ['allergies'],
+    'weight': ['weight'],
+    'dashboard': ['full_name', 'target_calories', 'step_goal', 'activity_goal',
+                  'last_period_date', 'cycle_length', 'dark_mode'],
+    'diet_header': ['allergies', 'target_calories', 'daily_calorie_goal', 'dark_mode'],
+    'meal_targets': ['allergies', 'target_calories', 'daily_calorie_goal',
+                     'protein_goal', 'carb_goal', 'fat_goal'],
+    'cycle': ['last_period_date', 'cycle_length', 'dark_mode'],
+}
+
+
+# Yes/no profile flags that can be flipped or set through update_flags().
+# Older documents store some of them as 'yes'/'no' strings; any of
+# TRUE_VALUES counts as set and the result is always written back as a bool.
+BOOLEAN_FLAGS = [
+    'dark_mode', 'pcos', 'pregnant', 'bloated', 'facial_hair', 'chest_hair', 'obesity',
+    'mood_swings', 'stress', 'irregular_sleep', 'weight_gain', 'hair_growth',
+    'skin_darkening', 'hair_loss', 'pimples', 'fast_food', 'reg_exercise',
+]
+TRUE_VALUES = [True, 1, '1', 'true', 'True', 'yes', 'Yes', 'y', 'Y']
+FALSE_VALUES = [False, 0, '0', 'false', 'False', 'no', 'No', 'n', 'N', '']
+
+
+def parse_flag(flag, value):
+    # Client value -> bool; anything that is not clearly yes or no is rejected
+    if isinstance(value, (bool, int, str)):
+        if value in TRUE_VALUES:
+            return True
+        if value in FALSE_VALUES:
+            return False
+    raise ValueError(f"{flag} must be true or false")
+
+
+def projection(view):
+    fields = VIEWS[view]
+    return dict(EXCLUDED) if fields is None else {field: 1 for field in fields}
+
+
+def _covers(wide, narrow):
+    # Can a document fetched in view `wide` answer a lookup in view `narrow`?
+    if wide == narrow or VIEWS[wide] is None:
+        return True
+    return VIEWS[narrow] is not None and set(VIEWS[narrow]) <= set(VIEWS[wide])
+
+
+def _subset(doc, view):
+    if doc is None or VIEWS[view] is None:
+        return doc
+    return {k: v for k, v in doc.items() if k == '_id' or k in VIEWS[view]}
+
+
+class UserRepository:
+    def __init__(self, collection, ttl=0, max_items=10000):
+        self.collection = collection
+        self.ttl = ttl
+        self.max_items = max_items
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # (user_id, view) -> (doc, expires_at)
+        self.hits = 0
+        self.misses = 0
+
+    def _memo(self):
+        if not has_app_context():
+            return None
+        if 'user_docs' not in g:
+            g.user_docs = {}
+        return g.user_docs
+
+    def _cached(self, user_id, view):
+        if not self.ttl:
+            return False, None
+        now = time.monotonic()
+        with self._lock:
+            for key in ((user_id, view), (user_id, 'full')):
+                entry = self._items.get(key)
+                if entry is not None and entry[1] > now and _covers(key[1], view):
+                    self._items.move_to_end(key)
+                    return True, _subset(entry[0], view)
+        return False, None
+
+    def _remember(self, user_id, view, doc):
+        if not self.ttl:
+            return
+        with self._lock:
+            self._items[(user_id, view)] = (doc, time.monotonic() + self.ttl)
+            self._items.move_to_end((user_id, view))
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def get(self, user_id, view='full'):
+        # The user document in the given view, or None. Treat it as read-only:
+        # the same dict is returned to every caller within the request.
+        user_id = str(user_id)
+        memo = self._memo()
+        if memo is not None:
+            for (uid, wide), doc in memo.items():
+                if uid == user_id and _covers(wide, view):
+                    return _subset(doc, view)
+
+        found, doc = self._cached(user_id, view)
+        with self._lock:
+            if found:
+                self.hits += 1
+            else:
+                self.misses += 1
+        if not found:
+            doc = self.collection.find_one({'_id': ObjectId(user_id)}, projection(view))
+            self._remember(user_id, view, doc)
+        if memo is not None:
+            memo[(user_id, view)] = doc
+        return doc
+
+    def invalidate(self, user_id):
+        user_id = str(user_id)
+        memo = self._memo()
+        if memo is not None:
+            for key in [k for k in memo if k[0] == user_id]:
+                del memo[key]
+        with self._lock:
+            for key in [k for k in self._items if k[0] == user_id]:
+                del self._items[key]
+
+    def update(self, user_id, update):
+        result = self.collection.update_one({'_id': ObjectId(user_id)}, update)
+        self.invalidate(user_id)
+        return result
+
+    def update_flags(self, user_id, toggle=(), values=None):
+        # Flip the `toggle` flags and set the `values` ones in a single atomic
+        # findOneAndUpdate (a pipeline update, so the flip is computed by the
+        # server and concurrent toggles cannot lose each other's writes).
+        # Returns {flag: new value}, or None when the user does not exist.
+        values = values or {}
+        unknown = [f for f in list(toggle) + list(values) if f not in BOOLEAN_FLAGS]
+        if unknown:
+            raise ValueError(f"Not a preference flag: {', '.join(unknown)}")
+        changes = {flag: {'$not': [{'$in': [f'${flag}', TRUE_VALUES]}]} for flag in toggle}
+        changes.update({flag: {'$literal': parse_flag(flag, value)} for flag, value in values.items() if flag not in changes})
+        if not changes:
+            return {}
+        doc = self.collection.find_one_and_update(
+            {'_id': ObjectId(user_id)},
+            [{'$set': changes}],
+            projection={'_id': 0, **{flag: 1 for flag in changes}},
+            return_document=ReturnDocument.AFTER
+        )
+        self.invalidate(user_id)
+        return doc
+
+    def stats(self):
+        with self._lock:
+            return {'items': len(self._items), 'ttl': self.ttl, 'hits': self.hits, 'misses': self.misses}
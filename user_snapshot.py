@@ -0,0 +1,67 @@
+# "User week snapshot": a user's profile plus their activity, diet, journal and
+# cycle records for a date range, fetched in a single aggregation.
+#
+# The pipeline is anchored on the user document and pulls each log collection
+# in with a pipeline $lookup, so the whole snapshot costs one round trip. Field
+# projection and _id stringification happen on the server, and the result is
+# ready for json.dumps/jsonify as-is. Used by the weekly report; other views
+# that need the same data can ask for a subset of sections.
+
+from bson.objectid import ObjectId
+
+# Fields kept for each section (the user profile drops secrets and history arrays)
+SECTIONS = {
+    'activity_logs': ('activity', 'date', [
+        'date', 'calories_burnt', 'goal_calories', 'steps', 'goal_steps',
+        'hours', 'goal_hours', 'activities'
+    ]),
+    'diet_logs': ('diet', 'date', [
+        'date', 'calories_consumed', 'total_allowed', 'protein', 'carbs', 'fats', 'foods'
+    ]),
+    'journal_entries': ('journal', 'date', [
+        'date', 'mood', 'sleep_quality', 'behavioral_pattern', 'stress', 'symptoms', 'notes'
+    ]),
+    'cycle_details': ('cycles', None, [
+        'start_date', 'end_date', 'marked_ended'
+    ]),
+}
+USER_EXCLUDE = ['password', 'cycles']
+
+
+def _section_lookup(name, user_id, start, end):
+    collection, date_field, fields = SECTIONS[name]
+    if date_field:
+        match = {'user_id': user_id, date_field: {'$gte': start, '$lte': end}}
+    else:
+        # Cycles overlap the range if they start or end inside it
+        match = {'user_id': user_id, '$or': [
+            {'start_date': {'$gte': start, '$lte': end}},
+            {'end_date': {'$gte': start, '$lte': end}}
+        ]}
+    project = {'_id': {'$toString': '$_id'}}
+    project.update({field: 1 for field in fields})
+    pipeline = [{'$match': match}, {'$project': project}]
+    if date_field:
+        pipeline.insert(1, {'$sort': {date_field: 1}})
+    return {'$lookup': {'from': collection, 'pipeline': pipeline, 'as': name}}
+
+
+def user_week_snapshot(db, user_id, start, end, sections=None):
+    # start/end are 'YYYY-MM-DD' strings (inclusive). Returns
+    # {'user_profile': {...}, 'activity_logs': [...], ...} for the requested sections.
+    user_id = str(user_id)
+    sections = list(sections or SECTIONS)
+    pipeline = [
+        {'$match': {'_id': ObjectId(user_id)}},
+        {'$replaceRoot': {'newRoot': {'user_profile': '$$ROOT'}}},
+        {'$project': {'user_profile.' + field: 0 for field in USER_EXCLUDE}},
+        {'$addFields': {'user_profile._id': {'$toString': '$user_profile._id'}}},
+    ]
+    pipeline += [_section_lookup(name, user_id, start, end) for name in sections]
+
+    result = next(db.users.aggregate(pipeline), None)
+    if result is None:
+        # No profile document: keep the same shape so callers need no special case
+        result = {'user_profile': {}}
+        result.update({name: [] for name in sections})
+    return result
@@ -0,0 +1,181 @@
+# Saved workouts and per-user workout summaries.
+#
+# Each session from /save_workout is one document in `workouts`, indexed on
+# (user_id, timestamp, _id) (see db_indexes), and is listed newest first with
+# keyset cursors, so a page costs the same however long the history is.
+#
+# Every save also folds the session into the user's document in
+# `workout_summaries` (_id = user_id):
+#   sessions, minutes, intensity_sum, active_days, last_day, streak_days,
+#   longest_streak, weeks: [{week_start, sessions, minutes, intensity_sum}]
+# (newest first, WEEKS_KEPT of them). Summaries are rewritten whole with a
+# version guard and retried on a lost race, so dashboards and reports read one
+# small document instead of scanning sessions. rebuild() refolds them from the
+# raw workouts.
+
+import base64
+from datetime import datetime, timedelta
+
+from bson.errors import InvalidId
+from bson.objectid import ObjectId
+from pymongo.errors import DuplicateKeyError
+
+WEEKS_KEPT = 12
+MAX_ATTEMPTS = 5
+
+
+def _number(value):
+    try:
+        return float(value or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def encode_cursor(workout):
+    raw = f"{workout['timestamp'].isoformat()}|{workout['_id']}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor):
+    try:
+        stamp, oid = base64.urlsafe_b64decode(cursor.encode()).decode().split('|')
+        return datetime.fromisoformat(stamp), ObjectId(oid)
+    except (ValueError, InvalidId, UnicodeDecodeError):
+        raise ValueError("invalid cursor")
+
+
+def fold(summary, workout):
+    # Add one workout to a summary (a new dict; the input is not changed)
+    summary = dict(summary or {})
+    day = workout['timestamp'].date()
+    minutes = round(_number(workout.get('duration')) / 60, 1)
+    intensity = _number(workout.get('intensity'))
+
+    summary['sessions'] = summary.get('sessions', 0) + 1
+    summary['minutes'] = round(summary.get('minutes', 0) + minutes, 1)
+    summary['intensity_sum'] = summary.get('intensity_sum', 0) + intensity
+
+    last = summary.get('last_day')
+    last = datetime.strptime(last, '%Y-%m-%d').date() if last else None
+    if last is None or day > last:
+        summary['active_days'] = summary.get('active_days', 0) + 1
+        summary['streak_days'] = summary.get('streak_days', 0) + 1 if last and (day - last).days == 1 else 1
+        summary['longest_streak'] = max(summary.get('longest_streak', 0), summary['streak_days'])
+        summary['last_day'] = day.isoformat()
+
+    week = (day - timedelta(days=day.weekday())).isoformat()
+    weeks = [dict(w) for w in summary.get('weeks', [])]
+    current = next((w for w in weeks if w['week_start'] == week), None)
+    if current is None:
+        current = {'week_start': week, 'sessions': 0, 'minutes': 0, 'intensity_sum': 0}
+        weeks.append(current)
+    current['sessions'] += 1
+    current['minutes'] = round(current['minutes'] + minutes, 1)
+    current['intensity_sum'] += intensity
+    summary['weeks'] = sorted(weeks, key=lambda w: w['week_start'], reverse=True)[:WEEKS_KEPT]
+    return summary
+
+
+class WorkoutStore:
+    def __init__(self, workouts, summaries):
+        self.workouts = workouts
+        self.summaries = summaries
+
+    def save(self, user_id, workout_type, exercises, duration, rest_period=0, intensity=0):
+        workout = {
+            'user_id': str(user_id),
+            'workout_type': workout_type,
+            'exercises': exercises,
+            'duration': duration,
+            'rest_period': rest_period,
+            'intensity': intensity,
+            'timestamp': datetime.utcnow()
+        }
+        self.workouts.insert_one(workout)
+        self._add_to_summary(str(user_id), workout)
+        return workout
+
+    def _add_to_summary(self, user_id, workout):
+        for _ in range(MAX_ATTEMPTS):
+            current = self.summaries.find_one({'_id': user_id})
+            summary = fold(current, workout)
+            summary['updated_at'] = datetime.utcnow()
+            if current is None:
+                summary.update({'_id': user_id, 'version': 1})
+                try:
+                    self.summaries.insert_one(summary)
+                    return
+                except DuplicateKeyError:
+                    continue        # created by a concurrent save: fold into that one
+            summary['version'] = current.get('version', 0) + 1
+            if self.summaries.replace_one({'_id': user_id, 'version': current.get('version')},
+                                          summary).modified_count == 1:
+                return
+        # Persistent contention: rebuild() brings the summary back in line
+        print(f"Workout summary for {user_id} not updated after {MAX_ATTEMPTS} attempts")
+
+    def history(self, user_id, limit=20, cursor=None):
+        # One page of workouts, newest first; returns (workouts, next cursor or None)
+        query = {'user_id': str(user_id)}
+        if cursor:
+            stamp, oid = decode_cursor(cursor)
+            query['$or'] = [{'timestamp': {'$lt': stamp}}, {'timestamp': stamp, '_id': {'$lt': oid}}]
+        page = list(self.workouts.find(query).sort([('timestamp', -1), ('_id', -1)]).limit(limit + 1))
+        next_cursor = encode_cursor(page[limit - 1]) if len(page) > limit else None
+        return page[:limit], next_cursor
+
+    def summary(self, user_id, today=None):
+        # JSON-ready view of the stored summary; the streak only counts if it
+        # reaches today or yesterday
+        doc = self.summaries.find_one({'_id': str(user_id)}) or {}
+        today = today or datetime.utcnow().date()
+        last = doc.get('last_day')
+        streak = doc.get('streak_days', 0)
+        if not last or (today - datetime.strptime(last, '%Y-%m-%d').date()).days > 1:
+            streak = 0
+        this_week = (today - timedelta(days=today.weekday())).isoformat()
+        weeks = doc.get('weeks', [])
+        current = next((w for w in weeks if w['week_start'] == this_week), None) or {}
+        return {
+            'sessions': doc.get('sessions', 0),
+            'minutes': doc.get('minutes', 0),
+            'avg_intensity': round(doc['intensity_sum'] / doc['sessions'], 1) if doc.get('sessions') else 0,
+            'active_days': doc.get('active_days', 0),
+            'last_day': last,
+            'streak_days': streak,
+            'longest_streak': doc.get('longest_streak', 0),
+            'week_minutes': current.get('minutes', 0),
+            'week_sessions': current.get('sessions', 0),
+            'weeks': {
+                'week_start': [w['week_start'] for w in weeks],
+                'minutes': [w['minutes'] for w in weeks],
+                'sessions': [w['sessions'] for w in weeks],
+                'avg_intensity': [round(w['intensity_sum'] / w['sessions'], 1) if w['sessions'] else 0
+                                  for w in weeks],
+            },
+        }
+
+    def rebuild(self, user_id=None):
+        # Refold summaries from the raw workouts (backfill or repair); returns users
+        # rebuilt. The sort walks the user_time index backwards.
+        query = {} if user_id is None else {'user_id': str(user_id)}
+        rebuilt = 0
+        current_user, summary = None, None
+        for workout in self.workouts.find(query).sort([('user_id', -1), ('timestamp', 1), ('_id', 1)]):
+            if not isinstance(workout.get('timestamp'), datetime):
+                continue
+            if workout['user_id'] != current_user:
+                if current_user is not None:
+                    self._replace(current_user, summary)
+                    rebuilt += 1
+                current_user, summary = workout['user_id'], None
+            summary = fold(summary, workout)
+        if current_user is not None:
+            self._replace(current_user, summary)
+            rebuilt += 1
+        return rebuilt
+
+    def _replace(self, user_id, summary):
+        current = self.summaries.find_one({'_id': user_id}, {'version': 1}) or {}
+        summary.update({'version': current.get('version', 0) + 1, 'updated_at': datetime.utcnow()})
+        self.summaries.replace_one({'_id': user_id}, summary, upsert=True)